@@ -0,0 +1,59 @@
+"""
+Motor compartido para la asignación de los Fondos Federales de Seguridad Pública
+(FASP, FOFISP y FORTAMUN).
+
+Las apps de Streamlit agregan la raíz del repositorio a `sys.path` para poder importar
+este paquete sin instalarlo.
+
+Las funciones de abajo se importan de su submódulo con el primer acceso: `import
+asignacion.arranque` no carga numpy ni pandas, y polars (asignacion.municipal) sólo lo
+cargan las apps de FORTAMUN.
+"""
+
+import importlib
+
+
+_EXPORTS = {
+    'segmentos': ('segment_starts',),
+    'centavos': (
+        'to_centavos',
+        'to_pesos',
+        'largest_remainder',
+        'allocate_centavos',
+        'band_bounds',
+        'rebalance_centavos',
+        'BandasInfactibles',
+        'band_feasibility',
+        'check_bands',
+    ),
+    'indice': (
+        'FASP_VARIABLES',
+        'FOFISP_VARIABLES',
+        'direct_proportion_normalize',
+        'shifted_proportion_normalize',
+        'calculate_index',
+        'index_allocation',
+        'rebalance',
+        'allocation_engine',
+    ),
+    'municipal': (
+        'segmented_normalize',
+        'segmented_allocation',
+        'hierarchical_allocation',
+    ),
+}
+_MODULOS = {name: modulo for modulo, names in _EXPORTS.items() for name in names}
+__all__ = list(_MODULOS)
+
+
+def __getattr__(name):
+    modulo = _MODULOS.get(name)
+    if modulo is None:
+        raise AttributeError(f"module 'asignacion' has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'asignacion.{modulo}'), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
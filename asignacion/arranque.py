@@ -0,0 +1,150 @@
+"""
+Arranque rápido de las apps de Streamlit: imports diferidos y archivos estáticos en caché.
+
+Streamlit vuelve a ejecutar el script completo en cada rerun. Un `import` de un módulo ya
+cargado es barato, pero el primer arranque del proceso pagaba polars, plotly express y
+great_tables aunque la sesión nunca abriera la pestaña que los usa; y cada rerun volvía a
+leer `.env`, a abrir el logo y a leer el catálogo de indicadores. Aquí:
+
+- `lazy_import('plotly.express')` regresa el módulo diferido: se importa la primera vez que
+  se usa uno de sus atributos. `lazy_import('great_tables', 'GT', 'md')` regresa los
+  atributos diferidos, que se importan al llamarlos;
+- `load_env`, `cached_logo` y `cached_catalog` leen su archivo una vez por proceso (y de
+  nuevo sólo si cambia su fecha de modificación);
+- `import_times` guarda cuánto tardó cada import diferido; si la medición está activa, el
+  import aparece además como etapa del rerun que lo pagó (ver `asignacion.medicion`).
+"""
+
+import importlib
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+from asignacion.medicion import record
+
+
+_tiempos = {}
+_archivos = {}
+_lock = threading.Lock()
+
+
+def _importar(nombre: str):
+    # siempre por `import_module`: si otra sesión (otro hilo) está a medio importar el
+    # módulo, `sys.modules` ya lo tiene pero incompleto, e `import_module` espera a que termine
+    nuevo = nombre not in sys.modules
+    start = time.perf_counter()
+    module = importlib.import_module(nombre)
+    if nuevo:
+        ms = (time.perf_counter() - start) * 1000
+        _tiempos.setdefault(nombre, ms)
+        record(f'import {nombre}', ms)
+    return module
+
+
+class _Modulo:
+    """Módulo que se importa con el primer acceso a uno de sus atributos."""
+
+    def __init__(self, nombre: str):
+        self.__dict__['_nombre'] = nombre
+
+    def __getattr__(self, attr):
+        return getattr(_importar(self._nombre), attr)
+
+    def __repr__(self):
+        return f'<módulo diferido {self._nombre!r}>'
+
+
+class _Atributo:
+    """Atributo de un módulo diferido (una clase o función) que se importa al usarlo."""
+
+    def __init__(self, nombre: str, attr: str):
+        self._nombre = nombre
+        self._attr = attr
+
+    def _resolver(self):
+        return getattr(_importar(self._nombre), self._attr)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolver()(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        return getattr(self._resolver(), attr)
+
+    def __repr__(self):
+        return f'<{self._nombre}.{self._attr} diferido>'
+
+
+def lazy_import(nombre: str, *atributos: str):
+    """
+    Import diferido: el módulo `nombre`, o sus `atributos` (como `from nombre import ...`)
+    si se dan. Si el módulo ya estaba cargado, regresa los objetos reales.
+    """
+    module = _importar(nombre) if nombre in sys.modules else None
+    if not atributos:
+        return module if module is not None else _Modulo(nombre)
+    if module is not None:
+        values = tuple(getattr(module, attr) for attr in atributos)
+    else:
+        values = tuple(_Atributo(nombre, attr) for attr in atributos)
+    return values[0] if len(values) == 1 else values
+
+
+def import_times() -> dict:
+    """Milisegundos que tardó cada import diferido en este proceso."""
+    return dict(_tiempos)
+
+
+def _por_archivo(path, cargar):
+    # valor de `cargar(path)`, leído una vez por proceso y de nuevo si cambió el archivo
+    path = Path(path).resolve()
+    mtime = path.stat().st_mtime_ns
+    guardado = _archivos.get((path, cargar))
+    if guardado is not None and guardado[0] == mtime:
+        return guardado[1]
+    value = cargar(path)
+    with _lock:
+        _archivos[(path, cargar)] = (mtime, value)
+    return value
+
+
+def _cargar_env(path):
+    from dotenv import load_dotenv
+    return load_dotenv(path)
+
+
+def load_env(path='.env') -> bool:
+    """`load_dotenv(path)` una vez por proceso (las variables ya definidas no se pisan)."""
+    if not os.path.exists(path):
+        return False
+    return _por_archivo(path, _cargar_env)
+
+
+def _cargar_logo(path):
+    from PIL import Image
+    with Image.open(path) as image:
+        image.load()
+        return image.copy()
+
+
+def cached_logo(path):
+    """Imagen de PIL (p. ej. el `page_icon`), leída una vez por proceso."""
+    return _por_archivo(path, _cargar_logo)
+
+
+def _cargar_catalogo(path):
+    import pandas as pd
+    return pd.read_csv(path)
+
+
+def cached_catalog(path):
+    """
+    Catálogo en CSV (p. ej. los indicadores de un fondo), leído una vez por proceso.
+
+    Regresa una copia superficial: con copy-on-write no copia los datos y lo que la sesión
+    modifique no llega al catálogo compartido.
+    """
+    return _por_archivo(path, _cargar_catalogo).copy(deep=False)
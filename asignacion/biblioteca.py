@@ -0,0 +1,302 @@
+"""
+Biblioteca de escenarios: guarda, indexa y compara corridas de la asignación.
+
+Cada escenario guardado conserva sus parámetros (ponderadores, bandas y presupuesto), el
+hash del archivo de datos con el que se calculó y sus resultados compactos: la asignación
+bruta, la ajustada y el monto de referencia de cada Entidad Federativa, en centavos, como
+columnas int64. Los escenarios se buscan por etiqueta, fondo, archivo de datos y fecha.
+
+Comparar N escenarios no vuelve a correr el motor: se leen sus columnas, se alinean por
+Entidad Federativa en una matriz N x n y las diferencias y los cambios de lugar se
+calculan sobre la matriz completa.
+
+La biblioteca guarda también los archivos de datos subidos, por su hash, para que un
+escenario (o un enlace, ver `asignacion.enlaces`) pueda abrirse sin volver a subirlos. Los
+archivos de un escenario guardado se conservan mientras exista el escenario; los demás (los
+de enlaces o de cargas que nadie guardó) ocupan a lo más `max_bytes` y se descartan los
+de uso más antiguo, como en el caché en disco (ver `asignacion.disco`).
+
+La biblioteca es un archivo SQLite (`ASIGNACION_ESCENARIOS`, por omisión
+`~/.local/share/asignacion/escenarios.sqlite`) que pueden usar varias sesiones a la vez.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from asignacion.centavos import to_pesos
+from asignacion.grafo import content_key
+
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS escenarios ('
+    ' id INTEGER PRIMARY KEY, nombre TEXT NOT NULL, fondo TEXT NOT NULL, fecha REAL NOT NULL,'
+    ' datos TEXT NOT NULL, parametros TEXT NOT NULL, entidades TEXT NOT NULL,'
+    ' previo BLOB NOT NULL, bruta BLOB NOT NULL, ajustada BLOB NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS escenarios_fondo_fecha ON escenarios (fondo, fecha)',
+    'CREATE INDEX IF NOT EXISTS escenarios_datos ON escenarios (datos)',
+    'CREATE TABLE IF NOT EXISTS etiquetas ('
+    ' etiqueta TEXT NOT NULL, escenario INTEGER NOT NULL REFERENCES escenarios (id) ON DELETE CASCADE,'
+    ' PRIMARY KEY (etiqueta, escenario)) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS etiquetas_escenario ON etiquetas (escenario)',
+    'CREATE TABLE IF NOT EXISTS archivos ('
+    ' llave TEXT PRIMARY KEY, nombre TEXT NOT NULL, fecha REAL NOT NULL, contenido BLOB NOT NULL)',
+)
+
+
+def _column(values) -> bytes:
+    return np.ascontiguousarray(values, dtype='<i8').tobytes()
+
+
+def _timestamp(value) -> float:
+    return pd.Timestamp(value).timestamp() if not isinstance(value, (int, float)) else float(value)
+
+
+class Biblioteca:
+    """Escenarios guardados en un archivo SQLite."""
+
+    def __init__(self, path=None, max_bytes: int = 256 * 2**20):
+        self.path = Path(path or os.environ.get('ASIGNACION_ESCENARIOS')
+                         or Path.home() / '.local' / 'share' / 'asignacion' / 'escenarios.sqlite')
+        # tope de los archivos de datos que ningún escenario usa
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        # una conexión por hilo (cada sesión de Streamlit corre en su hilo)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            self._local.conn = conn
+        return conn
+
+    def save_data(self, contenido: bytes, nombre: str = '') -> str:
+        """
+        Guarda un archivo de datos (si no estaba) y regresa su hash. Si los archivos que
+        ningún escenario usa pasan de `max_bytes`, se descartan los de uso más antiguo.
+        """
+        llave = content_key(contenido)
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # `fecha` es el último uso: volver a subir el archivo lo renueva
+            conn.execute('INSERT INTO archivos VALUES (?, ?, ?, ?) ON CONFLICT (llave) DO UPDATE SET fecha = excluded.fecha',
+                         (llave, nombre, time.time(), contenido))
+            sueltos = conn.execute(
+                'SELECT llave, length(contenido) FROM archivos'
+                ' WHERE llave NOT IN (SELECT datos FROM escenarios) ORDER BY fecha'
+            ).fetchall()
+            total = sum(nbytes for _, nbytes in sueltos)
+            for suelto, nbytes in sueltos:
+                if total <= self.max_bytes:
+                    break
+                if suelto != llave:
+                    conn.execute('DELETE FROM archivos WHERE llave = ?', (suelto,))
+                    total -= nbytes
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return llave
+
+    def load_data(self, llave: str) -> bytes | None:
+        conn = self._conn()
+        row = conn.execute('SELECT contenido FROM archivos WHERE llave = ?', (llave,)).fetchone()
+        if row is None:
+            return None
+        # abrir un enlace también cuenta como uso
+        conn.execute('UPDATE archivos SET fecha = ? WHERE llave = ?', (time.time(), llave))
+        return row[0]
+
+    def save(self, nombre: str, fondo: str, datos: str, entidades, weights: dict, presupuesto: float,
+             lower_limit: float, upper_limit: float, previo, bruta, ajustada, etiquetas=()) -> int:
+        """
+        Guarda un escenario y regresa su id. `datos` es el hash del archivo de entrada;
+        `previo`, `bruta` y `ajustada` son montos por Entidad Federativa en centavos.
+        """
+        entidades = [str(e) for e in entidades]
+        columns = [np.asarray(c) for c in (previo, bruta, ajustada)]
+        if any(c.shape != (len(entidades),) for c in columns):
+            raise ValueError('Los resultados deben tener un monto por Entidad Federativa')
+        parametros = json.dumps({
+            'weights': {k: float(v) for k, v in weights.items()},
+            'presupuesto': float(presupuesto),
+            'lower_limit': float(lower_limit),
+            'upper_limit': float(upper_limit),
+        })
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            scenario_id = conn.execute(
+                'INSERT INTO escenarios (nombre, fondo, fecha, datos, parametros, entidades, previo, bruta, ajustada)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (nombre, fondo, time.time(), datos, parametros, json.dumps(entidades, ensure_ascii=False),
+                 *(_column(c) for c in columns)),
+            ).lastrowid
+            conn.executemany('INSERT OR IGNORE INTO etiquetas VALUES (?, ?)',
+                             [(t.strip(), scenario_id) for t in etiquetas if t.strip()])
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return scenario_id
+
+    def tag(self, scenario_id: int, etiquetas):
+        self._conn().executemany('INSERT OR IGNORE INTO etiquetas VALUES (?, ?)',
+                                 [(t.strip(), scenario_id) for t in etiquetas if t.strip()])
+
+    def delete(self, scenario_id: int):
+        self._conn().execute('DELETE FROM escenarios WHERE id = ?', (scenario_id,))
+
+    def tags(self, fondo: str | None = None) -> list[str]:
+        """Etiquetas en uso (de un fondo, si se da)."""
+        query = 'SELECT DISTINCT etiqueta FROM etiquetas'
+        args = ()
+        if fondo is not None:
+            query += ' JOIN escenarios ON escenarios.id = etiquetas.escenario WHERE fondo = ?'
+            args = (fondo,)
+        return [row[0] for row in self._conn().execute(query + ' ORDER BY etiqueta', args)]
+
+    def search(self, fondo: str | None = None, etiquetas=(), desde=None, hasta=None, datos: str | None = None,
+               limit: int = 1_000) -> pd.DataFrame:
+        """
+        Escenarios (sin resultados) que cumplen todos los filtros, del más reciente al más
+        antiguo. Con varias `etiquetas`, el escenario debe tener todas.
+        """
+        where, args = [], []
+        if fondo is not None:
+            where.append('fondo = ?')
+            args.append(fondo)
+        if datos is not None:
+            where.append('datos = ?')
+            args.append(datos)
+        if desde is not None:
+            where.append('fecha >= ?')
+            args.append(_timestamp(desde))
+        if hasta is not None:
+            where.append('fecha < ?')
+            args.append(_timestamp(hasta))
+        for etiqueta in etiquetas:
+            where.append('id IN (SELECT escenario FROM etiquetas WHERE etiqueta = ?)')
+            args.append(etiqueta)
+        query = (
+            'SELECT id, nombre, fondo, fecha, datos, parametros,'
+            ' (SELECT group_concat(etiqueta, \', \') FROM etiquetas WHERE escenario = id)'
+            ' FROM escenarios' + (' WHERE ' + ' AND '.join(where) if where else '')
+            + ' ORDER BY fecha DESC LIMIT ?'
+        )
+        rows = self._conn().execute(query, (*args, limit)).fetchall()
+        parametros = [json.loads(r[5]) for r in rows]
+        return pd.DataFrame({
+            'id': [r[0] for r in rows],
+            'Nombre': [r[1] for r in rows],
+            'Fondo': [r[2] for r in rows],
+            'Fecha': pd.to_datetime([r[3] for r in rows], unit='s'),
+            'Etiquetas': [r[6] or '' for r in rows],
+            'Presupuesto': [p['presupuesto'] for p in parametros],
+            'Banda_inferior': [p['lower_limit'] for p in parametros],
+            'Banda_superior': [p['upper_limit'] for p in parametros],
+            'Datos': [r[4][:12] for r in rows],
+        })
+
+    def load(self, ids) -> dict:
+        """
+        Parámetros y resultados de los escenarios `ids`, en ese orden: `escenarios` (lista de
+        dicts), `entidades` y las matrices `previo`, `bruta` y `ajustada` (N x n, centavos)
+        alineadas con las Entidades Federativas del primero.
+        """
+        ids = [int(i) for i in ids]
+        if not ids:
+            raise ValueError('No se eligió ningún escenario')
+        rows = {
+            r[0]: r for r in self._conn().execute(
+                'SELECT id, nombre, fondo, fecha, datos, parametros, entidades, previo, bruta, ajustada'
+                f' FROM escenarios WHERE id IN ({",".join("?" * len(ids))})', ids,
+            )
+        }
+        missing = [i for i in ids if i not in rows]
+        if missing:
+            raise KeyError(f'Escenarios inexistentes: {missing}')
+
+        entidades = json.loads(rows[ids[0]][6])
+        position = {e: i for i, e in enumerate(entidades)}
+        matrices = {name: np.empty((len(ids), len(entidades)), dtype=np.int64) for name in ('previo', 'bruta', 'ajustada')}
+        escenarios = []
+        for k, scenario_id in enumerate(ids):
+            row = rows[scenario_id]
+            own = json.loads(row[6])
+            if len(own) != len(entidades) or set(own) != position.keys():
+                raise ValueError(f'El escenario {scenario_id} tiene otras Entidades Federativas que el {ids[0]}')
+            order = np.array([position[e] for e in own])
+            for name, blob in zip(('previo', 'bruta', 'ajustada'), row[7:10]):
+                matrices[name][k, order] = np.frombuffer(blob, dtype='<i8')
+            escenarios.append({'id': scenario_id, 'nombre': row[1], 'fondo': row[2],
+                               'fecha': datetime.fromtimestamp(row[3]), 'datos': row[4], **json.loads(row[5])})
+        return {'escenarios': escenarios, 'entidades': entidades, **matrices}
+
+    def compare(self, ids, base: int | None = None) -> dict[str, pd.DataFrame]:
+        """
+        Comparación de los escenarios `ids` contra `base` (por omisión el primero).
+
+        Regresa DataFrames con una columna por escenario y una fila por Entidad Federativa:
+        `montos` (asignación ajustada, pesos), `diferencias` (pesos) y `diferencias_pct`
+        contra la base, `lugar` (1 = mayor asignación) y `cambio_lugar` (positivo = sube
+        respecto a la base); más `resumen`, una fila por escenario.
+        """
+        ids = [int(i) for i in ids]
+        base = ids[0] if base is None else int(base)
+        if base not in ids:
+            ids = [base] + ids
+        data = self.load(ids)
+        ajustada = data['ajustada']
+        b = ids.index(base)
+
+        diferencias = ajustada - ajustada[b]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            diferencias_pct = diferencias / ajustada[b]
+        # lugar de cada Entidad Federativa en cada escenario, sin ciclos por escenario
+        order = np.argsort(-ajustada, axis=1, kind='stable')
+        lugar = np.empty_like(order)
+        np.put_along_axis(lugar, order, np.arange(1, ajustada.shape[1] + 1)[None, :], axis=1)
+        cambio = lugar[b] - lugar
+
+        columns = [f"{e['id']} · {e['nombre']}" for e in data['escenarios']]
+        index = pd.Index(data['entidades'], name='Entidad_Federativa')
+
+        def frame(matrix):
+            return pd.DataFrame(matrix.T, index=index, columns=columns)
+
+        resumen = pd.DataFrame({
+            'Escenario': columns,
+            'Total': to_pesos(ajustada.sum(axis=1)),
+            'Diferencia_absoluta_total': to_pesos(np.abs(diferencias).sum(axis=1)),
+            'Diferencia_maxima': to_pesos(np.abs(diferencias).max(axis=1)),
+            'Entidades_que_cambian_de_lugar': (cambio != 0).sum(axis=1),
+            'Presupuesto': [e['presupuesto'] for e in data['escenarios']],
+            'Banda_inferior': [e['lower_limit'] for e in data['escenarios']],
+            'Banda_superior': [e['upper_limit'] for e in data['escenarios']],
+        })
+        return {
+            'montos': frame(to_pesos(ajustada)),
+            'diferencias': frame(to_pesos(diferencias)),
+            'diferencias_pct': frame(diferencias_pct),
+            'lugar': frame(lugar),
+            'cambio_lugar': frame(cambio),
+            'resumen': resumen,
+        }
+
+
+# una sola instancia por proceso (el archivo se abre con la primera consulta)
+biblioteca = Biblioteca()
@@ -0,0 +1,449 @@
+"""
+Prueba de carga de `fondos_app`: N sesiones concurrentes contra un solo proceso de Streamlit.
+
+`asignacion.latencia` mide una sesión aislada; aquí se levanta `streamlit run Fondos.py`
+(sin navegador, en un puerto local) y cada sesión simulada es un cliente del websocket de
+Streamlit que hace lo mismo que un analista: escribe el password, abre la página de FASP y
+la de FOFISP, sube su archivo (generado con semilla propia, así que ninguna sesión reutiliza
+el resultado de otra), abre la pestaña de asignación y cambia ponderadores, bandas y el
+fondo varias veces, con una pausa entre interacciones.
+
+Para cada nivel de concurrencia se reinicia el servidor y se reporta:
+
+- throughput (interacciones completadas por segundo) y latencia p50/p95/p99/máxima de
+  cada interacción (desde que se pide el rerun hasta que el script termina);
+- CPU del proceso del servidor y sus hijos (porcentaje de un núcleo) y memoria residente
+  (pico, y pico por sesión sobre el servidor en reposo), leídos de `/proc` (Linux);
+- errores (excepciones del script o interacciones que no terminaron a tiempo).
+
+El reporte de capacidad indica, para un p95 objetivo, cuántas sesiones aguanta un proceso
+y cuánta memoria pide, para dimensionar workers:
+
+    python -m asignacion.carga --sesiones 1 2 4 8 16 --salida carga.json
+    python -m asignacion.carga --sesiones 4 --interacciones 20 --pausa 0 --objetivo-p95 1500
+
+Todo corre en local y sin red: el servidor escucha en 127.0.0.1, con la protección XSRF
+apagada para poder subir archivos sin cookie, y con caché en disco y biblioteca de
+escenarios temporales.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from asignacion.latencia import RAIZ, PASSWORD, fasp_fixture, fofisp_fixture
+
+
+# páginas de fondos_app que recorre cada sesión: archivo, pestaña de asignación y cambios
+# (key del number_input, desplazamiento total), igual que en asignacion.latencia
+PAGINAS = {
+    'FASP': {
+        'archivo': ('fasp.csv', fasp_fixture, 'text/csv'),
+        'pestaña': ('tabs_fasp', '2.Asignación'),
+        'cambios': [('Población (Alto=Bueno)', 0.05), ('Limite superior', 0.1), ('Presupuesto estimado', 5e8)],
+    },
+    'FOFISP': {
+        'archivo': ('fofisp.csv', fofisp_fixture, 'text/csv'),
+        'pestaña': ('tabs_fofisp', '2.Asignación'),
+        'cambios': [('Población', -0.1), ('Limite superior', 0.1), ('Presupuesto estimado', 5e7)],
+    },
+}
+
+_RERUN_PEDIDO = 2     # ForwardMsg.ScriptFinishedStatus.FINISHED_EARLY_FOR_RERUN
+
+
+# --- servidor y uso de recursos ---
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _arbol(pid: int) -> list[int]:
+    # pid y todos sus descendientes (p. ej. el pool de procesos de las simulaciones)
+    pids, pendientes = [], [pid]
+    while pendientes:
+        actual = pendientes.pop()
+        pids.append(actual)
+        for tarea in Path(f'/proc/{actual}/task').glob('*'):
+            try:
+                pendientes.extend(int(p) for p in (tarea / 'children').read_text().split())
+            except OSError:
+                pass
+    return pids
+
+
+def process_usage(pid: int) -> tuple[float, float] | None:
+    """(segundos de CPU, MB residentes) del proceso `pid` y sus hijos; None fuera de Linux."""
+    if not Path(f'/proc/{pid}').exists():
+        return None
+    tick = os.sysconf('SC_CLK_TCK')
+    cpu = rss = 0.0
+    for p in _arbol(pid):
+        try:
+            campos = Path(f'/proc/{p}/stat').read_text().rsplit(')', 1)[1].split()
+            cpu += (int(campos[11]) + int(campos[12])) / tick
+            for linea in Path(f'/proc/{p}/status').read_text().splitlines():
+                if linea.startswith('VmRSS:'):
+                    rss += int(linea.split()[1]) / 1024
+        except (OSError, IndexError, ValueError):
+            pass
+    return cpu, rss
+
+
+class Servidor:
+    """`streamlit run fondos_app/Fondos.py` en un puerto local, mientras dure el `with`."""
+
+    def __init__(self, temporal: Path, timeout: float = 60):
+        self.puerto = _puerto_libre()
+        self.timeout = timeout
+        self.env = dict(
+            os.environ, FONDOS_PASSWORD=PASSWORD,
+            ASIGNACION_CACHE=str(temporal / f'resultados_{self.puerto}.sqlite'),
+            ASIGNACION_ESCENARIOS=str(temporal / f'escenarios_{self.puerto}.sqlite'),
+            ASIGNACION_INGESTA=str(temporal / f'ingesta_{self.puerto}'),
+        )
+
+    def __enter__(self):
+        import requests
+        self.proceso = subprocess.Popen(
+            [sys.executable, '-m', 'streamlit', 'run', 'Fondos.py',
+             '--server.headless', 'true', '--server.address', '127.0.0.1',
+             '--server.port', str(self.puerto), '--server.enableXsrfProtection', 'false',
+             '--server.fileWatcherType', 'none', '--browser.gatherUsageStats', 'false'],
+            cwd=RAIZ / 'fondos_app', env=self.env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        limite = time.monotonic() + self.timeout
+        while time.monotonic() < limite:
+            try:
+                if requests.get(f'{self.http}/_stcore/health', timeout=1).ok:
+                    return self
+            except requests.RequestException:
+                time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError('el servidor de Streamlit no arrancó a tiempo')
+
+    def __exit__(self, *exc):
+        self.proceso.terminate()
+        try:
+            self.proceso.wait(10)
+        except subprocess.TimeoutExpired:
+            self.proceso.kill()
+
+    @property
+    def http(self) -> str:
+        return f'http://127.0.0.1:{self.puerto}'
+
+    @property
+    def ws(self) -> str:
+        return f'ws://127.0.0.1:{self.puerto}/_stcore/stream'
+
+
+# --- cliente del websocket ---
+
+class Sesion:
+    """
+    Una pestaña del navegador: manda reruns con el estado de sus widgets y espera a que el
+    script termine, como el frontend de Streamlit.
+    """
+
+    def __init__(self, servidor: Servidor, timeout: float = 120):
+        self.servidor = servidor
+        self.timeout = timeout
+        self.widgets = {}      # key o etiqueta -> elemento (proto) con su id
+        self.estados = {}      # id -> WidgetState que se manda en cada rerun
+        self.paginas = {}      # nombre -> (page_script_hash, url)
+        self.pagina = None
+        self.session_id = None
+        self.errores = []
+
+    async def __aenter__(self):
+        from websockets.asyncio.client import connect
+        self.conexion = await connect(self.servidor.ws, subprotocols=['streamlit'], max_size=None)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.conexion.close()
+
+    async def _enviar(self, mensaje):
+        await self.conexion.send(mensaje.SerializeToString())
+
+    async def _recibir(self):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        mensaje = ForwardMsg()
+        mensaje.ParseFromString(await asyncio.wait_for(self.conexion.recv(), self.timeout))
+        return mensaje
+
+    def _registrar(self, mensaje):
+        tipo = mensaje.WhichOneof('type')
+        if tipo == 'new_session':
+            self.session_id = mensaje.new_session.initialize.session_id
+        elif tipo == 'navigation':
+            self.paginas = {p.page_name: (p.page_script_hash, p.url_pathname) for p in mensaje.navigation.app_pages}
+        elif tipo == 'delta':
+            delta = mensaje.delta
+            if delta.WhichOneof('type') == 'new_element':
+                clase = delta.new_element.WhichOneof('type')
+                elemento = getattr(delta.new_element, clase)
+                if clase == 'exception':
+                    self.errores.append(elemento.message)
+                elif getattr(elemento, 'id', ''):
+                    self._widget(elemento, elemento.id, getattr(elemento, 'label', '') or clase)
+            elif delta.WhichOneof('type') == 'add_block' and delta.add_block.HasField('tab_container'):
+                self._widget(delta.add_block.tab_container, delta.add_block.tab_container.id, 'tabs')
+
+    def _widget(self, elemento, element_id, etiqueta):
+        # el id de un widget con key termina en '-<key>'
+        key = element_id.rsplit('-', 1)[-1]
+        if key != 'None':
+            self.widgets[key] = elemento
+        self.widgets.setdefault(etiqueta, elemento)
+
+    async def rerun(self, pagina: str | None = None) -> float:
+        """Pide un rerun (en `pagina`, si se da) y regresa los ms hasta que el script termina."""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        mensaje = BackMsg()
+        if pagina is not None and pagina != self.pagina:
+            self.pagina = pagina
+            self.widgets, self.estados = {}, {}
+        if self.pagina is not None:
+            mensaje.rerun_script.page_script_hash, mensaje.rerun_script.page_name = self.paginas[self.pagina]
+        mensaje.rerun_script.widget_states.widgets.extend(self.estados.values())
+        errores = len(self.errores)
+        start = time.perf_counter()
+        await self._enviar(mensaje)
+        while True:
+            recibido = await self._recibir()
+            self._registrar(recibido)
+            if recibido.WhichOneof('type') == 'script_finished' and recibido.script_finished != _RERUN_PEDIDO:
+                break
+        ms = (time.perf_counter() - start) * 1000
+        if len(self.errores) > errores:
+            raise RuntimeError(self.errores[-1])
+        return ms
+
+    def set_value(self, nombre, valor):
+        """Cambia el valor de un number_input, text_input o pestañas (por key o etiqueta)."""
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        elemento = self.widgets[nombre]
+        estado = WidgetState(id=elemento.id)
+        if isinstance(valor, str):
+            estado.string_value = valor
+        elif getattr(elemento, 'data_type', 1) == 0:       # NumberInput.DataType.INT
+            estado.int_value = int(round(valor))
+        else:
+            estado.double_value = float(valor)
+        self.estados[elemento.id] = estado
+
+    async def upload(self, archivo: str, datos: bytes, tipo: str, nombre='file_uploader'):
+        """Sube `datos` al file_uploader como lo hace el navegador (URL firmada + PUT)."""
+        import requests
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.Common_pb2 import FileUploaderState, UploadedFileInfo
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        mensaje = BackMsg()
+        mensaje.file_urls_request.request_id = archivo
+        mensaje.file_urls_request.file_names.append(archivo)
+        mensaje.file_urls_request.session_id = self.session_id
+        await self._enviar(mensaje)
+        while True:
+            recibido = await self._recibir()
+            if recibido.WhichOneof('type') == 'file_urls_response':
+                urls = recibido.file_urls_response.file_urls[0]
+                break
+            self._registrar(recibido)
+
+        respuesta = await asyncio.to_thread(
+            requests.put, self.servidor.http + urls.upload_url,
+            files={'file': (archivo, datos, tipo)}, timeout=self.timeout,
+        )
+        respuesta.raise_for_status()
+        elemento = self.widgets[nombre]
+        self.estados[elemento.id] = WidgetState(id=elemento.id, file_uploader_state_value=FileUploaderState(
+            uploaded_file_info=[UploadedFileInfo(name=archivo, size=len(datos), file_id=urls.file_id, file_urls=urls)],
+        ))
+
+
+async def analyst_session(servidor, numero, interacciones, pausa, paginas, timeout) -> dict:
+    """
+    Guion de un analista. Regresa los ms de cada interacción y los errores; las interacciones
+    de arranque (password, páginas, archivos, pestañas) se miden aparte de los cambios.
+    """
+    rng = np.random.default_rng(numero)
+    resultado = {'arranque': [], 'cambios': [], 'errores': []}
+
+    async def pensar():
+        if pausa:
+            await asyncio.sleep(pausa * rng.uniform(0.5, 1.5))
+
+    try:
+        async with Sesion(servidor, timeout) as sesion:
+            resultado['arranque'].append(await sesion.rerun())
+            sesion.set_value('¡Escribe el password para acceder!', PASSWORD)
+            resultado['arranque'].append(await sesion.rerun())
+            for pagina in paginas:
+                guion = PAGINAS[pagina]
+                resultado['arranque'].append(await sesion.rerun(pagina))
+                archivo, generador, tipo = guion['archivo']
+                await sesion.upload(archivo, generador(numero), tipo)
+                resultado['arranque'].append(await sesion.rerun())
+                key, etiqueta = guion['pestaña']
+                sesion.set_value(key, etiqueta)
+                resultado['arranque'].append(await sesion.rerun())
+
+                cambios = guion['cambios']
+                base = {nombre: sesion.widgets[nombre].default for nombre, _ in cambios}
+                veces = -(-interacciones // len(cambios))
+                for i in range(interacciones):
+                    await pensar()
+                    nombre, delta = cambios[i % len(cambios)]
+                    sesion.set_value(nombre, base[nombre] + delta * (i // len(cambios) + 1) / veces)
+                    resultado['cambios'].append(await sesion.rerun())
+    except Exception as error:
+        resultado['errores'].append(f'{type(error).__name__}: {error}')
+    return resultado
+
+
+async def _muestrear(pid, muestras, detener, intervalo=0.2):
+    while not detener.is_set():
+        uso = process_usage(pid)
+        if uso is not None:
+            muestras.append(uso)
+        try:
+            await asyncio.wait_for(detener.wait(), intervalo)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def _nivel(servidor, sesiones, interacciones, pausa, paginas, timeout) -> dict:
+    pid = servidor.proceso.pid
+    reposo = process_usage(pid)
+    muestras, detener = [], asyncio.Event()
+    muestreo = asyncio.create_task(_muestrear(pid, muestras, detener))
+    start = time.perf_counter()
+    resultados = await asyncio.gather(*(
+        analyst_session(servidor, numero, interacciones, pausa, paginas, timeout) for numero in range(sesiones)
+    ))
+    duracion = time.perf_counter() - start
+    final = process_usage(pid)
+    detener.set()
+    await muestreo
+
+    cambios = np.array([ms for r in resultados for ms in r['cambios']])
+    arranque = np.array([ms for r in resultados for ms in r['arranque']])
+    errores = [e for r in resultados for e in r['errores']]
+    nivel = {
+        'sesiones': sesiones,
+        'interacciones': int(len(cambios) + len(arranque)),
+        'duracion_s': round(duracion, 2),
+        'throughput': round((len(cambios) + len(arranque)) / duracion, 2),
+        'errores': len(errores),
+        'detalle_errores': errores[:5],
+    }
+    for nombre, valores in (('cambio', cambios), ('arranque', arranque)):
+        if len(valores):
+            nivel[f'{nombre}_p50_ms'] = round(float(np.percentile(valores, 50)), 1)
+            nivel[f'{nombre}_p95_ms'] = round(float(np.percentile(valores, 95)), 1)
+            nivel[f'{nombre}_p99_ms'] = round(float(np.percentile(valores, 99)), 1)
+            nivel[f'{nombre}_max_ms'] = round(float(valores.max()), 1)
+    if reposo is not None and final is not None:
+        pico = max([rss for _, rss in muestras] + [final[1]])
+        nivel['cpu_pct'] = round((final[0] - reposo[0]) / duracion * 100, 1)
+        nivel['rss_reposo_mb'] = round(reposo[1], 1)
+        nivel['rss_pico_mb'] = round(pico, 1)
+        nivel['mb_por_sesion'] = round((pico - reposo[1]) / sesiones, 1)
+    return nivel
+
+
+def capacity(niveles: list[dict], objetivo_p95: float) -> dict:
+    """
+    Sesiones por proceso que cumplen `objetivo_p95` (ms) sin errores, y la memoria y CPU que
+    piden; el punto de saturación es el primer nivel donde el throughput deja de crecer.
+
+    'mb_por_sesion_marginal' es la pendiente del pico de memoria contra el número de
+    sesiones: lo que cuesta cada sesión adicional, sin los imports y cachés que el proceso
+    paga una sola vez.
+    """
+    ok = [n for n in niveles if not n['errores'] and n.get('cambio_p95_ms', np.inf) <= objetivo_p95]
+    saturacion = None
+    for anterior, nivel in zip(niveles, niveles[1:]):
+        if nivel['throughput'] < anterior['throughput'] * 1.1:
+            saturacion = nivel['sesiones']
+            break
+    mejor = max(ok, key=lambda n: n['sesiones']) if ok else None
+    medidos = [n for n in niveles if 'rss_pico_mb' in n]
+    marginal = None
+    if len({n['sesiones'] for n in medidos}) > 1:
+        marginal = round(float(np.polyfit([n['sesiones'] for n in medidos], [n['rss_pico_mb'] for n in medidos], 1)[0]), 1)
+    return {
+        'objetivo_p95_ms': objetivo_p95,
+        'sesiones_por_proceso': mejor['sesiones'] if mejor else 0,
+        'rss_pico_mb': mejor.get('rss_pico_mb') if mejor else None,
+        'mb_por_sesion': mejor.get('mb_por_sesion') if mejor else None,
+        'mb_por_sesion_marginal': marginal,
+        'cpu_pct': mejor.get('cpu_pct') if mejor else None,
+        'saturacion_sesiones': saturacion,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Prueba de carga de fondos_app con sesiones concurrentes')
+    parser.add_argument('--sesiones', type=int, nargs='+', default=[1, 2, 4, 8], help='niveles de concurrencia')
+    parser.add_argument('--interacciones', type=int, default=10, help='cambios de widgets por página y sesión')
+    parser.add_argument('--pausa', type=float, default=1.0, help='segundos (promedio) entre interacciones')
+    parser.add_argument('--paginas', nargs='+', choices=list(PAGINAS), default=list(PAGINAS))
+    parser.add_argument('--objetivo-p95', type=float, default=2000, help='latencia aceptable (ms) de un cambio')
+    parser.add_argument('--timeout', type=float, default=180, help='segundos máximos por interacción')
+    parser.add_argument('--salida', default='carga.json', help='archivo JSON con el reporte')
+    args = parser.parse_args(argv)
+
+    reporte = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'interacciones': args.interacciones,
+        'pausa_s': args.pausa,
+        'paginas': args.paginas,
+        'niveles': [],
+    }
+    print(f"{'sesiones':>8} {'int/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'CPU %':>7} {'RSS MB':>8} {'MB/ses':>7} {'errores':>7}")
+    with tempfile.TemporaryDirectory(prefix='carga_') as temporal:
+        for sesiones in args.sesiones:
+            # un servidor nuevo por nivel: la memoria y los cachés no vienen del nivel anterior
+            with Servidor(Path(temporal)) as servidor:
+                nivel = asyncio.run(_nivel(servidor, sesiones, args.interacciones, args.pausa, args.paginas, args.timeout))
+            reporte['niveles'].append(nivel)
+            print(f"{sesiones:>8} {nivel['throughput']:>7.2f} {nivel.get('cambio_p50_ms', float('nan')):>8.0f} "
+                  f"{nivel.get('cambio_p95_ms', float('nan')):>8.0f} {nivel.get('cambio_p99_ms', float('nan')):>8.0f} "
+                  f"{nivel.get('cpu_pct', float('nan')):>7.1f} {nivel.get('rss_pico_mb', float('nan')):>8.0f} "
+                  f"{nivel.get('mb_por_sesion', float('nan')):>7.1f} {nivel['errores']:>7}")
+
+    reporte['capacidad'] = capacidad = capacity(reporte['niveles'], args.objetivo_p95)
+    Path(args.salida).write_text(json.dumps(reporte, ensure_ascii=False, indent=2), encoding='utf-8')
+    # la memoria marginal necesita al menos dos niveles medidos; la de los niveles, Linux
+    memoria = f"pico {capacidad['rss_pico_mb']} MB" if capacidad['rss_pico_mb'] is not None else 'pico n/d'
+    if capacidad['mb_por_sesion_marginal'] is not None:
+        memoria += f"; cada sesión adicional, {capacidad['mb_por_sesion_marginal']} MB"
+    print(f"Capacidad con p95 <= {args.objetivo_p95:.0f} ms: {capacidad['sesiones_por_proceso']} sesiones por proceso "
+          f"({memoria}); "
+          f"el throughput deja de crecer en {capacidad['saturacion_sesiones'] or 'ningún nivel medido'}")
+    print(f'Reporte: {args.salida}')
+    return 1 if any(n['errores'] for n in reporte['niveles']) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""
+Montos en centavos enteros (int64).
+
+Los montos se calculan en pesos (float64) sólo hasta el reparto bruto; a partir de ahí el
+motor trabaja en centavos enteros. El redondeo por residuo mayor garantiza que la suma de
+las asignaciones sea exactamente el total del fondo, y el rebalanceo por bandas opera sobre
+cotas enteras, por lo que el remanente llega a cero exacto (sin tolerancias en pesos)
+siempre que el total quepa en las bandas; si no cabe, `BandasInfactibles`.
+"""
+
+import numpy as np
+
+from asignacion.segmentos import segsum, broadcast, segment_ids, single_segment
+
+
+def to_centavos(pesos) -> np.ndarray:
+    """Pesos -> centavos enteros, redondeando al centavo más cercano."""
+    return np.rint(np.asarray(pesos, dtype=np.float64) * 100).astype(np.int64)
+
+
+def to_pesos(centavos) -> np.ndarray:
+    """Centavos enteros -> pesos (sólo para mostrar o graficar)."""
+    return np.asarray(centavos, dtype=np.int64) / 100
+
+
+def largest_remainder(values, total, starts=None, counts=None) -> np.ndarray:
+    """
+    Redondeo por residuo mayor (método de Hamilton), vectorizado.
+
+    `values` son montos en centavos con fracción y `total` el entero que debe sumar cada
+    segmento. Se toma el piso de cada valor y los centavos faltantes se entregan, uno por
+    fila, a las filas con mayor residuo. `values` debe sumar `total` (salvo redondeo) en
+    cada segmento.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if starts is None:
+        starts, counts = single_segment(values.size)
+    total = np.broadcast_to(np.asarray(total, dtype=np.int64), (len(starts),))
+
+    floor = np.floor(values)
+    residuo = values - floor
+    floor = floor.astype(np.int64)
+    faltante = total - segsum(floor, starts)
+
+    # rango de cada fila dentro de su segmento, de mayor a menor residuo
+    seg = segment_ids(counts)
+    order = np.lexsort((-residuo, seg))
+    rank = np.empty(values.size, dtype=np.int64)
+    rank[order] = np.arange(values.size) - starts[seg[order]]
+
+    return floor + (rank < broadcast(faltante, counts))
+
+
+def allocate_centavos(weights, total, starts=None, counts=None) -> np.ndarray:
+    """Reparte `total` centavos en proporción a `weights`, con suma exacta por segmento."""
+    weights = np.asarray(weights, dtype=np.float64)
+    if starts is None:
+        starts, counts = single_segment(weights.size)
+    total = np.broadcast_to(np.asarray(total, dtype=np.int64), (len(starts),))
+
+    basis = segsum(weights, starts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        exact = np.where(broadcast(basis, counts) != 0,
+                         weights / broadcast(basis, counts) * broadcast(total, counts), 0.0)
+    return largest_remainder(exact, np.where(basis != 0, total, 0), starts, counts)
+
+
+def band_bounds(previo, lower_limit: float, upper_limit: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Cotas enteras de la banda respecto al monto anterior (en pesos).
+    La cota inferior se redondea hacia arriba y la superior hacia abajo, para que
+    cualquier monto entero dentro de ellas respete la banda.
+    """
+    previo = np.asarray(previo, dtype=np.float64) * 100
+    lower = np.ceil(np.round(previo * (1 + lower_limit), 6)).astype(np.int64)
+    upper = np.floor(np.round(previo * (1 + upper_limit), 6)).astype(np.int64)
+    return lower, upper
+
+
+class BandasInfactibles(ValueError):
+    """
+    Las bandas no admiten el monto a repartir: la suma de las cotas inferiores lo rebasa o
+    la de las superiores no lo alcanza. `segmentos` son los índices de los segmentos
+    (escenarios o estados) que no se pueden cumplir.
+    """
+
+    def __init__(self, mensaje: str, segmentos=()):
+        super().__init__(mensaje)
+        self.segmentos = [int(i) for i in segmentos]
+
+
+def band_feasibility(asignacion, lower, upper, starts=None, counts=None) -> np.ndarray:
+    """
+    Por segmento, si el total de `asignacion` cabe en la banda: suma de cotas inferiores
+    <= total <= suma de cotas superiores. Si no cabe, ningún rebalanceo lo cumple.
+    """
+    asignacion = np.asarray(asignacion, dtype=np.int64)
+    if starts is None:
+        starts, counts = single_segment(asignacion.size)
+    total = segsum(asignacion, starts)
+    return (segsum(np.asarray(lower, dtype=np.int64), starts) <= total) & \
+        (total <= segsum(np.asarray(upper, dtype=np.int64), starts))
+
+
+def check_bands(asignacion, lower, upper, starts=None, counts=None, nombres=None, que: str = 'Las bandas'):
+    """
+    Lanza `BandasInfactibles` si algún segmento no cabe en su banda (ver `band_feasibility`).
+    `nombres` (uno por segmento, p. ej. los estados) y `que` sólo cambian el mensaje.
+    """
+    asignacion = np.asarray(asignacion, dtype=np.int64)
+    if starts is None:
+        starts, counts = single_segment(asignacion.size)
+    factible = band_feasibility(asignacion, lower, upper, starts, counts)
+    if factible.all():
+        return
+    segmentos = np.flatnonzero(~factible)
+    i = segmentos[0]
+    total = segsum(asignacion, starts)[i]
+    minimo = segsum(np.asarray(lower, dtype=np.int64), starts)[i]
+    maximo = segsum(np.asarray(upper, dtype=np.int64), starts)[i]
+    if minimo > total:
+        detalle = (f'la suma de las cotas inferiores (${minimo / 100:,.2f}) rebasa el monto a repartir '
+                   f'(${total / 100:,.2f}); baje la banda inferior')
+    else:
+        detalle = (f'la suma de las cotas superiores (${maximo / 100:,.2f}) no alcanza el monto a repartir '
+                   f'(${total / 100:,.2f}); amplíe la banda superior')
+    if len(starts) > 1:
+        nombres = [str(n) for n in nombres] if nombres is not None else [f'segmento {j}' for j in range(len(starts))]
+        lista = ', '.join(nombres[j] for j in segmentos[:5]) + (', ...' if len(segmentos) > 5 else '')
+        detalle = f'en {len(segmentos)} de {len(starts)} ({lista}); en {nombres[i]}, {detalle}'
+    raise BandasInfactibles(f'{que} no se pueden cumplir: {detalle}.', segmentos)
+
+
+def rebalance_centavos(asignacion, base_reparto, lower, upper,
+                       starts=None, counts=None, max_iterations: int = 20,
+                       historial: list | None = None, estricto: bool = True) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Rebalanceo iterativo de remanente con montos y cotas enteros.
+
+    Mismo procedimiento que las apps: topar a la banda, juntar superávit menos déficit
+    (remanente) y repartirlo en proporción a `base_reparto` entre los estados que aún
+    tienen margen (por partes iguales si ninguno de ellos tiene base de reparto). El
+    remanente se reparte con residuo mayor, así que la suma de cada segmento se conserva
+    exacta y el ciclo termina cuando el remanente es cero.
+
+    Eso sólo es posible si el total de cada segmento cabe en su banda: si no, lanza
+    `BandasInfactibles` antes de iterar. Con `estricto=False` (lotes de escenarios, donde
+    uno infactible no debe detener a los demás) no se lanza; quien llama debe revisar
+    `band_feasibility`, porque en esos segmentos el total ajustado no es el del fondo.
+
+    Regresa la asignación ajustada (centavos) y las iteraciones de cada segmento. Si se da
+    `historial` (una lista), se le agrega el estado de cada iteración: asignación al
+    inicio, remanente por segmento, estados elegibles y reparto del remanente.
+    """
+    asignacion = np.asarray(asignacion, dtype=np.int64).copy()
+    base_reparto = np.asarray(base_reparto, dtype=np.float64)
+    if starts is None:
+        starts, counts = single_segment(asignacion.size)
+    if estricto:
+        check_bands(asignacion, lower, upper, starts, counts)
+    iterations = np.zeros(len(starts), dtype=np.int64)
+
+    for _ in range(max_iterations):
+        # superávit y déficit por segmento
+        superavit = segsum(np.maximum(asignacion - upper, 0), starts)
+        deficit = segsum(np.maximum(lower - asignacion, 0), starts)
+        remanente = superavit - deficit
+
+        active = remanente != 0
+        if not active.any():
+            break
+        iterations += active
+
+        # topado y elegibles: un remanente positivo va a los no topados por la banda
+        # superior; uno negativo (déficit mayor al superávit) sale de los que están
+        # por encima de la banda inferior
+        reasignacion = np.clip(asignacion, lower, upper)
+        elegibles = np.where(broadcast(remanente > 0, counts), reasignacion < upper, reasignacion > lower)
+        pesos = np.where(elegibles, base_reparto, 0.0)
+        # sin base de reparto entre los elegibles, `allocate_centavos` no repartiría nada y
+        # el remanente se perdería: se reparte por partes iguales
+        sin_base = broadcast(segsum(pesos, starts) == 0, counts)
+        pesos = np.where(sin_base & elegibles, 1.0, pesos)
+        reparto_neto = allocate_centavos(pesos, remanente, starts, counts)
+        if historial is not None:
+            historial.append({'asignacion': asignacion, 'remanente': remanente,
+                              'elegibles': elegibles, 'reparto': reparto_neto})
+
+        asignacion = np.where(broadcast(active, counts), reasignacion + reparto_neto, asignacion)
+
+    return asignacion, iterations
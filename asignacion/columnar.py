@@ -0,0 +1,347 @@
+"""
+Motor columnar (polars) para FASP y FOFISP: normalización, índice ponderado y rebalanceo
+por bandas como expresiones de polars.
+
+Las funciones tienen la misma firma y regresan lo mismo que las de pandas/numpy
+(`asignacion.escenarios.normalized_matrix`, `asignacion.indice.index_allocation`,
+`calculate_index` y `rebalance`): las apps eligen el motor con `ASIGNACION_MOTOR=polars`
+(ver `asignacion.indice.allocation_engine`). Aceptan un DataFrame de polars o de pandas; de
+uno de pandas sólo se convierten las columnas que se usan.
+
+Los montos siguen en centavos enteros con el mismo residuo mayor, así que la asignación
+bruta y la ajustada son idénticas a las del motor de pandas; las proporciones coinciden
+salvo el último bit (el orden de las sumas no es el mismo). La paridad, la comparación de
+tiempos y los casos fijos de los dos motores (p. ej. `remainder_without_basis`) se corren con:
+
+    python -m asignacion.columnar --semillas 50 --filas 32 2469 100000
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import polars as pl
+
+from asignacion.centavos import check_bands, to_centavos, to_pesos
+from asignacion.indice import (
+    FASP_VARIABLES, FOFISP_VARIABLES, direct_proportion_normalize, shifted_proportion_normalize, allocation_engine,
+)
+
+
+# --- normalización ---
+
+def direct_proportion_expr(column: str, direction: str = 'positive') -> pl.Expr:
+    """`direct_proportion_normalize` como expresión: proporción directa o inversa suavizada."""
+    x = pl.col(column).cast(pl.Float64)
+    # corrimiento de prom + 3*stdev sólo si hay valores negativos
+    shifted = pl.when(x.min() < 0).then(x + (x.mean() + x.std() * 3)).otherwise(x)
+    values = shifted if direction == 'positive' else 1 / shifted
+    total = values.sum()
+    return pl.when(total == 0).then(1.0 / pl.len()).otherwise(values / total).alias(column)
+
+
+def shifted_proportion_expr(column: str, direction: str = 'positive') -> pl.Expr:
+    """`shifted_proportion_normalize` como expresión (variante FOFISP)."""
+    x = pl.col(column).cast(pl.Float64)
+    shifted = x + (x.abs().max() * 0.01 + 1e-6)
+    values = 1 / shifted if direction == 'negative' else shifted
+    total = values.sum()
+    return pl.when(total == 0).then(1.0 / pl.len()).otherwise(values / total).alias(column)
+
+
+# la normalización de pandas que se pide -> su expresión equivalente
+EXPRESSIONS = {
+    direct_proportion_normalize: direct_proportion_expr,
+    shifted_proportion_normalize: shifted_proportion_expr,
+}
+
+
+def _frame(df, columns) -> pl.DataFrame:
+    # DataFrame de polars con `columns`; de pandas sólo se convierten ésas
+    if isinstance(df, pl.DataFrame):
+        return df.select(columns)
+    return pl.from_pandas(df[list(columns)])
+
+
+def normalized_matrix(df, variable_map=None, normalize=direct_proportion_normalize) -> np.ndarray:
+    """
+    Proporciones normalizadas (n x k) en el orden de `variable_map`, más una última columna
+    de 1/n para el 'Monto base'; igual que `asignacion.escenarios.normalized_matrix`.
+    """
+    variable_map = variable_map or FASP_VARIABLES
+    expression = EXPRESSIONS[normalize]
+    props = _frame(df, variable_map).select(
+        expression(var_name, direction) for var_name, direction in variable_map.items()
+    ).with_columns(pl.lit(1 / len(df), dtype=pl.Float64).alias('Monto base'))
+    return props.to_numpy()
+
+
+# --- residuo mayor y rebalanceo en centavos ---
+
+def largest_remainder_expr(values: pl.Expr, total) -> pl.Expr:
+    """
+    Residuo mayor de `asignacion.centavos.largest_remainder` como expresión: piso de cada
+    valor más un centavo para las filas con mayor residuo, hasta completar `total`.
+    """
+    floor = values.floor()
+    faltante = total - floor.cast(pl.Int64).sum()
+    # rango de mayor a menor residuo; los empates quedan en el orden de las filas
+    rank = (-(values - floor)).rank('ordinal') - 1
+    return floor.cast(pl.Int64) + (rank < faltante).cast(pl.Int64)
+
+
+def largest_remainder(values, total) -> np.ndarray:
+    """`asignacion.centavos.largest_remainder` (un solo segmento) con polars."""
+    frame = pl.DataFrame({'valor': np.asarray(values, dtype=np.float64)})
+    return frame.select(largest_remainder_expr(pl.col('valor'), int(total))).to_series().to_numpy()
+
+
+def index_allocation(props, weights, presupuesto, variable_map=None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Asignación bruta (centavos, suma exacta) y reparto, como `asignacion.indice.index_allocation`.
+    `props` es la matriz de `normalized_matrix` (la última columna es el 'Monto base').
+    """
+    variable_map = variable_map or FASP_VARIABLES
+    w = [weights[c] for c in variable_map] + [weights.get('Monto base', 0.0)]
+    frame = pl.DataFrame(np.asarray(props, dtype=np.float64), schema=[*variable_map, 'Monto base'], orient='row')
+    total_ponderado = presupuesto * (sum(weights[c] for c in variable_map) + weights.get('Monto base', 0))
+    bruta = pl.sum_horizontal(pl.col(c) * peso for c, peso in zip(frame.columns, w)) * presupuesto
+    result = frame.select(
+        largest_remainder_expr(bruta * 100, int(to_centavos(total_ponderado))).alias('bruta'),
+        (bruta / bruta.sum()).alias('reparto'),
+    )
+    return result['bruta'].to_numpy(), result['reparto'].to_numpy()
+
+
+def band_bounds_expr(reference: str, lower_limit: float, upper_limit: float) -> tuple[pl.Expr, pl.Expr]:
+    """Cotas enteras de la banda (`asignacion.centavos.band_bounds`) como expresiones."""
+    previo = pl.col(reference).cast(pl.Float64) * 100
+    lower = (previo * (1 + lower_limit)).round(6).ceil().cast(pl.Int64)
+    upper = (previo * (1 + upper_limit)).round(6).floor().cast(pl.Int64)
+    return lower, upper
+
+
+def rebalance(df, lower_limit, upper_limit, reference='Asignacion_2025', max_iterations=20):
+    """
+    Rebalanceo de remanente con bandas de control respecto a `reference`, como
+    `asignacion.indice.rebalance`: topar a la banda, juntar superávit menos déficit y
+    repartirlo (residuo mayor) entre los estados con margen, hasta que el remanente sea cero.
+
+    Regresa la asignación ajustada en centavos y el número de iteraciones; lanza
+    `BandasInfactibles` si el total no cabe en las bandas.
+    """
+    lower, upper = band_bounds_expr(reference, lower_limit, upper_limit)
+    frame = _frame(df, [reference, 'Asignacion_Bruta_centavos', 'Reparto']).select(
+        pl.col('Asignacion_Bruta_centavos').cast(pl.Int64).alias('asignacion'),
+        pl.col('Reparto').cast(pl.Float64).alias('reparto'),
+        lower.alias('lower'),
+        upper.alias('upper'),
+    )
+    asignacion, reparto = pl.col('asignacion'), pl.col('reparto')
+    # como `rebalance_centavos`: si el total no cabe en la banda, el remanente nunca llega a cero
+    check_bands(frame['asignacion'].to_numpy(), frame['lower'].to_numpy(), frame['upper'].to_numpy())
+
+    iterations = 0
+    for _ in range(max_iterations):
+        superavit = (asignacion - pl.col('upper')).clip(lower_bound=0).sum()
+        deficit = (pl.col('lower') - asignacion).clip(lower_bound=0).sum()
+        remanente = frame.select(superavit - deficit).item()
+        if remanente == 0:
+            break
+        iterations += 1
+
+        # topado y elegibles: un remanente positivo va a los no topados por la banda
+        # superior; uno negativo sale de los que están por encima de la banda inferior
+        reasignacion = asignacion.clip(pl.col('lower'), pl.col('upper'))
+        elegibles = reasignacion < pl.col('upper') if remanente > 0 else reasignacion > pl.col('lower')
+        peso = pl.when(elegibles).then(reparto).otherwise(0.0)
+        # sin base de reparto entre los elegibles, por partes iguales (como `rebalance_centavos`)
+        peso = pl.when(peso.sum() == 0).then(elegibles.cast(pl.Float64)).otherwise(peso)
+        basis = peso.sum()
+        exacto = pl.when(basis != 0).then(peso / basis * float(remanente)).otherwise(0.0)
+        total = pl.when(basis != 0).then(pl.lit(remanente, dtype=pl.Int64)).otherwise(0)
+        frame = frame.with_columns((reasignacion + largest_remainder_expr(exacto, total)).alias('asignacion'))
+
+    return frame['asignacion'].to_numpy(), iterations
+
+
+def calculate_index(df, weights, presupuesto, variable_map=None, normalize=direct_proportion_normalize) -> pl.DataFrame:
+    """
+    La sábana de `asignacion.indice.calculate_index` con polars: las columnas de `df`, la
+    proporción y el monto de cada indicador, la asignación bruta (centavos y pesos) y el reparto.
+    """
+    variable_map = variable_map or FASP_VARIABLES
+    expression = EXPRESSIONS[normalize]
+    frame = df if isinstance(df, pl.DataFrame) else pl.from_pandas(df)
+
+    props = [expression(var_name, direction).alias(f'{var_name}_prop') for var_name, direction in variable_map.items()]
+    frame = frame.with_columns(props)
+    contributions = [(pl.col(f'{var_name}_prop') * weights[var_name] * presupuesto).alias(f'Monto_{var_name}')
+                     for var_name in variable_map]
+    if 'Monto base' in weights:
+        contributions.append(pl.lit(presupuesto * weights['Monto base'] / frame.height, dtype=pl.Float64).alias('Monto_Base'))
+    frame = frame.with_columns(contributions)
+
+    montos = [c.meta.output_name() for c in contributions]
+    bruta = pl.sum_horizontal(montos)
+    total_ponderado = presupuesto * (sum(weights[c] for c in variable_map) + weights.get('Monto base', 0))
+    centavos = largest_remainder_expr(bruta * 100, int(to_centavos(total_ponderado)))
+    frame = frame.with_columns(
+        centavos.alias('Asignacion_Bruta_centavos'),
+        (centavos / 100).alias('Asignacion_Bruta'),
+        (bruta / bruta.sum()).alias('Reparto'),
+    )
+    # mismo orden de columnas que la sábana de pandas
+    return frame.select(
+        *df.columns, *(f'{v}_prop' for v in variable_map), 'Asignacion_Bruta_centavos', 'Asignacion_Bruta',
+        *montos, 'Reparto',
+    )
+
+
+# --- paridad y comparación de tiempos contra el motor de pandas ---
+
+# fondo, normalización, monto del fondo y la columna que puede traer valores negativos
+FONDOS = {
+    'FASP': (FASP_VARIABLES, direct_proportion_normalize, 9_941_162_915.0, 'Inc_del'),
+    'FOFISP': (FOFISP_VARIABLES, shifted_proportion_normalize, 1_154_918_909.69, 'Var_incidencia_del'),
+}
+
+
+def _caso(fondo: str, filas: int, seed: int):
+    # datos, ponderadores y bandas aleatorios (con semilla) para un fondo
+    variable_map, _, presupuesto, negativa = FONDOS[fondo]
+    rng = np.random.default_rng(seed)
+    datos = {var: rng.uniform(0.01, 1, filas) for var in variable_map}
+    datos[negativa] = rng.uniform(-0.3, 0.3, filas)
+    previo = rng.uniform(1, 4, filas)
+    datos['Asignacion_2025'] = previo * presupuesto * 0.95 / previo.sum()
+    pesos = rng.dirichlet(np.ones(len(variable_map) + 1))
+    weights = dict(zip([*variable_map, 'Monto base'], pesos)) if fondo == 'FASP' else dict(zip(variable_map, pesos[:-1] / pesos[:-1].sum()))
+    # la referencia suma 95% del fondo: con banda superior de 6% o más el fondo cabe en las bandas
+    bands = (-rng.uniform(0.02, 0.2), rng.uniform(0.06, 0.2))
+    return pd.DataFrame(datos), weights, presupuesto, bands
+
+
+def _pipeline(motor, datos, fondo, weights, presupuesto, bands, tiempos=None):
+    # normalización, índice y rebalanceo con un motor; `tiempos` recibe los ms de cada etapa
+    variable_map, normalize, _, _ = FONDOS[fondo]
+    engine = allocation_engine(motor)
+    start = time.perf_counter()
+    props = engine.normalized_matrix(datos, variable_map, normalize)
+    normalizada = time.perf_counter()
+    bruta, reparto = engine.index_allocation(props, weights, presupuesto, variable_map)
+    indexada = time.perf_counter()
+    frame = datos[['Asignacion_2025']].assign(Asignacion_Bruta_centavos=bruta, Reparto=reparto)
+    ajustada, iterations = engine.rebalance(frame, *bands)
+    if tiempos is not None:
+        for etapa, ms in (('normalización', normalizada - start), ('índice', indexada - normalizada),
+                          ('rebalanceo', time.perf_counter() - indexada)):
+            tiempos.setdefault(etapa, []).append(ms * 1000)
+    return props, bruta, reparto, ajustada, iterations
+
+
+def _cerca(a, b) -> bool:
+    # iguales salvo el último bit, relativo a la escala de cada columna (con indicadores
+    # negativos la proporción inversa puede tener valores cerca de cero)
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    escala = np.nanmax(np.abs(a), axis=0) if a.size else 0
+    return bool(np.allclose(a, b, rtol=1e-12, atol=0) or np.all(np.abs(a - b) <= 1e-12 * escala))
+
+
+def parity(fondo: str, filas: int, seed: int) -> list[str]:
+    """Diferencias entre el motor de polars y el de pandas en un caso aleatorio."""
+    from asignacion.indice import calculate_index as calculate_index_pd
+    datos, weights, presupuesto, bands = _caso(fondo, filas, seed)
+    pandas_ = _pipeline('pandas', datos, fondo, weights, presupuesto, bands)
+    polars_ = _pipeline('polars', datos, fondo, weights, presupuesto, bands)
+
+    diferencias = []
+    if not _cerca(pandas_[0], polars_[0]):
+        diferencias.append('proporciones')
+    if not np.array_equal(pandas_[1], polars_[1]):
+        diferencias.append(f'bruta ({int(np.abs(pandas_[1] - polars_[1]).sum())} centavos)')
+    if not _cerca(pandas_[2], polars_[2]):
+        diferencias.append('reparto')
+    if not np.array_equal(pandas_[3], polars_[3]) or pandas_[4] != polars_[4]:
+        diferencias.append(f'ajustada ({int(np.abs(pandas_[3] - polars_[3]).sum())} centavos, '
+                           f'{pandas_[4]} vs {polars_[4]} iteraciones)')
+
+    variable_map, normalize, _, _ = FONDOS[fondo]
+    sabana_pd = calculate_index_pd(datos, weights, presupuesto, variable_map, normalize)
+    sabana_pl = calculate_index(datos, weights, presupuesto, variable_map, normalize).to_pandas()
+    if list(sabana_pd.columns) != list(sabana_pl.columns):
+        diferencias.append('columnas de la sábana')
+    elif not np.array_equal(sabana_pd['Asignacion_Bruta_centavos'], sabana_pl['Asignacion_Bruta_centavos']):
+        diferencias.append('bruta de la sábana')
+    elif not _cerca(sabana_pd.to_numpy(dtype=np.float64), sabana_pl.to_numpy(dtype=np.float64)):
+        diferencias.append('montos de la sábana')
+    return diferencias
+
+
+def remainder_without_basis() -> list[str]:
+    """
+    Caso fijo: los estados con margen no tienen base de reparto (`Reparto` cero). El
+    remanente se reparte entre ellos por partes iguales y la ajustada suma lo mismo que la
+    bruta, con los dos motores. Regresa las diferencias.
+    """
+    frame = pd.DataFrame({
+        'Asignacion_2025': [100.0] * 4,
+        'Asignacion_Bruta_centavos': np.array([14_000, 12_000, 9_000, 9_000], dtype=np.int64),
+        'Reparto': [0.5, 0.5, 0.0, 0.0],
+    })
+    esperada = np.full(4, 11_000, dtype=np.int64)
+    diferencias = []
+    for motor in ('pandas', 'polars'):
+        ajustada, _ = allocation_engine(motor).rebalance(frame, -0.1, 0.1)
+        if not np.array_equal(ajustada, esperada):
+            diferencias.append(f'{motor}: ajustada {ajustada.tolist()} (suma {int(ajustada.sum())}), '
+                               f'se esperaba {esperada.tolist()}')
+    return diferencias
+
+
+def benchmark(fondo: str, filas: int, repeticiones: int = 20) -> dict:
+    """Mediana (ms) de cada etapa y del total con cada motor: {motor: {etapa: ms}}."""
+    datos, weights, presupuesto, bands = _caso(fondo, filas, 0)
+    resultado = {}
+    for motor in ('pandas', 'polars'):
+        _pipeline(motor, datos, fondo, weights, presupuesto, bands)     # imports y calentamiento
+        tiempos = {}
+        for _ in range(repeticiones):
+            _pipeline(motor, datos, fondo, weights, presupuesto, bands, tiempos)
+        resultado[motor] = {etapa: float(np.median(ms)) for etapa, ms in tiempos.items()}
+        resultado[motor]['total'] = float(np.median(np.sum(list(tiempos.values()), axis=0)))
+    return resultado
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Paridad y tiempos del motor de polars contra el de pandas')
+    parser.add_argument('--semillas', type=int, default=50, help='casos aleatorios por fondo y tamaño')
+    parser.add_argument('--filas', type=int, nargs='+', default=[32, 2_469, 100_000])
+    parser.add_argument('--repeticiones', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    fallas = 0
+    etapas = ['normalización', 'índice', 'rebalanceo', 'total']
+    print(f"{'fondo':8} {'filas':>8} {'paridad':>10}  " + '  '.join(f'{e:>21}' for e in etapas))
+    print(f"{'':29}" + '  '.join(f"{'pandas':>10} {'polars':>10}" for _ in etapas))
+    for fondo in FONDOS:
+        for filas in args.filas:
+            diferencias = {seed: parity(fondo, filas, seed) for seed in range(args.semillas)}
+            diferencias = {seed: d for seed, d in diferencias.items() if d}
+            fallas += len(diferencias)
+            tiempos = benchmark(fondo, filas, args.repeticiones)
+            print(f"{fondo:8} {filas:>8} {args.semillas - len(diferencias):>4}/{args.semillas:<5}  " + '  '.join(
+                f"{tiempos['pandas'][e]:>10.2f} {tiempos['polars'][e]:>10.2f}" for e in etapas))
+            for seed, d in list(diferencias.items())[:3]:
+                print(f'    semilla {seed}: {", ".join(d)}')
+
+    diferencias = remainder_without_basis()
+    fallas += len(diferencias)
+    print(f"remanente sin base de reparto: {'; '.join(diferencias) or 'ok'}")
+    return 1 if fallas else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
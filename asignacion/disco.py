@@ -0,0 +1,200 @@
+"""
+Caché persistente en disco (SQLite) que sobrevive a los reinicios de las apps.
+
+Cada despliegue de Streamlit empieza con la memoria vacía; sin este caché, la primera
+persona después de un reinicio paga de nuevo la lectura del archivo y el cálculo. Aquí se
+guardan los resultados intermedios (datos leídos, matrices normalizadas, asignaciones)
+con llave de contenido:
+
+- la llave combina el hash del contenido de las entradas y los parámetros (la que ya
+  calcula `asignacion.grafo`) con la versión del motor, que es un hash del código de
+  `asignacion`; un cambio en el motor invalida todo lo guardado;
+- el tamaño está acotado en bytes y se descartan las entradas usadas hace más tiempo (LRU);
+- cada escritura (alta más descarte) es una transacción de SQLite, así que varias sesiones
+  o procesos pueden usar el mismo archivo a la vez;
+- con `get_or_compute`, si varias sesiones piden a la vez la misma llave, sólo una calcula
+  y las demás esperan su resultado.
+
+La ruta se toma de `ASIGNACION_CACHE` (por omisión `~/.cache/asignacion/resultados.sqlite`).
+Si el disco no está disponible, el caché se desactiva y todo se calcula como antes.
+"""
+
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import warnings
+from pathlib import Path
+
+from asignacion.grafo import content_key
+
+
+_MISSING = object()
+
+
+def engine_version() -> str:
+    """Hash del código del paquete `asignacion`: cambia con cualquier cambio al motor."""
+    h = hashlib.blake2b(digest_size=8)
+    for path in sorted(Path(__file__).parent.glob('*.py')):
+        h.update(path.name.encode())
+        h.update(path.read_bytes())
+    return h.hexdigest()
+
+
+class DiskCache:
+    """LRU persistente en un archivo SQLite, acotado en bytes."""
+
+    def __init__(self, path=None, max_bytes: int = 512 * 2**20):
+        self.path = Path(path or os.environ.get('ASIGNACION_CACHE')
+                         or Path.home() / '.cache' / 'asignacion' / 'resultados.sqlite')
+        self.max_bytes = max_bytes
+        self.version = engine_version()
+        self.hits = 0
+        self.misses = 0
+        self.enabled = True
+        self._local = threading.local()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        # una conexión por hilo (cada sesión de Streamlit corre en su hilo)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS entradas ('
+                'llave TEXT PRIMARY KEY, valor BLOB NOT NULL, bytes INTEGER NOT NULL, acceso REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS entradas_acceso ON entradas (acceso)')
+            self._local.conn = conn
+        return conn
+
+    def _disable(self, error):
+        self.enabled = False
+        warnings.warn(f'Caché en disco desactivado ({self.path}): {error}')
+
+    def _key(self, key) -> str:
+        return content_key((self.version, key))
+
+    def _read(self, llave: str):
+        # valor guardado (o _MISSING), sin contar aciertos ni fallos
+        if not self.enabled:
+            return _MISSING
+        try:
+            conn = self._conn()
+            row = conn.execute('SELECT valor FROM entradas WHERE llave = ?', (llave,)).fetchone()
+            if row is not None:
+                conn.execute('UPDATE entradas SET acceso = ? WHERE llave = ?', (time.time(), llave))
+        except sqlite3.Error as error:
+            self._disable(error)
+            return _MISSING
+        if row is None:
+            return _MISSING
+        try:
+            return pickle.loads(row[0])
+        except Exception:
+            # entrada ilegible (p. ej. de otra versión de pandas): se descarta
+            try:
+                self._conn().execute('DELETE FROM entradas WHERE llave = ?', (llave,))
+            except sqlite3.Error as error:
+                self._disable(error)
+            return _MISSING
+
+    def _count(self, hit: bool):
+        # las sesiones de Streamlit consultan desde varios hilos: `+=` no es atómico
+        with self._inflight_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key, default=None):
+        value = self._read(self._key(key))
+        if value is _MISSING:
+            self._count(hit=False)
+            return default
+        self._count(hit=True)
+        return value
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return
+        try:
+            conn = self._conn()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute(
+                    'INSERT OR REPLACE INTO entradas (llave, valor, bytes, acceso) VALUES (?, ?, ?, ?)',
+                    (self._key(key), blob, len(blob), time.time()),
+                )
+                # descarte LRU dentro de la misma transacción
+                total = conn.execute('SELECT COALESCE(SUM(bytes), 0) FROM entradas').fetchone()[0]
+                if total > self.max_bytes:
+                    for llave, nbytes in conn.execute('SELECT llave, bytes FROM entradas ORDER BY acceso').fetchall():
+                        conn.execute('DELETE FROM entradas WHERE llave = ?', (llave,))
+                        total -= nbytes
+                        if total <= self.max_bytes:
+                            break
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as error:
+            self._disable(error)
+
+    def delete(self, key):
+        try:
+            self._conn().execute('DELETE FROM entradas WHERE llave = ?', (self._key(key),))
+        except sqlite3.Error as error:
+            self._disable(error)
+
+    def get_or_compute(self, key, compute):
+        llave = self._key(key)
+        value = self._read(llave)
+        if value is _MISSING:
+            # un candado por llave: la primera sesión calcula, las demás leen lo que guardó
+            with self._inflight_lock:
+                lock = self._inflight.setdefault(llave, threading.Lock())
+            with lock:
+                value = self._read(llave)
+                if value is _MISSING:
+                    self._count(hit=False)
+                    try:
+                        value = compute()
+                        self.set(key, value)
+                    finally:
+                        # también si `compute` falla: el candado de la llave no se queda
+                        with self._inflight_lock:
+                            self._inflight.pop(llave, None)
+                    return value
+        self._count(hit=True)
+        return value
+
+    def stats(self) -> dict:
+        entries = nbytes = 0
+        if self.enabled:
+            try:
+                entries, nbytes = self._conn().execute(
+                    'SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM entradas').fetchone()
+            except sqlite3.Error as error:
+                self._disable(error)
+        return {'aciertos': self.hits, 'fallos': self.misses, 'entradas': entries, 'bytes': nbytes,
+                'activo': self.enabled}
+
+    def clear(self):
+        try:
+            self._conn().execute('DELETE FROM entradas')
+        except sqlite3.Error as error:
+            self._disable(error)
+
+
+# una sola instancia por proceso (el archivo se abre con la primera consulta)
+disk_cache = DiskCache()
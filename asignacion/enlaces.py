@@ -0,0 +1,94 @@
+"""
+Escenarios con dirección: el estado de las apps (ponderadores, bandas, presupuesto y archivo
+de datos) va en los parámetros de la URL.
+
+Al subir un archivo, su contenido se guarda en la biblioteca (ver `asignacion.biblioteca`) y
+la URL lleva su hash en `datos`; quien abra el enlace ve el mismo escenario sin subir el
+archivo ni capturar los valores. Los resultados salen del caché en disco compartido (ver
+`asignacion.disco`), así que un escenario "oficial" que muchas personas abren se calcula
+una sola vez.
+"""
+
+import math
+import sqlite3
+
+import streamlit as st
+
+from asignacion.biblioteca import biblioteca
+from asignacion.grafo import content_key
+
+
+def restore_widgets(widgets: dict[str, str], name: str, limites: dict[str, tuple[float, float]] | None = None):
+    """
+    En la primera corrida de la sesión, copia los parámetros de la URL a los widgets;
+    `widgets` es `parámetro -> key del widget`. Debe llamarse antes de crear los widgets.
+
+    `limites` (`parámetro -> (mínimo, máximo)`) son los `min_value`/`max_value` de cada
+    widget: `st.number_input` falla con un valor fuera de ellos, así que un enlace viejo o
+    editado a mano se ajusta al límite, con un aviso.
+    """
+    flag = f'_enlace_{name}'
+    if st.session_state.get(flag):
+        return
+    st.session_state[flag] = True
+    fuera = []
+    for param, key in widgets.items():
+        if param not in st.query_params:
+            continue
+        try:
+            valor = float(st.query_params[param])
+        except ValueError:
+            # parámetro mal formado: el widget conserva su valor por omisión
+            continue
+        if not math.isfinite(valor):
+            # NaN o infinito tampoco: valor por omisión
+            fuera.append(param)
+            continue
+        minimo, maximo = (limites or {}).get(param, (-math.inf, math.inf))
+        if not minimo <= valor <= maximo:
+            fuera.append(param)
+            valor = min(max(valor, minimo), maximo)
+        st.session_state[key] = valor
+    if fuera:
+        st.warning(f'El enlace trae valores fuera del rango del panel ({", ".join(fuera)}); '
+                   'se usan los límites del panel o sus valores por omisión.')
+
+
+def sync_url(widgets: dict[str, str], datos: str | None = None):
+    """Escribe en la URL el valor actual de los widgets y el hash del archivo de datos."""
+    params = {param: f'{float(st.session_state[key]):.15g}'
+              for param, key in widgets.items() if key in st.session_state}
+    if datos:
+        params['datos'] = datos
+    if params != st.query_params.to_dict():
+        st.query_params.from_dict(params)
+
+
+def shared_dataset(uploaded_file) -> tuple[bytes | None, str | None]:
+    """
+    Contenido y hash del archivo de datos: el que se subió o, si no hay, el del parámetro
+    `datos` de la URL (guardado en la biblioteca cuando alguien lo subió).
+    """
+    if uploaded_file is not None:
+        contenido = uploaded_file.getvalue()
+        # el archivo se guarda una vez por sesión, no en cada rerun
+        guardado = st.session_state.get('_enlace_archivo')
+        if guardado is not None and guardado[0] == uploaded_file.file_id:
+            return contenido, guardado[1]
+        try:
+            llave = biblioteca.save_data(contenido, uploaded_file.name)
+        except sqlite3.Error:
+            llave = content_key(contenido)
+        st.session_state['_enlace_archivo'] = (uploaded_file.file_id, llave)
+        return contenido, llave
+
+    llave = st.query_params.get('datos')
+    if llave:
+        try:
+            contenido = biblioteca.load_data(llave)
+        except sqlite3.Error:
+            contenido = None
+        if contenido is not None:
+            return contenido, llave
+        st.warning('El archivo de datos del enlace ya no está disponible; súbalo de nuevo.')
+    return None, None
@@ -0,0 +1,135 @@
+"""
+Lotes de escenarios para FASP y FOFISP: muchas combinaciones de ponderadores a la vez.
+
+La normalización de los indicadores no depende de los ponderadores, así que se calcula una
+sola vez (`normalized_matrix`); cada escenario es un producto matriz-vector. Los S escenarios
+se apilan como S segmentos de n Entidades Federativas y pasan juntos por el redondeo y el
+rebalanceo en centavos (ver `asignacion.centavos`), sin ciclos por escenario.
+
+Con un solo escenario el resultado es el mismo que `calculate_index` + `rebalance`.
+"""
+
+import numpy as np
+import pandas as pd
+
+from asignacion.centavos import to_centavos, to_pesos, largest_remainder, band_bounds, band_feasibility, rebalance_centavos
+from asignacion.indice import FASP_VARIABLES, direct_proportion_normalize
+
+
+def normalized_matrix(df, variable_map=None, normalize=direct_proportion_normalize) -> np.ndarray:
+    """
+    Proporciones normalizadas (n x k) en el orden de `variable_map`, más una última columna
+    de 1/n para el 'Monto base' (partes iguales).
+    """
+    variable_map = variable_map or FASP_VARIABLES
+    columns = [normalize(df[var_name], direction=direction).to_numpy(dtype=np.float64)
+               for var_name, direction in variable_map.items()]
+    columns.append(np.full(len(df), 1 / len(df)))
+    return np.column_stack(columns)
+
+
+def weight_matrix(weights, variable_map=None) -> np.ndarray:
+    """
+    Ponderadores como matriz S x (k+1) en el orden de `normalized_matrix`.
+    `weights` es un dict (un escenario) o una lista de dicts; sin 'Monto base' cuenta como 0.
+    """
+    variable_map = variable_map or FASP_VARIABLES
+    if isinstance(weights, dict):
+        weights = [weights]
+    return np.array([[w[c] for c in variable_map] + [w.get('Monto base', 0.0)] for w in weights],
+                    dtype=np.float64)
+
+
+def scenario_batch(props, weights, presupuesto, previo, lower_limit, upper_limit,
+                   max_iterations: int = 20) -> dict[str, np.ndarray]:
+    """
+    Asignación bruta y ajustada (centavos, S x n) de cada fila de `weights` (S x (k+1)).
+
+    `presupuesto`, `lower_limit` y `upper_limit` pueden ser un valor para todos los
+    escenarios o uno por escenario. `previo` es el monto de referencia de las bandas
+    (p. ej. 'Asignacion_2025', en pesos). Regresa además las iteraciones del rebalanceo de
+    cada escenario y si su total cabe en las bandas ('factible'; en los que no, la
+    asignación ajustada no suma el fondo, ver `asignacion.centavos.BandasInfactibles`).
+    """
+    props = np.asarray(props, dtype=np.float64)
+    weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+    n_scenarios, n = weights.shape[0], props.shape[0]
+    starts = np.arange(n_scenarios) * n
+    counts = np.full(n_scenarios, n)
+    presupuesto = np.broadcast_to(np.asarray(presupuesto, dtype=np.float64), (n_scenarios,))
+    lower_limit = np.broadcast_to(np.asarray(lower_limit, dtype=np.float64), (n_scenarios,))
+    upper_limit = np.broadcast_to(np.asarray(upper_limit, dtype=np.float64), (n_scenarios,))
+
+    # reparto bruto de cada escenario (pesos); la suma de ponderadores decide el total
+    bruta = weights @ props.T * presupuesto[:, None]
+    totales = to_centavos(presupuesto * weights.sum(axis=1))
+    bruta_centavos = largest_remainder(bruta.ravel() * 100, totales, starts, counts)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        reparto = bruta / bruta.sum(axis=1, keepdims=True)
+
+    previo = np.asarray(previo, dtype=np.float64)[None, :]
+    lower, upper = band_bounds(previo, lower_limit[:, None], upper_limit[:, None])
+    # un escenario con bandas infactibles no detiene al lote: se marca en 'factible'
+    ajustada, iterations = rebalance_centavos(
+        bruta_centavos, reparto.ravel(), lower.ravel(), upper.ravel(),
+        starts, counts, max_iterations=max_iterations, estricto=False,
+    )
+    return {
+        'bruta': bruta_centavos.reshape(n_scenarios, n),
+        'ajustada': ajustada.reshape(n_scenarios, n),
+        'iteraciones': iterations,
+        'factible': band_feasibility(bruta_centavos, lower.ravel(), upper.ravel(), starts, counts),
+    }
+
+
+def perturbed_weights(weights, draws: int, dispersion: float, seed=None) -> np.ndarray:
+    """
+    `draws` variaciones de un vector de ponderadores (k+1): cada peso se multiplica por un
+    factor log-normal con desviación `dispersion` y el vector se re-escala para conservar
+    la suma original. Los pesos en cero siguen en cero.
+    """
+    weights = np.asarray(weights, dtype=np.float64).ravel()
+    rng = np.random.default_rng(seed)
+    sample = weights * np.exp(rng.normal(0.0, dispersion, size=(draws, weights.size)))
+    return sample * (weights.sum() / sample.sum(axis=1, keepdims=True))
+
+
+def monte_carlo_chunk(props, weights, presupuesto, previo, lower_limit, upper_limit,
+                      draws: int, dispersion: float, seed=None) -> np.ndarray:
+    """Un bloque de la simulación: asignación ajustada (centavos, draws x n)."""
+    sample = perturbed_weights(weights, draws, dispersion, seed)
+    return scenario_batch(props, sample, presupuesto, previo, lower_limit, upper_limit)['ajustada']
+
+
+def monte_carlo_chunks(props, weights, presupuesto, previo, lower_limit, upper_limit,
+                       draws: int, dispersion: float, chunk_size: int = 1_000, seed: int = 0) -> list[tuple]:
+    """
+    Argumentos de `monte_carlo_chunk` para cada bloque de una simulación de `draws`
+    escenarios. Cada bloque tiene su propia semilla derivada de `seed`, así que el
+    resultado no depende del orden en que se ejecuten.
+    """
+    sizes = [chunk_size] * (draws // chunk_size) + ([draws % chunk_size] if draws % chunk_size else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    previo = np.asarray(previo, dtype=np.float64)
+    return [(props, weights, presupuesto, previo, lower_limit, upper_limit, size, dispersion, s)
+            for size, s in zip(sizes, seeds)]
+
+
+def sensitivity_summary(ajustadas, previo, lower_limit, upper_limit, entidades=None) -> pd.DataFrame:
+    """
+    Resumen por Entidad Federativa de una simulación (ajustadas en centavos, S x n): media,
+    percentiles 5 y 95 en pesos y la fracción de escenarios topados en cada banda.
+    """
+    ajustadas = np.asarray(ajustadas, dtype=np.int64)
+    lower, upper = band_bounds(previo, lower_limit, upper_limit)
+    pesos = to_pesos(ajustadas)
+    p05, p95 = np.percentile(pesos, [5, 95], axis=0)
+    return pd.DataFrame({
+        'Entidad_Federativa': entidades if entidades is not None else np.arange(ajustadas.shape[1]),
+        'Media': pesos.mean(axis=0),
+        'P05': p05,
+        'P95': p95,
+        'Topado_inferior': (ajustadas == lower).mean(axis=0),
+        'Topado_superior': (ajustadas == upper).mean(axis=0),
+    })
@@ -0,0 +1,93 @@
+"""
+Descarga de resultados en un ZIP que se arma sólo cuando alguien lo pide.
+
+El botón "Resultados.zip" del FORTAMUN armaba el archivo en cada rerun, aunque nadie lo
+descargara: `write_csv(file=None)` de cada tabla como str completo, su copia en latin1 y
+el ZIP en un `BytesIO`. Aquí:
+
+- `zip_download` regresa una función sin argumentos para `st.download_button(data=...)`;
+  Streamlit la llama (en otro hilo) hasta que se da clic al botón;
+- cada tabla se escribe directo en su entrada del ZIP (`ZipFile.open(nombre, 'w')`): polars
+  escribe el CSV por bloques desde sus columnas de Arrow y cada bloque se pasa a latin1 al
+  vuelo, así que el CSV completo nunca existe como str ni como bytes;
+- el CSV sigue en latin1 (Excel en español lo abre con acentos) y opcionalmente se agregan
+  Parquet y XLSX;
+- el ZIP se guarda en el caché en disco (ver `asignacion.disco`) con el hash del contenido de
+  las tablas y los formatos: el mismo resultado, de ésta u otra sesión, no se vuelve a armar.
+"""
+
+import codecs
+import io
+import zipfile
+
+from asignacion.disco import disk_cache
+from asignacion.grafo import content_key
+
+
+FORMATOS = ['csv', 'parquet', 'xlsx']
+
+
+class _Recodificar:
+    """Archivo de escritura que recibe bytes en UTF-8 y los escribe en `codificacion`."""
+
+    def __init__(self, destino, codificacion: str):
+        self.destino = destino
+        self.codificacion = codificacion
+        # un bloque puede cortar un carácter de varios bytes a la mitad
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+
+    def write(self, datos) -> int:
+        texto = self.decoder.decode(bytes(datos))
+        self.destino.write(texto.encode(self.codificacion, errors='replace'))
+        return len(datos)
+
+    def flush(self):
+        self.destino.write(self.decoder.decode(b'', final=True).encode(self.codificacion, errors='replace'))
+
+
+def write_csv(frame, destino, codificacion: str = 'latin1'):
+    """
+    CSV de un DataFrame de polars escrito por bloques en `destino` (archivo binario). Los
+    caracteres que no existen en `codificacion` se escriben como '?'.
+    """
+    salida = _Recodificar(destino, codificacion)
+    frame.write_csv(salida)
+    salida.flush()
+
+
+def write_zip(destino, tablas: dict, formatos=('csv',)):
+    """
+    ZIP con cada tabla (`nombre -> DataFrame de polars`) en los `formatos` pedidos; el CSV
+    se comprime y Parquet y XLSX, que ya vienen comprimidos, se guardan tal cual.
+    """
+    with zipfile.ZipFile(destino, 'w') as archivo:
+        for nombre, frame in tablas.items():
+            if 'csv' in formatos:
+                info = zipfile.ZipInfo(f'{nombre}.csv')
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with archivo.open(info, 'w') as entrada:
+                    write_csv(frame, entrada)
+            if 'parquet' in formatos:
+                with archivo.open(f'{nombre}.parquet', 'w') as entrada:
+                    frame.write_parquet(entrada)
+            if 'xlsx' in formatos:
+                with archivo.open(f'{nombre}.xlsx', 'w') as entrada:
+                    frame.write_excel(entrada, worksheet=nombre)
+
+
+def zip_bytes(tablas: dict, formatos=('csv',)) -> bytes:
+    """`write_zip` en bytes, del caché en disco si ese contenido ya se exportó."""
+    formatos = tuple(f for f in FORMATOS if f in formatos) or ('csv',)
+    llave = ('exportar', tuple(tablas), tuple(content_key(frame) for frame in tablas.values()), formatos)
+
+    def armar():
+        buffer = io.BytesIO()
+        write_zip(buffer, tablas, formatos)
+        return buffer.getvalue()
+
+    return disk_cache.get_or_compute(llave, armar)
+
+
+def zip_download(tablas: dict, formatos=('csv',)):
+    """Función para `st.download_button(data=...)`: arma (o lee del caché) el ZIP al descargar."""
+    return lambda: zip_bytes(tablas, formatos)
@@ -0,0 +1,206 @@
+"""
+Archivos de entrada de FASP y FOFISP: CSV, Parquet o Arrow IPC, con un esquema declarado.
+
+Con `pd.read_csv` cada carga volvía a interpretar el texto y a adivinar los tipos; si un
+indicador llegaba como texto, el error aparecía hasta la tabla formateada (el `*100` de la
+Tabla 2). Aquí `read_dataset` reconoce el formato por sus primeros bytes:
+
+- Parquet y Arrow IPC (archivo o stream) ya traen sus tipos: se leen sin interpretar texto;
+- CSV se lee con pyarrow y los tipos del esquema, en la misma pasada que lo interpreta (los
+  decimales se redondean correctamente, como `float_precision='round_trip'` de pandas, así
+  que un CSV y el Parquet convertido de él dan los mismos números). Las columnas enteras se
+  leen como float, porque Excel y pandas escriben 4 como "4.0"; al validar se revisa que no
+  tengan decimales.
+
+En los dos casos la tabla se valida contra el esquema del fondo (columnas presentes, tipo
+convertible sin pérdida, sin vacíos donde no se permiten) antes de pasar a pandas; cualquier
+problema se reporta junto en `DatosInvalidos`. Las columnas fuera del esquema pasan igual.
+
+Para convertir los archivos que hoy llegan en CSV o Excel (validándolos):
+
+    python -m asignacion.formatos fasp.csv --fondo FASP --salida fasp.parquet
+    python -m asignacion.formatos fofisp.xlsx --fondo FOFISP --salida fofisp.arrow
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from asignacion.indice import FASP_VARIABLES, FOFISP_VARIABLES
+
+
+class DatosInvalidos(ValueError):
+    """El archivo subido no cumple el esquema del fondo."""
+
+
+def _schema(variables, enteros=()) -> pa.Schema:
+    return pa.schema(
+        [pa.field('Entidad_Federativa', pa.string(), nullable=False)]
+        + [pa.field(v, pa.int64() if v in enteros else pa.float64()) for v in variables]
+        + [pa.field('Asignacion_2025', pa.float64(), nullable=False)]
+    )
+
+
+FASP_SCHEMA = _schema(FASP_VARIABLES)
+FOFISP_SCHEMA = _schema(FOFISP_VARIABLES, enteros=('Academias',))
+SCHEMAS = {'FASP': FASP_SCHEMA, 'FOFISP': FOFISP_SCHEMA}
+
+# nombres anteriores de las columnas del esquema
+ALIAS = {'Entidad': 'Entidad_Federativa'}
+
+# extensiones que aceptan los file_uploader de las apps
+UPLOAD_TYPES = ['csv', 'parquet', 'arrow', 'feather', 'ipc']
+
+
+def csv_types(schema: pa.Schema) -> dict:
+    """
+    Tipos con que se leen de un CSV las columnas del esquema (y sus nombres anteriores). Las
+    enteras se leen como float64: "4.0" no es un int64 válido para pyarrow.
+    """
+    tipos = {f.name: pa.float64() if pa.types.is_integer(f.type) else f.type for f in schema}
+    tipos.update({alias: tipos[nombre] for alias, nombre in ALIAS.items() if nombre in tipos})
+    return tipos
+
+
+def whole_numbers(column, field: pa.Field, inicio: int = 0):
+    """
+    `column` (float) en el tipo entero de `field`; `DatosInvalidos` si algún valor tiene
+    decimales. `inicio` son las filas anteriores a `column` (para leer por bloques).
+    """
+    decimales = pc.indices_nonzero(pc.fill_null(pc.not_equal(pc.trunc(column), column), False))
+    if len(decimales):
+        fila = decimales[0].as_py()
+        raise DatosInvalidos(f'{field.name!r} debe tener números enteros: {len(decimales)} '
+                             f'{"valor" if len(decimales) == 1 else "valores"} con decimales '
+                             f'(p. ej. {column[fila].as_py()} en la fila {inicio + fila + 1})')
+    return pc.cast(column, field.type, safe=True)
+
+
+def _leer(archivo: bytes, schema: pa.Schema) -> pa.Table:
+    import pyarrow.csv as csv
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+
+    buffer = pa.BufferReader(archivo)
+    if archivo[:4] == b'PAR1':
+        return pq.read_table(buffer)
+    if archivo[:6] == b'ARROW1':
+        return ipc.open_file(buffer).read_all()
+    if archivo[:4] == b'\xff\xff\xff\xff':
+        return ipc.open_stream(buffer).read_all()
+    # CSV: las columnas del esquema con su tipo, las demás como las infiera pyarrow
+    return csv.read_csv(buffer, convert_options=csv.ConvertOptions(column_types=csv_types(schema)))
+
+
+def read_as_text(archivo: bytes, schema: pa.Schema) -> pa.Table | None:
+    """
+    El CSV `archivo` con las columnas del esquema como texto (None si no es CSV), para
+    ubicar los valores que no se pudieron leer con su tipo (ver `asignacion.validacion`).
+    """
+    import pyarrow.csv as csv
+
+    if archivo[:4] in (b'PAR1', b'\xff\xff\xff\xff') or archivo[:6] == b'ARROW1':
+        return None
+    # los mismos vacíos que en la lectura con tipos
+    opciones = csv.ConvertOptions(column_types={nombre: pa.string() for nombre in csv_types(schema)},
+                                  strings_can_be_null=True)
+    return csv.read_csv(pa.BufferReader(archivo), convert_options=opciones)
+
+
+def validate(table: pa.Table, schema: pa.Schema) -> pa.Table:
+    """
+    `table` con las columnas del esquema en su tipo; `DatosInvalidos` con todos los
+    problemas (columnas faltantes, tipos no convertibles, vacíos) si los hay.
+    """
+    table = table.rename_columns([ALIAS[c] if c in ALIAS and ALIAS[c] not in table.column_names else c
+                                  for c in table.column_names])
+    errores = [f'falta la columna {f.name!r}' for f in schema if f.name not in table.column_names]
+
+    for field in schema:
+        if field.name not in table.column_names:
+            continue
+        i = table.column_names.index(field.name)
+        column = table.column(i)
+        if column.type != field.type:
+            try:
+                if pa.types.is_integer(field.type) and pa.types.is_floating(column.type):
+                    # enteros leídos como float (ver `csv_types`)
+                    column = whole_numbers(column, field)
+                else:
+                    column = pc.cast(column, field.type, safe=True)
+            except DatosInvalidos as error:
+                errores.append(str(error))
+                continue
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as error:
+                errores.append(f'{field.name!r} ({column.type}) no se puede leer como {field.type}: {error}')
+                continue
+            table = table.set_column(i, field, column)
+        if not field.nullable and column.null_count:
+            errores.append(f'{field.name!r} tiene {column.null_count} valores vacíos')
+
+    if errores:
+        raise DatosInvalidos('; '.join(errores))
+    return table
+
+
+def read_table(archivo: bytes, schema: pa.Schema) -> pa.Table:
+    """Tabla de Arrow validada de un archivo CSV, Parquet o Arrow IPC (en bytes)."""
+    try:
+        table = _leer(archivo, schema)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as error:
+        raise DatosInvalidos(str(error)) from error
+    return validate(table, schema)
+
+
+def read_dataset(archivo: bytes, schema: pa.Schema):
+    """`read_table` como DataFrame de pandas, en lugar de `pd.read_csv(io.BytesIO(archivo))`."""
+    return read_table(archivo, schema).to_pandas()
+
+
+def convert(entrada: Path, salida: Path, schema: pa.Schema, hoja=None) -> pa.Table:
+    """
+    CSV, Excel, Parquet o Arrow -> Parquet (`.parquet`) o Arrow IPC (`.arrow`, `.feather`,
+    `.ipc`), validado contra `schema`. Las columnas del esquema van primero.
+    """
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+
+    if entrada.suffix.lower() in ('.xlsx', '.xls'):
+        import polars as pl
+        table = validate(pl.read_excel(entrada, sheet_name=hoja).to_arrow(), schema)
+    else:
+        table = read_table(entrada.read_bytes(), schema)
+    table = table.select(schema.names + [c for c in table.column_names if c not in schema.names])
+
+    if salida.suffix.lower() == '.parquet':
+        pq.write_table(table, salida)
+    elif salida.suffix.lower() in ('.arrow', '.feather', '.ipc'):
+        with ipc.new_file(salida, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        raise ValueError(f'formato de salida no soportado: {salida.suffix!r} (.parquet o .arrow)')
+    return table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convierte CSV/Excel a Parquet o Arrow con el esquema del fondo')
+    parser.add_argument('entrada', type=Path)
+    parser.add_argument('--fondo', choices=list(SCHEMAS), required=True)
+    parser.add_argument('--salida', type=Path, required=True, help='archivo .parquet o .arrow')
+    parser.add_argument('--hoja', help='hoja del Excel (por omisión la primera)')
+    args = parser.parse_args(argv)
+
+    try:
+        table = convert(args.entrada, args.salida, SCHEMAS[args.fondo], args.hoja)
+    except DatosInvalidos as error:
+        print(f'{args.entrada}: {error}', file=sys.stderr)
+        return 1
+    print(f'{args.salida}: {table.num_rows} filas, {table.num_columns} columnas')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""
+Figuras de Plotly con esqueleto en caché, compartido por todas las sesiones del proceso.
+
+Armar una gráfica con plotly express (melt, `px.bar`, `update_traces`/`update_layout` y la
+validación de cada propiedad) cuesta decenas de milisegundos por rerun, aunque entre
+corridas sólo cambian los montos. Aquí la figura con todo su estilo se arma una vez por
+proceso y se guarda como esqueleto (el dict de la figura sin sus arreglos de datos); las
+corridas siguientes parten del esqueleto y sólo reemplazan los arreglos de cada traza, sin
+volver a validar.
+
+Los montos se pasan como arreglos numpy, que plotly serializa como arreglos tipados
+(base64) y no como listas de números en texto. Las etiquetas de las barras deben usar
+`texttemplate` sobre `%{y}`: así no se envía una segunda copia de los montos en `text`.
+"""
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from asignacion.grafo import code_key
+from asignacion.tablas import RenderCache
+
+# propiedades de una traza que cambian con los datos; no se guardan en el esqueleto
+DATA_KEYS = ('y', 'text', 'customdata')
+
+# los esqueletos son pocos y pequeños (uno por gráfica y orden de categorías)
+figure_cache = RenderCache(max_bytes=16 * 2**20)
+
+
+def _skeleton(fig: go.Figure) -> dict:
+    figure = fig.to_dict()
+    data = [{k: v for k, v in trace.items() if k not in DATA_KEYS} for trace in figure['data']]
+    return {'data': data, 'layout': figure['layout']}
+
+
+def _merge(base: dict, update: dict) -> dict:
+    # copia de `base` con `update` encima; los dicts anidados se combinan, no se reemplazan
+    merged = dict(base)
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            value = _merge(merged[key], value)
+        merged[key] = value
+    return merged
+
+
+def cached_figure(build, frame, traces: list[dict], layout: dict | None = None, key=()) -> go.Figure:
+    """
+    Figura armada sobre el esqueleto de `build(frame)`.
+
+    `build` arma la figura completa (con plotly express o `go`) y sólo se llama la primera
+    vez. El esqueleto se guarda por el código de `build` más `key`, que debe incluir lo que
+    cambie la estructura de la figura (p. ej. las categorías del eje x). `traces[i]` se
+    aplica a la traza i (`{'y': montos}` o `{'y': var, 'marker': {'color': colores}}`) y
+    `layout` al layout (p. ej. un título que depende de las bandas). Los colores por barra
+    se quedan en el esqueleto, así que si dependen de los datos deben pasarse siempre.
+    """
+    skeleton = figure_cache.get_or_render(
+        ('figura', code_key(build), key),
+        lambda: _skeleton(build(frame)),
+        lambda s: len(pio.to_json(s, validate=False)),
+    )
+    if len(traces) != len(skeleton['data']):
+        raise ValueError(f"La figura {key!r} tiene {len(skeleton['data'])} trazas, no {len(traces)}")
+
+    data = [
+        _merge(trace, {k: np.asarray(v) if k in ('y', 'customdata') else v for k, v in update.items()})
+        for trace, update in zip(skeleton['data'], traces)
+    ]
+    figure = {'data': data, 'layout': _merge(skeleton['layout'], layout or {})}
+    # el esqueleto ya pasó la validación al armarse con `build`
+    return go.Figure(figure, _validate=False)
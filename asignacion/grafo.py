@@ -0,0 +1,156 @@
+"""
+Grafo de cálculo incremental para las apps de Streamlit.
+
+Cada rerun de Streamlit ejecuta el script completo. El grafo declara los pasos del cálculo
+(lectura, índice, rebalanceo, tablas, gráfica) como nodos con sus dependencias y guarda el
+último resultado de cada nodo junto con una llave de contenido. Un nodo sólo se recalcula
+si cambia la llave de alguna de sus entradas; p. ej. mover la banda superior no vuelve a
+leer el archivo ni a calcular el índice.
+
+La llave de una entrada es un hash de su contenido; la de un nodo combina su nombre con
+las llaves de sus dependencias, así que no hace falta volver a hashear resultados grandes.
+Los nodos no deben modificar sus entradas: los valores en memoria se comparten entre reruns.
+
+Los nodos marcados con `persist=True` se buscan además en un caché en disco (ver
+`asignacion.disco`) cuando no están en la memoria de la sesión; ahí la llave incluye el
+código de la función del nodo, para que un cambio en la app no reutilice resultados viejos.
+"""
+
+import hashlib
+import pickle
+import time
+import types
+
+import numpy as np
+import pandas as pd
+
+from asignacion.medicion import mark, record
+
+def content_key(value) -> str:
+    """Hash del contenido de una entrada (bytes, DataFrame de pandas o polars, arreglo, lista/tupla o valor simple)."""
+    h = hashlib.blake2b(digest_size=16)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        h.update(value)
+    elif isinstance(value, pd.DataFrame):
+        h.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        h.update(repr(list(value.columns)).encode())
+    elif type(value).__module__.startswith('polars') and hasattr(value, 'hash_rows'):
+        # DataFrame de polars: el hash de cada fila (estable dentro de una versión de
+        # polars, que va en la llave) y el esquema, sin serializar el DataFrame
+        import polars as pl
+        h.update(value.hash_rows(seed=0).to_numpy().tobytes())
+        h.update(repr((pl.__version__, value.schema)).encode())
+    elif isinstance(value, np.ndarray):
+        h.update(np.ascontiguousarray(value).tobytes())
+        h.update(repr((value.dtype, value.shape)).encode())
+    elif isinstance(value, (list, tuple)):
+        # elemento por elemento: un arreglo se hashea por su contenido y no por su pickle,
+        # que cambia si el arreglo es de sólo lectura (p. ej. leído del caché en disco)
+        h.update(f'{type(value).__name__}:{len(value)}'.encode())
+        for item in value:
+            h.update(content_key(item).encode())
+    else:
+        h.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    return h.hexdigest()
+
+
+def code_key(func) -> str:
+    """Hash del código de una función: si cambia la función, cambia la llave."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(func.__qualname__.encode())
+    _hash_code(h, func.__code__)
+    return h.hexdigest()
+
+
+def _hash_code(h, code):
+    # el repr de un code object anidado (lambda, comprehension) lleva su dirección en
+    # memoria y el de un frozenset (`x in {...}`) su orden de hash, que cambian entre
+    # procesos: se hashea su contenido
+    h.update(code.co_code)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _hash_code(h, const)
+        elif isinstance(const, frozenset):
+            h.update(repr(sorted(map(repr, const))).encode())
+        else:
+            h.update(repr(const).encode())
+
+
+class Grafo:
+    """
+    Conjunto de nodos `nombre -> (función, dependencias)`.
+
+    Las dependencias son nombres de otros nodos o de entradas que se pasan a `run`.
+    La memoria (un dict) la provee quien ejecuta, normalmente `st.session_state`, para que
+    sobreviva entre reruns de la misma sesión. `disco` (opcional) es el caché persistente
+    de los nodos con `persist=True`; lo comparten todas las sesiones y los reinicios.
+    """
+
+    def __init__(self, disco=None):
+        self.nodes = {}
+        self.persist = set()
+        self.disco = disco
+
+    def node(self, *deps, name=None, persist=False):
+        """Decorador: registra la función como nodo; sus argumentos son `deps` en orden."""
+        def register(func):
+            self.nodes[name or func.__name__] = (func, deps)
+            if persist:
+                self.persist.add(name or func.__name__)
+            return func
+        return register
+
+    def run(self, memoria: dict, targets, **inputs) -> tuple[dict, list[dict]]:
+        """
+        Evalúa `targets` (y sólo lo que necesitan) con las entradas dadas.
+
+        Regresa los valores de los nodos evaluados y la bitácora de ejecución: una fila por
+        nodo con su estado ('calculado', 'memoria' o 'disco') y el tiempo en milisegundos.
+        """
+        keys = {name: content_key(value) for name, value in inputs.items()}
+        values = dict(inputs)
+        bitacora = []
+
+        def evaluate(name):
+            if name in values and name in keys:
+                return
+            func, deps = self.nodes[name]
+            for dep in deps:
+                evaluate(dep)
+
+            key = hashlib.blake2b(
+                '|'.join([name] + [keys[d] for d in deps]).encode(), digest_size=16,
+            ).hexdigest()
+            inicio = mark()
+            start = time.perf_counter()
+            cached = memoria.get(name)
+            if cached is not None and cached[0] == key:
+                values[name] = cached[1]
+                estado = 'memoria'
+            else:
+                if name in self.persist and self.disco is not None:
+                    computed = []
+
+                    def compute():
+                        computed.append(True)
+                        return func(*(values[d] for d in deps))
+
+                    values[name] = self.disco.get_or_compute(('nodo', key, code_key(func)), compute)
+                    estado = 'calculado' if computed else 'disco'
+                else:
+                    values[name] = func(*(values[d] for d in deps))
+                    estado = 'calculado'
+                memoria[name] = (key, values[name])
+            keys[name] = key
+            bitacora.append({
+                'Nodo': name,
+                'Dependencias': ', '.join(deps),
+                'Estado': estado,
+                'Tiempo (ms)': (time.perf_counter() - start) * 1000,
+            })
+            record(name, bitacora[-1]['Tiempo (ms)'], estado, inicio)
+
+        for target in ([targets] if isinstance(targets, str) else targets):
+            evaluate(target)
+
+        return values, bitacora
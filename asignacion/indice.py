@@ -0,0 +1,178 @@
+"""
+Índice de Proporciones Directas Ponderadas y rebalanceo por bandas para FASP y FOFISP.
+
+Las funciones de normalización son las mismas que vivían dentro de las apps; el índice y
+el rebalanceo regresan los montos en centavos enteros (ver `asignacion.centavos`).
+"""
+
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from asignacion.centavos import to_centavos, to_pesos, largest_remainder, band_bounds, rebalance_centavos
+
+
+# dirección de cada indicador (Alto=Bueno -> 'positive', Alto=Malo -> 'negative')
+FASP_VARIABLES = {
+    'Pob': 'positive', 'Tasa_policial': 'positive', 'Profesionalizacion': 'positive',
+    'Ctrl_conf': 'positive', 'Disp_camaras': 'positive', 'Disp_lectores_veh': 'positive',
+    'Cump_presup': 'positive', 'Servs_forenses': 'positive', 'Eficiencia_procesal': 'positive',
+    'Inc_del': 'positive', 'Dig_salarial': 'positive',
+    'Tasa_abandono_llamadas': 'negative', 'Sobrepob_penitenciaria': 'negative',
+    'Proc_justicia': 'negative',
+}
+
+FOFISP_VARIABLES = {
+    'Población': 'positive',
+    'Var_incidencia_del': 'negative',
+    'Tasa_policial': 'positive',
+    'Academias': 'positive',
+}
+
+
+def direct_proportion_normalize(series, direction='positive'):
+    """
+    Normaliza una serie de datos usando el método de Proporción Directa (Normalización a la Suma).
+    Implementa un 'shift' para asegurar que todos los valores sean no negativos.
+
+    - Si la dirección es 'positive' (Alto=Bueno), usa Proporción Directa.
+    - Si la dirección es 'negative' (Alto=Malo), usa una Proporción Inversa Suavizada
+    (penalizando valores altos) basada en la fórmula R/(R+X) donde R es la media + std.
+    """
+    if not isinstance(series, pd.Series):
+        series = pd.Series(series)
+
+    # corrimiento de prom + 3*stdev sólo si hay valores negativos
+    R = series.mean() + series.std()*3
+    shifted_series = series + R if series.min() < 0 else series
+
+    if direction == 'positive':
+        total_sum = shifted_series.sum()
+        if total_sum == 0:
+            return pd.Series(1.0 / len(shifted_series), index=shifted_series.index)
+        return shifted_series / total_sum
+
+    elif direction == 'negative':
+        penalized_series = 1 / shifted_series
+        total_sum_penalized = penalized_series.sum()
+        if total_sum_penalized == 0:
+            return pd.Series(1.0 / len(shifted_series), index=shifted_series.index)
+        return penalized_series / total_sum_penalized
+
+
+def shifted_proportion_normalize(series, direction='positive'):
+    """
+    Normaliza una serie de datos (variante FOFISP de la app Fondos).
+    - 'positive' (Alto=Bueno): Proporción directa.
+    - 'negative' (Alto=Malo): Proporción inversa (1/X) suavizada.
+    """
+    if not isinstance(series, pd.Series):
+        series = pd.Series(series)
+
+    # corrimiento para evitar divisiones entre cero o valores negativos
+    R = series.abs().max() * 0.01 + 1e-6
+    shifted_series = series + R
+    normalized_base = 1 / shifted_series if direction == 'negative' else shifted_series
+
+    total_sum = normalized_base.sum()
+    if total_sum == 0:
+        return pd.Series(1.0 / len(normalized_base), index=normalized_base.index)
+    return normalized_base / total_sum
+
+
+def calculate_index(df, weights, presupuesto, variable_map=None, normalize=direct_proportion_normalize):
+    """
+    Calcula la Asignación de Fondo Ponderada (Reparto Directo) y la contribución monetaria por variable.
+
+    Si `weights` incluye 'Monto base', esa fracción del fondo se reparte en partes iguales.
+    'Asignacion_Bruta_centavos' suma exactamente el fondo ponderado (en centavos) y
+    'Asignacion_Bruta' es el mismo monto en pesos.
+
+    Regresa un DataFrame nuevo (`df` no se modifica) con las columnas de `df`, la proporción
+    y el monto de cada indicador; es la sábana completa. Para calcular sólo la asignación,
+    `index_allocation` no arma esas columnas.
+    """
+    variable_map = variable_map or FASP_VARIABLES
+    props = {}
+    contributions = {}
+
+    for var_name, direction in variable_map.items():
+        # 1. normalización
+        props[f'{var_name}_prop'] = normalize(df[var_name], direction=direction)
+        # 2. contribución monetaria ponderada (proporción * peso * fondo)
+        contributions[f'Monto_{var_name}'] = props[f'{var_name}_prop'] * weights[var_name] * presupuesto
+
+    # monto base en partes iguales
+    if 'Monto base' in weights:
+        base_share = presupuesto * weights['Monto base'] / len(df)
+        contributions['Monto_Base'] = pd.Series(base_share, index=df.index)
+
+    # asignación bruta en centavos con suma exacta (residuo mayor)
+    bruta = sum(contributions.values())
+    total_ponderado = presupuesto * (sum(weights[c] for c in variable_map) + weights.get('Monto base', 0))
+    props['Asignacion_Bruta_centavos'] = largest_remainder(bruta.to_numpy() * 100, to_centavos(total_ponderado))
+    props['Asignacion_Bruta'] = to_pesos(props['Asignacion_Bruta_centavos'])
+
+    # reparto que suma 1.00, base para redistribuir el remanente
+    contributions['Reparto'] = bruta / bruta.sum()
+
+    # una sola concatenación en vez de insertar columna por columna en `df`
+    return pd.concat([df, pd.DataFrame(props, index=df.index), pd.DataFrame(contributions)], axis=1)
+
+
+def index_allocation(props, weights, presupuesto, variable_map=None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Asignación bruta (centavos, suma exacta) y reparto de `calculate_index`, como arreglos.
+
+    `props` son las proporciones normalizadas de `asignacion.escenarios.normalized_matrix`
+    (n x (k+1), la última columna es el 'Monto base'); no se arma ninguna columna por
+    indicador ni se copia el DataFrame de entrada.
+    """
+    variable_map = variable_map or FASP_VARIABLES
+    w = np.array([weights[c] for c in variable_map] + [weights.get('Monto base', 0.0)], dtype=np.float64)
+    bruta = np.asarray(props, dtype=np.float64) @ w * presupuesto
+    total_ponderado = presupuesto * (sum(weights[c] for c in variable_map) + weights.get('Monto base', 0))
+    return largest_remainder(bruta * 100, to_centavos(total_ponderado)), bruta / bruta.sum()
+
+
+def rebalance(df, lower_limit, upper_limit, reference='Asignacion_2025', max_iterations=20):
+    """
+    Rebalanceo de remanente con bandas de control respecto a `reference`.
+
+    Regresa la asignación ajustada en centavos y el número de iteraciones; lanza
+    `BandasInfactibles` (ver `asignacion.centavos`) si el total no cabe en las bandas.
+    """
+    lower, upper = band_bounds(df[reference].to_numpy(), lower_limit, upper_limit)
+    ajustada, iterations = rebalance_centavos(
+        df['Asignacion_Bruta_centavos'].to_numpy(), df['Reparto'].to_numpy(),
+        lower, upper, max_iterations=max_iterations,
+    )
+    return ajustada, int(iterations[0])
+
+
+# motor de la normalización, el índice y el rebalanceo en las apps: 'pandas' (numpy) o
+# 'polars' (expresiones de polars, ver asignacion.columnar); dan los mismos centavos
+MOTOR = os.getenv('ASIGNACION_MOTOR', 'pandas').strip().lower()
+
+
+def allocation_engine(motor: str | None = None) -> SimpleNamespace:
+    """
+    `normalized_matrix`, `index_allocation`, `calculate_index` y `rebalance` del motor
+    elegido (por omisión `ASIGNACION_MOTOR`). polars sólo se importa si se pide ese motor.
+    """
+    motor = motor or MOTOR
+    if motor == 'polars':
+        from asignacion import columnar
+        return SimpleNamespace(
+            normalized_matrix=columnar.normalized_matrix, index_allocation=columnar.index_allocation,
+            calculate_index=columnar.calculate_index, rebalance=columnar.rebalance,
+        )
+    if motor != 'pandas':
+        raise ValueError(f"ASIGNACION_MOTOR debe ser 'pandas' o 'polars', no {motor!r}")
+    from asignacion.escenarios import normalized_matrix
+    return SimpleNamespace(
+        normalized_matrix=normalized_matrix, index_allocation=index_allocation,
+        calculate_index=calculate_index, rebalance=rebalance,
+    )
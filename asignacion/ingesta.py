@@ -0,0 +1,279 @@
+"""
+Ingesta por lotes de archivos grandes (municipales, por localidad o de varios años) a Parquet.
+
+Las apps leían el archivo completo de una vez (`uploaded_file.getvalue()` y `pl.read_excel`
+o `pd.read_csv`): el contenido en bytes, su copia y el DataFrame convivían en memoria, lo
+que basta para 32 Entidades pero no para un archivo por localidad o con varios años. Aquí
+el archivo se convierte a Parquet sin tenerlo completo en memoria:
+
+- CSV: con el lector por bloques de pyarrow (`LOTE_BYTES` por bloque); los bloques se
+  juntan en grupos de `FILAS_POR_GRUPO` filas y cada grupo se escribe al Parquet;
+- Excel: una hoja a la vez (`pl.read_excel` de esa hoja, con los mismos tipos que antes);
+  con varias hojas (p. ej. una por año) se agrega la columna `Hoja`;
+- Parquet o Arrow: por grupos de filas (o lotes), sólo para validarlos y reescribirlos.
+
+El avance se reporta con `progreso(fraccion, mensaje)`: bytes leídos para CSV, hojas
+leídas para Excel. La memoria queda acotada, sin importar el tamaño del archivo, por los
+bloques que pyarrow lee por adelantado (unas decenas: ~40 MB con bloques de 1 MB) más un
+grupo de filas (CSV), o por la hoja más grande (Excel); después se lee del Parquet sólo lo
+que hace falta (p. ej. `pl.scan_parquet(ruta).select(...)`).
+
+`ingest_upload` guarda el resultado en `ASIGNACION_INGESTA` (por omisión
+`~/.cache/asignacion/ingesta`) con el hash del contenido como nombre, así que volver a
+subir el mismo archivo no lo vuelve a convertir. Desde la línea de comandos:
+
+    python -m asignacion.ingesta localidades.csv --salida localidades.parquet
+    python -m asignacion.ingesta municipios_2020_2025.xlsx --todas --salida municipios.parquet
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pyarrow as pa
+
+from asignacion.formatos import DatosInvalidos, csv_types, whole_numbers
+
+
+# bloque del lector de CSV (pyarrow lee varios por adelantado) y filas por grupo del Parquet
+LOTE_BYTES = 2**20
+FILAS_POR_GRUPO = 128 * 1024
+
+DIRECTORIO = Path(os.environ.get('ASIGNACION_INGESTA') or Path.home() / '.cache' / 'asignacion' / 'ingesta')
+
+_EXCEL = (b'PK\x03\x04', b'\xd0\xcf\x11\xe0')
+
+
+def _sin_progreso(fraccion, mensaje):
+    pass
+
+
+def _tamaño(fuente) -> int:
+    fuente.seek(0, os.SEEK_END)
+    tamaño = fuente.tell()
+    fuente.seek(0)
+    return tamaño
+
+
+def _csv_batches(fuente, schema, progreso, block_size):
+    import pyarrow.csv as csv
+
+    total = _tamaño(fuente) or 1
+    tipos = csv_types(schema) if schema is not None else None
+    # columnas enteras del esquema: se leen como float y se convierten en cada lote
+    enteros = [f for f in schema if pa.types.is_integer(f.type)] if schema is not None else []
+    lector = None
+    filas = 0
+    try:
+        lector = csv.open_csv(
+            fuente,
+            read_options=csv.ReadOptions(block_size=block_size),
+            convert_options=csv.ConvertOptions(column_types=tipos),
+        )
+        for batch in lector:
+            progreso(min(fuente.tell() / total, 1.0), f'{fuente.tell() / 2**20:,.1f} de {total / 2**20:,.1f} MB')
+            for field in enteros:
+                i = batch.schema.get_field_index(field.name)
+                if i >= 0:
+                    batch = batch.set_column(i, field, whole_numbers(batch.column(i), field, filas))
+            filas += batch.num_rows
+            yield batch
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as error:
+        # las columnas fuera del esquema toman su tipo del primer bloque: un valor distinto
+        # más adelante falla aquí; en las del esquema, el valor no es del tipo declarado
+        columna = re.search(r'CSV column #(\d+)', str(error))
+        nombre = lector.schema.names[int(columna[1])] if columna and lector is not None else None
+        if nombre is not None and nombre not in (tipos or {}):
+            raise DatosInvalidos(f'{error} (el tipo de {nombre!r} se toma del primer bloque del archivo)') from error
+        raise DatosInvalidos(str(error)) from error
+
+
+def _excel_batches(ruta, hojas, progreso):
+    import fastexcel
+    import polars as pl
+
+    nombres = fastexcel.read_excel(ruta).sheet_names
+    if hojas is None:
+        hojas = nombres[:1]
+    elif hojas == 'todas':
+        hojas = nombres
+    schema = None
+    for i, hoja in enumerate(hojas):
+        progreso(i / len(hojas), f'Hoja {hoja} ({i + 1} de {len(hojas)})')
+        table = pl.read_excel(ruta, sheet_name=hoja).to_arrow()
+        if len(hojas) > 1:
+            table = table.append_column('Hoja', pa.array([str(hoja)] * table.num_rows, pa.string()))
+        if schema is None:
+            schema = table.schema
+        elif table.column_names != schema.names:
+            raise DatosInvalidos(f'la hoja {hoja!r} no tiene las mismas columnas que la hoja {hojas[0]!r}')
+        else:
+            try:
+                table = table.cast(schema)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as error:
+                raise DatosInvalidos(f'la hoja {hoja!r} no tiene los tipos de la hoja {hojas[0]!r}: {error}') from error
+        yield from table.to_batches(max_chunksize=FILAS_POR_GRUPO)
+        del table
+
+
+def _columnar_batches(fuente, progreso):
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+
+    inicio = fuente.read(6)
+    fuente.seek(0)
+    if inicio[:4] == b'PAR1':
+        archivo = pq.ParquetFile(fuente)
+        for i in range(archivo.num_row_groups):
+            progreso(i / archivo.num_row_groups, f'Grupo {i + 1} de {archivo.num_row_groups}')
+            yield from archivo.read_row_group(i).to_batches()
+    else:
+        lector = ipc.open_file(fuente) if inicio == b'ARROW1' else ipc.open_stream(fuente)
+        if isinstance(lector, ipc.RecordBatchFileReader):
+            for i in range(lector.num_record_batches):
+                progreso(i / lector.num_record_batches, f'Lote {i + 1} de {lector.num_record_batches}')
+                yield lector.get_batch(i)
+        else:
+            yield from lector
+
+
+def batches(fuente, schema: pa.Schema | None = None, hojas=None, progreso=None, block_size: int = LOTE_BYTES):
+    """
+    Lotes (`pa.RecordBatch`) de un archivo CSV, Excel, Parquet o Arrow, sin leerlo completo.
+
+    `fuente` es una ruta o un archivo binario con `seek` (p. ej. el `UploadedFile` de
+    Streamlit). `schema` fija los tipos de sus columnas en CSV; `hojas` es None (la
+    primera), 'todas' o una lista de nombres (sólo Excel).
+    """
+    progreso = progreso or _sin_progreso
+    if isinstance(fuente, (str, Path)):
+        with open(fuente, 'rb') as archivo:
+            yield from batches(archivo, schema, hojas, progreso, block_size)
+        return
+
+    inicio = fuente.read(8)
+    fuente.seek(0)
+    if inicio[:4] in _EXCEL:
+        # el lector de Excel necesita una ruta: el archivo se copia a disco por bloques
+        with tempfile.NamedTemporaryFile(suffix='.xlsx' if inicio[:2] == b'PK' else '.xls') as copia:
+            shutil.copyfileobj(fuente, copia, LOTE_BYTES)
+            copia.flush()
+            yield from _excel_batches(copia.name, hojas, progreso)
+    elif inicio[:4] == b'PAR1' or inicio[:6] == b'ARROW1' or inicio[:4] == b'\xff\xff\xff\xff':
+        yield from _columnar_batches(fuente, progreso)
+    else:
+        yield from _csv_batches(fuente, schema, progreso, block_size)
+    progreso(1.0, 'Archivo leído')
+
+
+def ingest(fuente, destino, schema: pa.Schema | None = None, hojas=None, progreso=None,
+           block_size: int = LOTE_BYTES) -> dict:
+    """
+    Convierte `fuente` (ver `batches`) a Parquet en `destino`, lote por lote. El archivo se
+    escribe primero con otro nombre y se renombra al terminar: nunca queda uno a medias.
+    Regresa un resumen con filas, columnas, lotes, bytes escritos y segundos.
+    """
+    import pyarrow.parquet as pq
+
+    destino = Path(destino)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    # nombre único: dos sesiones pueden convertir el mismo archivo a la vez
+    descriptor, parcial = tempfile.mkstemp(dir=destino.parent, prefix=f'.{destino.stem}.', suffix='.parcial')
+    os.close(descriptor)
+    parcial = Path(parcial)
+    start = time.perf_counter()
+    filas = lotes = 0
+    writer = None
+    grupo = []
+
+    def escribir():
+        # los lotes pendientes como un grupo de filas del Parquet
+        writer.write_table(pa.Table.from_batches(grupo))
+        grupo.clear()
+
+    try:
+        for batch in batches(fuente, schema, hojas, progreso, block_size):
+            if writer is None:
+                writer = pq.ParquetWriter(parcial, batch.schema, compression='zstd')
+            grupo.append(batch)
+            filas += batch.num_rows
+            lotes += 1
+            if sum(b.num_rows for b in grupo) >= FILAS_POR_GRUPO:
+                escribir()
+        if writer is None:
+            raise DatosInvalidos('el archivo no tiene datos')
+        if grupo:
+            escribir()
+        columnas = len(writer.schema)
+        writer.close()
+        writer = None
+        os.replace(parcial, destino)
+    finally:
+        if writer is not None:
+            writer.close()
+        parcial.unlink(missing_ok=True)
+    return {
+        'destino': str(destino), 'filas': filas, 'columnas': columnas, 'lotes': lotes,
+        'bytes': destino.stat().st_size, 'segundos': round(time.perf_counter() - start, 3),
+    }
+
+
+def content_hash(fuente) -> str:
+    """Hash del contenido de un archivo binario, leído por bloques."""
+    h = hashlib.blake2b(digest_size=16)
+    fuente.seek(0)
+    while bloque := fuente.read(LOTE_BYTES):
+        h.update(bloque)
+    fuente.seek(0)
+    return h.hexdigest()
+
+
+def ingest_upload(uploaded_file, schema: pa.Schema | None = None, hojas=None, progreso=None,
+                  directorio=None) -> Path:
+    """
+    Ruta del Parquet de un archivo subido: se convierte la primera vez y las siguientes
+    (el mismo contenido, de ésta u otra sesión) se reutiliza.
+    """
+    directorio = Path(directorio or DIRECTORIO)
+    variante = hashlib.blake2b(repr((hojas, schema)).encode(), digest_size=4).hexdigest()
+    destino = directorio / f'{content_hash(uploaded_file)}-{variante}.parquet'
+    if not destino.exists():
+        ingest(uploaded_file, destino, schema, hojas, progreso)
+    return destino
+
+
+def main(argv=None):
+    from asignacion.formatos import SCHEMAS
+
+    parser = argparse.ArgumentParser(description='Convierte un archivo grande (CSV, Excel, Parquet o Arrow) a Parquet por lotes')
+    parser.add_argument('entrada', type=Path)
+    parser.add_argument('--salida', type=Path, required=True, help='archivo .parquet')
+    parser.add_argument('--fondo', choices=list(SCHEMAS), help='tipos de columnas del esquema del fondo (CSV)')
+    parser.add_argument('--hoja', action='append', help='hoja del Excel (se puede repetir; por omisión la primera)')
+    parser.add_argument('--todas', action='store_true', help='todas las hojas del Excel, con la columna Hoja')
+    parser.add_argument('--bloque-mb', type=float, default=LOTE_BYTES / 2**20, help='tamaño del bloque de CSV')
+    args = parser.parse_args(argv)
+
+    def progreso(fraccion, mensaje):
+        print(f'\r{fraccion:6.1%}  {mensaje}', end='', file=sys.stderr, flush=True)
+
+    try:
+        resumen = ingest(args.entrada, args.salida, SCHEMAS.get(args.fondo), 'todas' if args.todas else args.hoja,
+                         progreso, int(args.bloque_mb * 2**20))
+    except DatosInvalidos as error:
+        print(f'\n{args.entrada}: {error}', file=sys.stderr)
+        return 1
+    print(file=sys.stderr)
+    print(f"{resumen['destino']}: {resumen['filas']:,} filas, {resumen['columnas']} columnas, "
+          f"{resumen['lotes']} lotes, {resumen['bytes'] / 2**20:,.1f} MB en {resumen['segundos']} s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""
+Benchmark de latencia de reruns de las apps, sin navegador (`streamlit.testing` AppTest).
+
+Los benchmarks del motor no ven lo que cuesta la interfaz: tablas, gráficas, pestañas,
+widgets y los reruns que pide el propio script. Aquí cada app se maneja como lo haría una
+persona: se escribe el password, se sube un archivo de prueba (generado con semilla fija),
+se abre la pestaña de cálculo y se cambia muchas veces un ponderador, una banda o el
+parámetro. De cada interacción se mide el tiempo de `AppTest.run` (incluye los reruns que
+el script pida con `st.rerun`) y cuántas veces se ejecutó el script
+(`asignacion.medicion.ejecuciones`).
+
+El resumen por app (p50/p95/máximo y ejecuciones por interacción) se escribe en JSON; con
+`--base` se compara contra una corrida anterior y el proceso termina con error si el p95 de
+alguna app empeora más que la tolerancia:
+
+    python -m asignacion.latencia --reruns 30 --salida latencia.json
+    python -m asignacion.latencia --base latencia.json --tolerancia 0.25
+
+Cada corrida usa un caché en disco y una biblioteca de escenarios temporales, así que no
+depende de lo que haya quedado de corridas anteriores. El archivo de FORTAMUN se escribe con
+`polars.write_excel`, que necesita `xlsxwriter`.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from asignacion.medicion import ejecuciones
+from asignacion.validacion import ENTIDADES
+
+
+RAIZ = Path(__file__).resolve().parents[1]
+PASSWORD = 'benchmark'
+
+
+# --- archivos de prueba ---
+
+def fasp_fixture(seed: int = 0) -> bytes:
+    """CSV con las variables del FASP para las 32 Entidades Federativas."""
+    import pandas as pd
+    rng = np.random.default_rng(seed)
+    datos = {'Entidad_Federativa': ENTIDADES, 'Pob': rng.integers(700_000, 17_000_000, 32).astype(float)}
+    for col in ['Dig_salarial', 'Disp_camaras', 'Disp_lectores_veh', 'Tasa_abandono_llamadas', 'Cump_presup',
+                'Sobrepob_penitenciaria', 'Proc_justicia', 'Servs_forenses', 'Eficiencia_procesal']:
+        datos[col] = rng.uniform(0.01, 1, 32)
+    # como en el archivo real, Dig_salarial es negativa en la mayoría de los estados
+    datos['Dig_salarial'] = rng.uniform(-0.5, 0.6, 32)
+    datos['Inc_del'] = rng.uniform(-0.3, 0.3, 32)
+    datos['Tasa_policial'] = rng.uniform(0.5, 3, 32)
+    datos['Profesionalizacion'] = rng.integers(100, 5_000, 32).astype(float)
+    datos['Ctrl_conf'] = rng.uniform(50, 100, 32)
+    previo = rng.uniform(1.5e8, 6e8, 32)
+    # el monto de referencia suma el 95% del fondo por omisión, para que las bandas sean factibles
+    datos['Asignacion_2025'] = previo * 9_941_162_915.0 * 0.95 / previo.sum()
+    return pd.DataFrame(datos).to_csv(index=False).encode()
+
+
+def fofisp_fixture(seed: int = 0) -> bytes:
+    """CSV con las variables del FOFISP para las 32 Entidades Federativas."""
+    import pandas as pd
+    rng = np.random.default_rng(seed)
+    previo = rng.uniform(2e7, 5e7, 32)
+    return pd.DataFrame({
+        'Entidad_Federativa': ENTIDADES,
+        'Población': rng.integers(700_000, 17_000_000, 32).astype(float),
+        'Var_incidencia_del': rng.uniform(-0.2, 0.2, 32),
+        'Tasa_policial': rng.uniform(0.5, 3, 32),
+        'Academias': rng.integers(0, 5, 32),
+        'Asignacion_2025': previo * 1_154_918_909.69 * 0.97 / previo.sum(),
+    }).to_csv(index=False).encode()
+
+
+def fortamun_fixture(seed: int = 0, municipios: int = 2_469) -> bytes:
+    """Excel con las columnas del archivo de FORTAMUN, un renglón por municipio."""
+    import polars as pl
+    rng = np.random.default_rng(seed)
+    clave = np.sort(rng.integers(1, 33, municipios))
+    estatal = rng.uniform(1e8, 1e9, 33)
+    pob = rng.integers(1_000, 1_000_000, municipios)
+    share = pob / np.bincount(clave, weights=pob, minlength=33)[clave]
+    datos = pl.DataFrame({
+        'CLAVE': clave,
+        'NOM_ENT': [ENTIDADES[c - 1] for c in clave],
+        'CVE_MUN': np.arange(municipios),
+        'NOM_MUN': [f'Municipio {i}' for i in range(municipios)],
+        'ASIGNACIÓN FORTAMUN ESTATAL': estatal[clave],
+        'POB_TOTAL': pob,
+        'TOTAL DE VIVIENDAS HABITADAS': (pob / 3.6).astype(int),
+        'Municipios que informaron haber destinado recursos del FORTAMUN a la atención de necesidades '
+        'directamente vinculadas con la seguridad pública': rng.integers(0, 2, municipios),
+        'Asignación municipal (Gacetas estatales)': share * estatal[clave] * rng.uniform(0.9, 1.1, municipios),
+        'INCIDENCIA DELICTIVA DE ALTO IMPACTO': (pob / 400 + rng.integers(0, 300, municipios)).astype(int),
+        '56 Municipios prioritarios': (rng.uniform(size=municipios) < 0.02).astype(int),
+    })
+    buf = io.BytesIO()
+    datos.write_excel(buf)
+    return buf.getvalue()
+
+
+# --- escenarios ---
+# script (relativo a la raíz), directorio de trabajo, variable del password, archivo
+# (nombre, generador, tipo), pestaña (key, etiqueta) y cambios: (key o etiqueta del
+# number_input, desplazamiento total); el i-ésimo cambio de un widget lo mueve una fracción
+# distinta del desplazamiento, así que cada interacción es un escenario nuevo
+ESCENARIOS = {
+    'fasp': {
+        'script': 'fasp_app/fasp_formula_prop.py', 'cwd': 'fasp_app', 'password': 'PASSWORD',
+        'archivo': ('fasp.csv', fasp_fixture, 'text/csv'),
+        'pestaña': ('tabs_fasp', '2.Cálculo de Asignación'),
+        'cambios': [('Población (Alto=Bueno)', 0.05), ('Limite superior', 0.1), ('Presupuesto estimado', 5e8)],
+    },
+    'fofisp': {
+        'script': 'fofisp_app/fofisp_formula.py', 'cwd': 'fofisp_app', 'password': 'MY_PASSWORD',
+        'archivo': ('fofisp.csv', fofisp_fixture, 'text/csv'),
+        'pestaña': ('tabs_fofisp', '2.Cálculo'),
+        'cambios': [('Población', -0.1), ('Limite superior', 0.1), ('Presupuesto estimado', 5e7)],
+    },
+    'fondos_fasp': {
+        'script': 'fondos_app/pages/1_FASP.py', 'cwd': 'fondos_app', 'password': 'FONDOS_PASSWORD',
+        'archivo': ('fasp.csv', fasp_fixture, 'text/csv'),
+        'pestaña': ('tabs_fasp', '2.Asignación'),
+        'cambios': [('Población (Alto=Bueno)', 0.05), ('Limite superior', 0.1), ('Presupuesto estimado', 5e8)],
+    },
+    'fondos_fofisp': {
+        'script': 'fondos_app/pages/2_FOFISP.py', 'cwd': 'fondos_app', 'password': 'FONDOS_PASSWORD',
+        'archivo': ('fofisp.csv', fofisp_fixture, 'text/csv'),
+        'pestaña': ('tabs_fofisp', '2.Asignación'),
+        'cambios': [('Población', -0.1), ('Limite superior', 0.1), ('Presupuesto estimado', 5e7)],
+    },
+    'fondos_fortamun': {
+        'script': 'fondos_app/pages/3_FORTAMUN.py', 'cwd': 'fondos_app', 'password': 'FONDOS_PASSWORD',
+        'archivo': ('fortamun.xlsx', fortamun_fixture,
+                    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+        'pestaña': None,
+        'cambios': [('Selecciona un valor', 100), ('w_mun_pob', -0.5)],
+    },
+    'fortamun': {
+        'script': 'fortamun_app/fortamun_app.py', 'cwd': 'fortamun_app', 'password': 'password',
+        'archivo': ('fortamun.xlsx', fortamun_fixture,
+                    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+        'pestaña': None,
+        'cambios': [('Selecciona un valor', 100), ('w_mun_pob', -0.5)],
+    },
+}
+
+
+def _number_input(at, nombre):
+    for widget in at.number_input:
+        if widget.key == nombre or widget.label == nombre:
+            return widget
+    raise KeyError(f'number_input {nombre!r} no encontrado')
+
+
+def _paso(at, accion=None) -> tuple[float, int]:
+    # (ms, ejecuciones del script) de una interacción; falla si el script lanzó una excepción
+    antes = sum(ejecuciones.values())
+    start = time.perf_counter()
+    (accion or at).run()
+    ms = (time.perf_counter() - start) * 1000
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    return ms, sum(ejecuciones.values()) - antes
+
+
+def run_scenario(nombre: str, reruns: int = 30, timeout: float = 120) -> dict:
+    """Maneja una app de `ESCENARIOS` y regresa sus tiempos (ms) y ejecuciones del script."""
+    from streamlit.testing.v1 import AppTest
+
+    escenario = ESCENARIOS[nombre]
+    os.environ[escenario['password']] = PASSWORD
+    os.chdir(RAIZ / escenario['cwd'])
+    at = AppTest.from_file(str(RAIZ / escenario['script']), default_timeout=timeout)
+
+    # arranque: pantalla de acceso, password, archivo y pestaña de cálculo
+    arranque = {'acceso': _paso(at)}
+    arranque['password'] = _paso(at, at.text_input[0].input(PASSWORD))
+    archivo, generador, tipo = escenario['archivo']
+    arranque['archivo'] = _paso(at, at.file_uploader[0].set_value((archivo, generador(), tipo)))
+    if escenario['pestaña'] is not None:
+        key, etiqueta = escenario['pestaña']
+        at.session_state[key] = etiqueta
+        arranque['pestaña'] = _paso(at)
+
+    # interacciones: cada una cambia un solo widget a un valor que no se había usado
+    cambios = escenario['cambios']
+    base = {nombre_widget: _number_input(at, nombre_widget).value for nombre_widget, _ in cambios}
+    veces = -(-reruns // len(cambios))
+    tiempos, conteos = [], []
+    for i in range(reruns):
+        nombre_widget, delta = cambios[i % len(cambios)]
+        valor = base[nombre_widget] + delta * (i // len(cambios) + 1) / veces
+        if isinstance(base[nombre_widget], int):
+            valor = int(round(valor))
+        ms, n = _paso(at, _number_input(at, nombre_widget).set_value(valor))
+        tiempos.append(ms)
+        conteos.append(n)
+
+    return {'arranque': arranque, 'tiempos': tiempos, 'ejecuciones': conteos}
+
+
+def summary(resultado: dict) -> dict:
+    """p50/p95/máximo de las interacciones y ejecuciones del script por interacción."""
+    tiempos = np.asarray(resultado['tiempos'])
+    return {
+        'arranque_ms': {paso: round(ms, 1) for paso, (ms, _) in resultado['arranque'].items()},
+        'interacciones': len(tiempos),
+        'p50_ms': round(float(np.percentile(tiempos, 50)), 1),
+        'p95_ms': round(float(np.percentile(tiempos, 95)), 1),
+        'max_ms': round(float(tiempos.max()), 1),
+        'ejecuciones': int(sum(resultado['ejecuciones'])),
+        'ejecuciones_por_interaccion': round(float(np.mean(resultado['ejecuciones'])), 2),
+    }
+
+
+def compare(actual: dict, base: dict, tolerancia: float = 0.25) -> list[str]:
+    """Regresiones de `actual` respecto a `base` (p95 o ejecuciones por interacción)."""
+    regresiones = []
+    for nombre, medida in actual['apps'].items():
+        anterior = base.get('apps', {}).get(nombre)
+        if not anterior or 'p95_ms' not in anterior or 'p95_ms' not in medida:
+            continue
+        if medida['p95_ms'] > anterior['p95_ms'] * (1 + tolerancia):
+            regresiones.append(f"{nombre}: p95 {anterior['p95_ms']} -> {medida['p95_ms']} ms")
+        if medida['ejecuciones_por_interaccion'] > anterior['ejecuciones_por_interaccion']:
+            regresiones.append(f"{nombre}: ejecuciones por interacción "
+                               f"{anterior['ejecuciones_por_interaccion']} -> {medida['ejecuciones_por_interaccion']}")
+    return regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark de latencia de reruns de las apps (AppTest)')
+    parser.add_argument('--apps', nargs='+', choices=list(ESCENARIOS), default=list(ESCENARIOS))
+    parser.add_argument('--reruns', type=int, default=30, help='interacciones por app')
+    parser.add_argument('--salida', default='latencia.json', help='archivo JSON con el resumen')
+    parser.add_argument('--base', help='resumen anterior contra el cual comparar')
+    parser.add_argument('--tolerancia', type=float, default=0.25, help='empeoramiento permitido del p95')
+    args = parser.parse_args(argv)
+
+    salida = Path(args.salida).resolve()
+    base = json.loads(Path(args.base).read_text(encoding='utf-8')) if args.base else None
+
+    # caché en disco y biblioteca temporales; se fijan antes de que las apps los importen
+    temporal = tempfile.TemporaryDirectory(prefix='latencia_')
+    os.environ['ASIGNACION_CACHE'] = str(Path(temporal.name) / 'resultados.sqlite')
+    os.environ['ASIGNACION_ESCENARIOS'] = str(Path(temporal.name) / 'escenarios.sqlite')
+    os.environ['ASIGNACION_INGESTA'] = str(Path(temporal.name) / 'ingesta')
+
+    import streamlit
+    resumen = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'streamlit': streamlit.__version__,
+        'reruns': args.reruns,
+        'apps': {},
+    }
+    for nombre in args.apps:
+        try:
+            resumen['apps'][nombre] = summary(run_scenario(nombre, args.reruns))
+        except Exception as error:
+            resumen['apps'][nombre] = {'error': f'{type(error).__name__}: {error}'}
+        medida = resumen['apps'][nombre]
+        if 'error' in medida:
+            print(f"{nombre:16} error: {medida['error']}")
+        else:
+            print(f"{nombre:16} p50 {medida['p50_ms']:8.1f} ms   p95 {medida['p95_ms']:8.1f} ms   "
+                  f"ejecuciones/interacción {medida['ejecuciones_por_interaccion']}")
+
+    salida.write_text(json.dumps(resumen, ensure_ascii=False, indent=2), encoding='utf-8')
+    print(f'Resumen: {salida}')
+
+    errores = [nombre for nombre, medida in resumen['apps'].items() if 'error' in medida]
+    regresiones = compare(resumen, base, args.tolerancia) if base else []
+    for regresion in regresiones:
+        print(f'Regresión: {regresion}')
+    temporal.cleanup()
+    return 1 if errores or regresiones else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,237 @@
+"""
+Medición opcional de cada rerun de las apps: tiempo por etapa y aciertos de los cachés.
+
+Se activa con la variable de entorno `ASIGNACION_MEDICION=1`; sin ella todo es un no-op.
+Cada rerun junta:
+
+- el tiempo de cada etapa (lectura, normalización, índice, bandas, tablas, gráficas): los
+  nodos de `asignacion.grafo` se registran solos y las apps sin grafo marcan sus etapas con
+  `span('nombre')`;
+- los aciertos y fallos de los cachés de tablas, figuras y disco durante el rerun, y el
+  estado de los nodos del grafo ('calculado', 'memoria' o 'disco').
+
+Con `ASIGNACION_MEDICION=memoria` se mide además la memoria con `tracemalloc`: por etapa, el
+pico de memoria asignada y lo que queda retenido al terminar, y al final del rerun lo que
+retiene la sesión (la memoria del grafo) contra un presupuesto en MB
+(`ASIGNACION_MEMORIA_SESION`, por omisión 64). `tracemalloc` cuenta todo el proceso, así que
+con varias sesiones a la vez las cifras por etapa incluyen lo que asignen las demás.
+
+Al final del rerun (`Medicion.finish`) se muestra un panel plegable en la barra lateral y se
+agrega una línea JSON al archivo `ASIGNACION_MEDICION_LOG` (por omisión `medicion.jsonl` en
+el directorio de la app), para ver qué etapa conviene atacar sin un profiler en producción.
+"""
+
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+
+ACTIVA = os.environ.get('ASIGNACION_MEDICION', '').lower() not in ('', '0', 'false', 'no')
+MEMORIA = os.environ.get('ASIGNACION_MEDICION', '').lower() == 'memoria'
+PRESUPUESTO_SESION = float(os.environ.get('ASIGNACION_MEMORIA_SESION', 64)) * 2**20
+
+_actual = threading.local()
+# ejecuciones del script de cada app en este proceso, con o sin medición activa (las usa
+# el benchmark de reruns, ver asignacion.latencia)
+ejecuciones = Counter()
+_log_lock = threading.Lock()
+_nada = contextlib.nullcontext()
+
+
+def _cache_counters() -> dict:
+    # contadores globales del proceso; la medición guarda la diferencia durante el rerun
+    from asignacion.disco import disk_cache
+    from asignacion.graficas import figure_cache
+    from asignacion.tablas import render_cache
+    return {
+        'tablas_aciertos': render_cache.hits, 'tablas_fallos': render_cache.misses,
+        'figuras_aciertos': figure_cache.hits, 'figuras_fallos': figure_cache.misses,
+        'disco_aciertos': disk_cache.hits, 'disco_fallos': disk_cache.misses,
+    }
+
+
+def footprint(value, _vistos=None) -> int:
+    """
+    Bytes aproximados que retiene `value` (DataFrames, arreglos, bytes y contenedores).
+
+    Los arreglos que comparten memoria (vistas, columnas de un DataFrame que salió de otro
+    sin copiar) se cuentan una sola vez.
+    """
+    import numpy as np
+    import pandas as pd
+
+    # id -> objeto: guardar el objeto evita que otro temporal reuse su id
+    vistos = {} if _vistos is None else _vistos
+    if isinstance(value, np.ndarray):
+        # la memoria es la del arreglo dueño del buffer, no la de la vista
+        while isinstance(value.base, np.ndarray):
+            value = value.base
+    if id(value) in vistos:
+        return 0
+    vistos[id(value)] = value
+
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, pd.DataFrame):
+        return value.index.memory_usage() + sum(footprint(value[c], vistos) for c in value.columns)
+    if isinstance(value, pd.Series):
+        if isinstance(value.dtype, np.dtype) and value.dtype != object:
+            return footprint(value.to_numpy(), vistos)
+        if isinstance(value.array, pd.arrays.ArrowExtensionArray):
+            # columnas de Arrow (el texto en pandas 3): cada buffer una vez, por su dirección
+            total = 0
+            for chunk in value.array.__arrow_array__().chunks:
+                for buffer in chunk.buffers():
+                    if buffer is not None and ('buffer', buffer.address) not in vistos:
+                        vistos[('buffer', buffer.address)] = buffer
+                        total += buffer.size
+            return total
+        return int(value.memory_usage(index=False, deep=True))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(footprint(v, vistos) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(footprint(v, vistos) for v in value)
+    return sys.getsizeof(value)
+
+
+class Medicion:
+    """Etapas y contadores de un rerun (ver `medicion`)."""
+
+    def __init__(self, app: str, activa: bool = ACTIVA, memoria: bool = MEMORIA):
+        self.app = app
+        self.activa = activa
+        self.memoria = activa and memoria
+        self.etapas = []
+        self.contadores = Counter()
+        if activa:
+            if self.memoria and not tracemalloc.is_tracing():
+                tracemalloc.start()
+            self._inicio = time.perf_counter()
+            self._caches = _cache_counters()
+
+    def mark(self) -> int | None:
+        # inicio de una etapa para `record`: memoria trazada en este momento (y pico en cero)
+        if not self.memoria:
+            return None
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+    def record(self, etapa: str, ms: float, estado: str | None = None, inicio: int | None = None):
+        # `estado` sólo viene de los nodos del grafo ('calculado', 'memoria' o 'disco');
+        # `inicio` es lo que regresó `mark` al empezar la etapa
+        if self.activa:
+            fila = {'Etapa': etapa, 'Estado': estado or 'calculado', 'Tiempo (ms)': ms}
+            if inicio is not None:
+                actual, pico = tracemalloc.get_traced_memory()
+                fila['Pico (KB)'] = (pico - inicio) / 1024
+                fila['Retenido (KB)'] = (actual - inicio) / 1024
+            self.etapas.append(fila)
+            if estado is not None:
+                self.contadores[f'grafo_{estado}'] += 1
+
+    @contextlib.contextmanager
+    def span(self, etapa: str):
+        inicio = self.mark()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(etapa, (time.perf_counter() - start) * 1000, inicio=inicio)
+
+    def count(self, nombre: str, n: int = 1):
+        if self.activa:
+            self.contadores[nombre] += n
+
+    def finish(self, sidebar=True, sesion=None):
+        """
+        Cierra el rerun: escribe la línea JSON y muestra el panel.
+
+        `sesion` es lo que la sesión retiene entre reruns (p. ej. la memoria del grafo); con
+        la medición de memoria se compara su tamaño contra `PRESUPUESTO_SESION`.
+        """
+        if not self.activa:
+            return
+        if getattr(_actual, 'medicion', None) is self:
+            _actual.medicion = None
+        total = (time.perf_counter() - self._inicio) * 1000
+        for nombre, valor in _cache_counters().items():
+            if valor != self._caches[nombre]:
+                self.contadores[nombre] += valor - self._caches[nombre]
+
+        linea = {
+            'app': self.app,
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'total_ms': round(total, 3),
+            'etapas': [{'etapa': e['Etapa'], 'estado': e['Estado'], 'ms': round(e['Tiempo (ms)'], 3),
+                        **({'pico_kb': round(e['Pico (KB)'], 1), 'retenido_kb': round(e['Retenido (KB)'], 1)}
+                           if 'Pico (KB)' in e else {})}
+                       for e in self.etapas],
+            'contadores': dict(self.contadores),
+        }
+        sesion_bytes = None
+        if self.memoria and sesion is not None:
+            sesion_bytes = footprint(sesion)
+            linea['sesion_bytes'] = sesion_bytes
+            if sesion_bytes > PRESUPUESTO_SESION:
+                self.contadores['sesion_sobre_presupuesto'] += 1
+                linea['contadores'] = dict(self.contadores)
+        path = Path(os.environ.get('ASIGNACION_MEDICION_LOG', 'medicion.jsonl'))
+        with _log_lock, open(path, 'a', encoding='utf-8') as log:
+            log.write(json.dumps(linea, ensure_ascii=False) + '\n')
+
+        if sidebar:
+            import pandas as pd
+            import streamlit as st
+            with st.sidebar.expander('Medición'):
+                st.markdown(f'**Rerun:** {total:,.1f} ms')
+                if sesion_bytes is not None:
+                    st.markdown(f'**Memoria de la sesión:** {sesion_bytes / 2**20:,.2f} MB '
+                                f'de {PRESUPUESTO_SESION / 2**20:,.0f} MB')
+                    if sesion_bytes > PRESUPUESTO_SESION:
+                        st.warning('La sesión retiene más memoria que el presupuesto.')
+                if self.etapas:
+                    st.dataframe(
+                        pd.DataFrame(self.etapas), hide_index=True,
+                        column_config={c: st.column_config.NumberColumn(format='%.1f')
+                                       for c in ('Tiempo (ms)', 'Pico (KB)', 'Retenido (KB)')},
+                    )
+                if self.contadores:
+                    st.dataframe(
+                        pd.DataFrame({'Contador': list(self.contadores), 'Valor': list(self.contadores.values())}),
+                        hide_index=True,
+                    )
+                st.caption(f'Registro: {path}')
+
+
+def medicion(app: str) -> Medicion:
+    """Empieza la medición del rerun en curso (en el hilo de la sesión)."""
+    ejecuciones[app] += 1
+    actual = Medicion(app)
+    _actual.medicion = actual if actual.activa else None
+    return actual
+
+
+def mark() -> int | None:
+    """Inicio de una etapa que después se registra con `record` (None si no se mide memoria)."""
+    actual = getattr(_actual, 'medicion', None)
+    return actual.mark() if actual is not None else None
+
+
+def record(etapa: str, ms: float, estado: str | None = None, inicio: int | None = None):
+    """Registra una etapa ya medida (p. ej. un nodo del grafo) en la medición en curso."""
+    actual = getattr(_actual, 'medicion', None)
+    if actual is not None:
+        actual.record(etapa, ms, estado, inicio)
+
+
+def span(etapa: str):
+    """Mide el bloque `with` como una etapa de la medición en curso (no-op si no hay)."""
+    actual = getattr(_actual, 'medicion', None)
+    return actual.span(etapa) if actual is not None else _nada
@@ -0,0 +1,193 @@
+"""
+Asignación jerárquica estado → municipio.
+
+Primero se reparte el fondo entre las 32 Entidades Federativas y después el monto de cada
+estado entre sus municipios, con una fórmula de indicadores configurable y bandas opcionales.
+
+Todo el cálculo se hace con operaciones segmentadas de numpy (`np.add.reduceat`) sobre las
+filas ordenadas por estado: una sola pasada por los ~2,469 municipios, sin ciclos por estado.
+Los montos se llevan en centavos enteros con suma exacta por estado.
+"""
+
+import numpy as np
+import polars as pl
+
+from asignacion.segmentos import segment_starts, single_segment, segsum as _segsum, broadcast as _broadcast
+from asignacion.centavos import to_centavos, to_pesos, largest_remainder, band_bounds, check_bands, rebalance_centavos
+
+
+def segmented_normalize(X: np.ndarray, starts: np.ndarray, counts: np.ndarray,
+                        directions: list[str]) -> np.ndarray:
+    """
+    Proporción Directa por segmento: misma lógica que `direct_proportion_normalize`,
+    aplicada a todos los indicadores y todos los estados a la vez.
+
+    - 'positive' (Alto=Bueno): x / suma del estado.
+    - 'negative' (Alto=Malo): (1/x) / suma del estado.
+
+    Si el mínimo del estado es negativo se corre la serie por media + 3*std.
+    Si un estado no tiene una suma válida, sus municipios reciben partes iguales.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    if X.ndim == 1:
+        X = X[:, None]
+
+    n = counts[:, None].astype(np.float64)
+    mean = _segsum(X, starts) / n
+    dev = X - _broadcast(mean, counts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.sqrt(_segsum(dev * dev, starts) / (n - 1))
+    std = np.nan_to_num(std)
+
+    # corrimiento sólo en los estados con valores negativos
+    minimum = np.minimum.reduceat(X, starts, axis=0)
+    shift = np.where(minimum < 0, mean + std * 3, 0.0)
+    shifted = X + _broadcast(shift, counts)
+
+    negative = np.array([d == 'negative' for d in directions])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = np.where(negative, 1 / shifted, shifted)
+        total = _segsum(values, starts)
+        props = values / _broadcast(total, counts)
+
+    # casos extremos: suma cero o valores no finitos -> reparto uniforme en el estado
+    invalid = ~np.isfinite(total) | (total == 0)
+    if invalid.any():
+        uniform = _broadcast(np.broadcast_to(1 / n, total.shape), counts)
+        props = np.where(_broadcast(invalid, counts), uniform, props)
+
+    return props
+
+
+def segmented_allocation(X: np.ndarray, starts: np.ndarray, counts: np.ndarray,
+                         directions: list[str], weights: np.ndarray,
+                         totals: np.ndarray) -> dict[str, np.ndarray]:
+    """
+    Reparte el total de cada segmento (en centavos) con el índice ponderado de sus filas.
+
+    Los pesos se re-escalan para sumar 1, de modo que la asignación bruta de cada
+    segmento agota exactamente su total. 'bruta' viene en centavos enteros.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    weights = weights / weights.sum()
+    totals = np.asarray(totals, dtype=np.int64)
+
+    props = segmented_normalize(X, starts, counts, directions)
+    reparto = props @ weights
+    contributions = props * weights * _broadcast(totals, counts)[:, None]
+
+    return {
+        'props': props,
+        'contributions': contributions,
+        'reparto': reparto,
+        'bruta': largest_remainder(contributions.sum(axis=1), totals, starts, counts),
+    }
+
+
+def _allocate_level(frame: pl.DataFrame, segment_col: str | None, weights: dict,
+                    directions: dict, totals: np.ndarray, reference: str | None,
+                    bands: tuple[float, float] | None) -> tuple[dict, np.ndarray, np.ndarray]:
+    # un nivel de la jerarquía; frame ya viene ordenado por segment_col
+    if segment_col is None:
+        starts, counts = single_segment(frame.height)
+    else:
+        starts, counts = segment_starts(frame[segment_col].to_numpy())
+
+    columns = list(weights)
+    X = frame.select(columns).fill_null(0).to_numpy().astype(np.float64)
+    result = segmented_allocation(
+        X, starts, counts,
+        [directions.get(c, 'positive') for c in columns],
+        [weights[c] for c in columns],
+        totals,
+    )
+
+    if bands is None:
+        return result, result['bruta'], np.zeros(len(starts), dtype=np.int64)
+
+    lower, upper = band_bounds(frame[reference].to_numpy(), *bands)
+    # el total de un estado (o el presupuesto) que no cabe en sus bandas no se puede
+    # rebalancear: se avisa con los estados que fallan en vez de dar montos que no suman
+    if segment_col is None:
+        check_bands(result['bruta'], lower, upper, que='Las bandas estatales')
+    else:
+        check_bands(result['bruta'], lower, upper, starts, counts,
+                    nombres=frame['Estado'].gather(starts).to_list(), que='Las bandas municipales')
+    ajustada, iterations = rebalance_centavos(
+        result['bruta'], result['reparto'], lower, upper, starts, counts,
+    )
+    return result, ajustada, iterations
+
+
+def hierarchical_allocation(data: pl.DataFrame, municipal_weights: dict,
+                            municipal_directions: dict | None = None,
+                            presupuesto: float | None = None,
+                            state_weights: dict | None = None,
+                            state_directions: dict | None = None,
+                            municipal_bands: tuple[float, float] | None = None,
+                            state_bands: tuple[float, float] | None = None,
+                            state_col: str = 'Clave') -> tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Asignación en dos niveles para el FORTAMUN (columnas ya renombradas como en la app).
+
+    1. Estados: sin `presupuesto`, cada estado conserva su `Asignacion_estatal`. Con
+       `presupuesto`, éste se reparte con `state_weights` (por omisión, proporcional a
+       `Asignacion_estatal`); los indicadores estatales distintos de `Asignacion_estatal`
+       se obtienen sumando sus municipios. `state_bands` acota la variación contra
+       `Asignacion_estatal`.
+    2. Municipios: el monto de cada estado se reparte con `municipal_weights`;
+       `municipal_bands` acota la variación contra `Asignacion_municipal`.
+
+    Los montos se calculan en centavos (columnas `*_centavos`); las columnas en pesos son
+    las mismas cantidades entre 100. Regresa (municipios, estados) en el orden original.
+    Si el presupuesto no cabe en `state_bands`, o el monto de algún estado en las
+    `municipal_bands` de sus municipios, lanza `BandasInfactibles` (ver `asignacion.centavos`).
+    """
+    municipal_directions = municipal_directions or {}
+    state_directions = state_directions or {}
+
+    # ordenar una sola vez por estado (estable para conservar el orden de los municipios)
+    frame = data.with_row_index('_fila').sort(state_col, maintain_order=True)
+
+    # --- nivel 1: estados ---
+    state_weights = state_weights or {'Asignacion_estatal': 1.0}
+    aggregations = [pl.col('Estado').first(), pl.col('Asignacion_estatal').first()] + [
+        pl.col(c).sum() for c in state_weights if c != 'Asignacion_estatal'
+    ]
+    estados = frame.group_by(state_col, maintain_order=True).agg(aggregations)
+
+    if presupuesto is None:
+        state_amounts = to_centavos(estados['Asignacion_estatal'].to_numpy())
+        state_iterations = np.zeros(estados.height, dtype=np.int64)
+    else:
+        _, state_amounts, state_iterations = _allocate_level(
+            estados, None, state_weights, state_directions,
+            to_centavos([presupuesto]), 'Asignacion_estatal', state_bands,
+        )
+        state_iterations = np.repeat(state_iterations, estados.height)
+
+    estados = estados.select(state_col, 'Estado', 'Asignacion_estatal').with_columns(
+        pl.Series('Asignacion_estado_centavos', state_amounts),
+        pl.Series('Asignacion_estado', to_pesos(state_amounts)),
+        pl.Series('Iteraciones', state_iterations),
+    )
+
+    # --- nivel 2: municipios ---
+    result, ajustada, iterations = _allocate_level(
+        frame, state_col, municipal_weights, municipal_directions,
+        state_amounts, 'Asignacion_municipal', municipal_bands,
+    )
+
+    municipios = frame.with_columns(
+        pl.Series('Reparto_municipal', result['reparto']),
+        pl.Series('Asignacion_Bruta_centavos', result['bruta']),
+        pl.Series('Asignacion_ajustada_centavos', ajustada),
+        pl.Series('Asignacion_Bruta', to_pesos(result['bruta'])),
+        pl.Series('Asignacion_ajustada', to_pesos(ajustada)),
+    ).with_columns(
+        (pl.col('Asignacion_ajustada') / pl.col('Asignacion_municipal') - 1).alias('Var%_ajustada'),
+    ).sort('_fila').drop('_fila')
+
+    estados = estados.with_columns(pl.Series('Iteraciones_municipales', iterations))
+
+    return municipios, estados
@@ -0,0 +1,420 @@
+"""
+Fichas por Entidad Federativa: una página HTML por Entidad con el resultado de un escenario.
+
+Después de cada ronda de asignación se preparaban a mano las 32 fichas estatales. Aquí se
+generan a partir del escenario (datos, ponderadores, presupuesto y bandas), con:
+
+- monto asignado 2026 (inicial y ajustado), el de 2025 y la variación;
+- lugar y participación en el fondo;
+- aportación de cada indicador (`Monto_*` de `calculate_index`) y su gráfica;
+- estado respecto a la banda: cotas, ajuste del rebalanceo y si quedó en una cota.
+
+Cada ficha es un HTML autocontenido salvo por `plotly.min.js`, que se escribe una vez en el
+directorio; tiene estilos de impresión, así que se guarda como PDF desde el navegador
+(Imprimir > Guardar como PDF) con el mismo formato.
+
+Las fichas se reparten en grupos entre procesos (spawn, como en `asignacion.trabajos`):
+cada proceso arma el esqueleto de la gráfica una sola vez (ver `asignacion.graficas`) y en
+las siguientes fichas sólo reemplaza los montos. `manifiesto.json` guarda el hash de los
+números de cada ficha (y de la plantilla); al volver a generar sólo se escriben las fichas
+de las Entidades cuyos números cambiaron. Desde la línea de comandos, con un escenario de la
+biblioteca (ver `asignacion.biblioteca`):
+
+    python -m asignacion.reportes --id 12 --salida fichas/ --procesos 4
+    python -m asignacion.reportes --id 12 --salida fichas/ --forzar
+"""
+
+import argparse
+import html
+import io
+import json
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import time
+import unicodedata
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from string import Template
+
+import numpy as np
+import pandas as pd
+
+from asignacion.centavos import BandasInfactibles, band_bounds, rebalance_centavos, to_pesos
+from asignacion.grafo import code_key, content_key
+from asignacion.indice import calculate_index
+from asignacion.sabana import FONDOS
+
+
+MANIFIESTO = 'manifiesto.json'
+PLOTLY_JS = 'plotly.min.js'
+
+_PLANTILLA = Template("""<!DOCTYPE html>
+<html lang="es">
+<head>
+<meta charset="utf-8">
+<title>$fondo $entidad</title>
+<script src="$plotly_js"></script>
+<style>
+body { font-family: 'Noto Sans', Arial, sans-serif; color: #28282b; margin: 2em auto; max-width: 960px; }
+header { border-bottom: 4px solid #691c32; margin-bottom: 1em; }
+h1 { color: #691c32; margin-bottom: .1em; }
+h2 { color: #691c32; font-size: 1.1em; border-bottom: 1px solid #bc955c; }
+.subtitulo { color: #6f7271; margin-top: 0; }
+.cifras { display: flex; gap: 1em; }
+.cifra { flex: 1; border: 1px solid #bc955c; border-radius: 4px; padding: .6em; }
+.cifra .valor { font-size: 1.4em; font-weight: bold; color: #691c32; }
+.cifra .etiqueta { font-size: .85em; color: #6f7271; }
+table { border-collapse: collapse; width: 100%; font-size: .9em; }
+th { background: #ddc9a3; text-align: left; }
+th, td { padding: .3em .5em; border-bottom: 1px solid #ddc9a3; }
+td.num { text-align: right; font-variant-numeric: tabular-nums; }
+.banda { font-weight: bold; color: $color_banda; }
+footer { margin-top: 2em; font-size: .8em; color: #6f7271; }
+@media print {
+  body { margin: 0; max-width: none; }
+  .cifras, table, .grafica { break-inside: avoid; }
+  @page { size: letter; margin: 1.5cm; }
+}
+</style>
+</head>
+<body>
+<header>
+<h1>$entidad</h1>
+<p class="subtitulo">$fondo &middot; Escenario $escenario &middot; Presupuesto $presupuesto</p>
+</header>
+<div class="cifras">
+<div class="cifra"><div class="etiqueta">Asignación 2026 (ajustada)</div><div class="valor">$ajustada</div></div>
+<div class="cifra"><div class="etiqueta">Asignación 2025</div><div class="valor">$previo</div></div>
+<div class="cifra"><div class="etiqueta">Variación</div><div class="valor">$variacion</div></div>
+<div class="cifra"><div class="etiqueta">Lugar / participación</div><div class="valor">$lugar &middot; $participacion</div></div>
+</div>
+<h2>Aportación por indicador</h2>
+<table>
+<tr><th>Indicador</th><th>Ponderador</th><th>Monto</th><th>% de la asignación inicial</th></tr>
+$indicadores
+</table>
+<div class="grafica">$grafica</div>
+<h2>Bandas</h2>
+<p class="banda">$estado_banda</p>
+<table>
+<tr><th>Concepto</th><th>Monto</th></tr>
+<tr><td>Cota inferior ($banda_inferior)</td><td class="num">$cota_inferior</td></tr>
+<tr><td>Cota superior (+$banda_superior)</td><td class="num">$cota_superior</td></tr>
+<tr><td>Asignación 2026 inicial</td><td class="num">$bruta</td></tr>
+<tr><td>Ajuste por bandas y remanente</td><td class="num">$ajuste</td></tr>
+<tr><td>Asignación 2026 ajustada</td><td class="num">$ajustada</td></tr>
+<tr><td>Variación de la asignación inicial</td><td class="num">$variacion_bruta</td></tr>
+</table>
+<footer>&copy; Dirección General de Planeación</footer>
+</body>
+</html>
+""")
+
+_INDICE = Template("""<!DOCTYPE html>
+<html lang="es">
+<head><meta charset="utf-8"><title>$fondo $escenario</title>
+<style>
+body { font-family: 'Noto Sans', Arial, sans-serif; color: #28282b; margin: 2em auto; max-width: 960px; }
+h1 { color: #691c32; }
+table { border-collapse: collapse; width: 100%; font-size: .9em; }
+th { background: #ddc9a3; text-align: left; }
+th, td { padding: .3em .5em; border-bottom: 1px solid #ddc9a3; }
+td.num { text-align: right; }
+</style></head>
+<body>
+<h1>$fondo &middot; Escenario $escenario</h1>
+<table>
+<tr><th>Entidad Federativa</th><th>Asignación 2026 (ajustada)</th><th>Variación</th><th>Bandas</th></tr>
+$filas
+</table>
+</body>
+</html>
+""")
+
+_ESTADOS = {
+    'superior': ('En la cota superior de la banda', '#9f2241'),
+    'inferior': ('En la cota inferior de la banda', '#9f2241'),
+    'dentro': ('Dentro de la banda', '#235b4e'),
+}
+
+
+def _pesos(valor) -> str:
+    return f'${valor:,.2f}'
+
+
+def _porcentaje(valor) -> str:
+    return f'{valor:+.2%}'
+
+
+def state_numbers(fondo: str, datos: pd.DataFrame, weights: dict, presupuesto: float,
+                  lower_limit: float, upper_limit: float) -> list[dict]:
+    """
+    Números de la ficha de cada Entidad Federativa (un dict por Entidad, en el orden de
+    `datos`), con el mismo cálculo que las apps: índice, asignación en centavos y bandas.
+    Lanza `BandasInfactibles` si el presupuesto no cabe en las bandas.
+    """
+    variable_map, normalize = FONDOS[fondo]
+    datos = datos.reset_index(drop=True)
+    sabana = calculate_index(datos, weights, presupuesto, variable_map=variable_map, normalize=normalize)
+    montos = [c for c in sabana.columns if c.startswith('Monto_')]
+
+    previo = datos['Asignacion_2025'].to_numpy(dtype=np.float64)
+    bruta = sabana['Asignacion_Bruta_centavos'].to_numpy()
+    lower, upper = band_bounds(previo, lower_limit, upper_limit)
+    ajustada, _ = rebalance_centavos(bruta, sabana['Reparto'].to_numpy(), lower, upper)
+    estado = np.select([ajustada >= upper, ajustada <= lower], ['superior', 'inferior'], 'dentro')
+    # lugar por asignación ajustada (1 = la mayor)
+    lugar = pd.Series(ajustada).rank(ascending=False, method='min').astype(int).to_numpy()
+    total = ajustada.sum()
+
+    fichas = []
+    for i, entidad in enumerate(datos['Entidad_Federativa']):
+        fichas.append({
+            'Entidad_Federativa': str(entidad),
+            'Asignacion_2025': float(previo[i]),
+            'Asignacion_2026': float(to_pesos(bruta[i])),
+            'Asignacion_ajustada': float(to_pesos(ajustada[i])),
+            'Cota_inferior': float(to_pesos(lower[i])),
+            'Cota_superior': float(to_pesos(upper[i])),
+            'Estado_banda': str(estado[i]),
+            'Lugar': int(lugar[i]),
+            'Participacion': float(ajustada[i] / total) if total else 0.0,
+            # aportación por indicador, con el nombre de su ponderador
+            'Montos': {'Monto base' if c == 'Monto_Base' else c.removeprefix('Monto_'): float(sabana.at[i, c])
+                       for c in montos},
+        })
+    return fichas
+
+
+def contribuciones(indicadores):
+    # figura completa con `go`; se arma una vez por proceso y después `grafica` sólo
+    # reemplaza los montos (ver asignacion.graficas)
+    import plotly.graph_objects as go
+
+    fig = go.Figure(go.Bar(
+        x=list(indicadores),
+        y=np.zeros(len(indicadores)),
+        marker_color='#691c32',
+        marker_line_color='#bc955c',
+        marker_line_width=1,
+        texttemplate='$%{y:,.0f}',
+        textposition='outside',
+        hovertemplate='%{x}: $%{y:,.2f}<extra></extra>',
+    ))
+    fig.update_layout(
+        template='ggplot2',
+        height=420,
+        margin=dict(l=40, r=20, t=30, b=120),
+        yaxis_title='Monto',
+        uniformtext_minsize=8,
+        uniformtext_mode='hide',
+    )
+    fig.update_xaxes(tickangle=-30)
+    return fig
+
+
+def grafica(fila: dict):
+    from asignacion.graficas import cached_figure
+
+    indicadores = tuple(fila['Montos'])
+    return cached_figure(contribuciones, indicadores, [{'y': np.fromiter(fila['Montos'].values(), float)}],
+                         key=indicadores)
+
+
+def render_brief(fila: dict, contexto: dict) -> str:
+    """HTML de la ficha de una Entidad (`fila` de `state_numbers`) en un escenario (`contexto`)."""
+    import plotly.io as pio
+
+    weights = contexto['weights']
+    bruta = fila['Asignacion_2026']
+    indicadores = '\n'.join(
+        f'<tr><td>{html.escape(nombre)}</td>'
+        f'<td class="num">{weights.get(nombre, 0):.2%}</td>'
+        f'<td class="num">{_pesos(monto)}</td>'
+        f'<td class="num">{monto / bruta if bruta else 0:.2%}</td></tr>'
+        for nombre, monto in fila['Montos'].items()
+    )
+    estado, color = _ESTADOS[fila['Estado_banda']]
+    figura = pio.to_html(grafica(fila), full_html=False, include_plotlyjs=False,
+                         config={'displayModeBar': False, 'responsive': True})
+    return _PLANTILLA.substitute(
+        plotly_js=PLOTLY_JS,
+        fondo=html.escape(contexto['fondo']),
+        escenario=html.escape(contexto.get('nombre') or 'sin nombre'),
+        presupuesto=_pesos(contexto['presupuesto']),
+        entidad=html.escape(fila['Entidad_Federativa']),
+        ajustada=_pesos(fila['Asignacion_ajustada']),
+        previo=_pesos(fila['Asignacion_2025']),
+        variacion=_porcentaje(fila['Asignacion_ajustada'] / fila['Asignacion_2025'] - 1),
+        variacion_bruta=_porcentaje(bruta / fila['Asignacion_2025'] - 1),
+        lugar=f"{fila['Lugar']}°",
+        participacion=f"{fila['Participacion']:.2%}",
+        indicadores=indicadores,
+        grafica=figura,
+        estado_banda=estado,
+        color_banda=color,
+        banda_inferior=f"{contexto['lower_limit']:.0%}",
+        banda_superior=f"{contexto['upper_limit']:.0%}",
+        cota_inferior=_pesos(fila['Cota_inferior']),
+        cota_superior=_pesos(fila['Cota_superior']),
+        bruta=_pesos(bruta),
+        ajuste=_pesos(fila['Asignacion_ajustada'] - bruta),
+    )
+
+
+def file_name(numero: int, entidad: str) -> str:
+    """Nombre del archivo de una ficha: `01_aguascalientes.html`."""
+    simple = unicodedata.normalize('NFKD', entidad).encode('ascii', 'ignore').decode()
+    return f"{numero:02d}_{re.sub(r'[^a-z0-9]+', '_', simple.lower()).strip('_')}.html"
+
+
+def _version() -> str:
+    # lo que cambia el HTML además de los números: la plantilla, el código y plotly
+    import plotly
+
+    return content_key((_PLANTILLA.template, code_key(render_brief), code_key(contribuciones), plotly.__version__))
+
+
+def _escribir(destino: Path, contenido: str):
+    # se escribe con otro nombre y se renombra: una ficha nunca queda a medias
+    descriptor, parcial = tempfile.mkstemp(dir=destino.parent, prefix=f'.{destino.stem}.', suffix='.parcial')
+    try:
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as archivo:
+            archivo.write(contenido)
+        os.chmod(parcial, 0o644)
+        os.replace(parcial, destino)
+    except BaseException:
+        Path(parcial).unlink(missing_ok=True)
+        raise
+
+
+def _renderizar(args) -> list[str]:
+    # un grupo de fichas en un proceso del pool: el esqueleto de la gráfica se arma una vez
+    grupo, contexto, directorio = args
+    for archivo, fila in grupo:
+        _escribir(Path(directorio) / archivo, render_brief(fila, contexto))
+    return [archivo for archivo, _ in grupo]
+
+
+def render_reports(fondo: str, datos: pd.DataFrame, weights: dict, presupuesto: float,
+                   lower_limit: float, upper_limit: float, directorio, nombre: str = '',
+                   procesos: int | None = None, forzar: bool = False) -> dict:
+    """
+    Escribe en `directorio` la ficha de cada Entidad, `index.html` y `plotly.min.js`.
+
+    Sólo se generan las fichas cuyos números (o la plantilla) cambiaron desde la última
+    corrida en ese directorio, o todas con `forzar`. Las pendientes se reparten en
+    `procesos` procesos (por omisión, uno por CPU). Regresa un resumen con las fichas
+    generadas, las que no cambiaron y los segundos.
+    """
+    start = time.perf_counter()
+    directorio = Path(directorio)
+    directorio.mkdir(parents=True, exist_ok=True)
+    contexto = {'fondo': fondo, 'nombre': nombre, 'presupuesto': float(presupuesto),
+                'lower_limit': float(lower_limit), 'upper_limit': float(upper_limit),
+                'weights': {k: float(v) for k, v in weights.items()}}
+
+    ruta_manifiesto = directorio / MANIFIESTO
+    try:
+        anterior = json.loads(ruta_manifiesto.read_text(encoding='utf-8'))
+    except (FileNotFoundError, json.JSONDecodeError):
+        anterior = {}
+
+    version = _version()
+    fichas = state_numbers(fondo, datos, weights, presupuesto, lower_limit, upper_limit)
+    manifiesto, pendientes = {}, []
+    for numero, fila in enumerate(fichas, start=1):
+        archivo = file_name(numero, fila['Entidad_Federativa'])
+        llave = content_key((version, json.dumps([fila, contexto], sort_keys=True)))
+        manifiesto[archivo] = llave
+        if forzar or anterior.get(archivo) != llave or not (directorio / archivo).exists():
+            pendientes.append((archivo, fila))
+
+    if not (directorio / PLOTLY_JS).exists():
+        from plotly.offline import get_plotlyjs
+
+        _escribir(directorio / PLOTLY_JS, get_plotlyjs())
+
+    if procesos is None:
+        procesos = os.cpu_count() or 1
+    procesos = max(1, min(procesos, len(pendientes)))
+    # un grupo por proceso: cada uno arma el esqueleto de la gráfica una sola vez
+    grupos = [pendientes[i::procesos] for i in range(procesos)] if pendientes else []
+    if procesos == 1:
+        for grupo in grupos:
+            _renderizar((grupo, contexto, str(directorio)))
+    else:
+        with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn')) as pool:
+            list(pool.map(_renderizar, [(g, contexto, str(directorio)) for g in grupos]))
+
+    filas = '\n'.join(
+        f'<tr><td><a href="{archivo}">{html.escape(fila["Entidad_Federativa"])}</a></td>'
+        f'<td class="num">{_pesos(fila["Asignacion_ajustada"])}</td>'
+        f'<td class="num">{_porcentaje(fila["Asignacion_ajustada"] / fila["Asignacion_2025"] - 1)}</td>'
+        f'<td>{_ESTADOS[fila["Estado_banda"]][0]}</td></tr>'
+        for archivo, fila in zip(manifiesto, fichas)
+    )
+    _escribir(directorio / 'index.html', _INDICE.substitute(fondo=html.escape(fondo), filas=filas,
+                                                            escenario=html.escape(nombre or 'sin nombre')))
+    # el manifiesto va al final: si algo falla antes, la siguiente corrida repite lo pendiente
+    _escribir(ruta_manifiesto, json.dumps(manifiesto, indent=1, sort_keys=True))
+    return {
+        'directorio': str(directorio),
+        'generados': [archivo for archivo, _ in pendientes],
+        'sin_cambios': len(fichas) - len(pendientes),
+        'segundos': round(time.perf_counter() - start, 3),
+    }
+
+
+def reports_zip(fondo: str, datos: pd.DataFrame, weights: dict, presupuesto: float,
+                lower_limit: float, upper_limit: float, nombre: str = '') -> bytes:
+    """Las fichas en un ZIP, para `st.download_button`; se generan en el proceso de la app."""
+    with tempfile.TemporaryDirectory() as directorio:
+        render_reports(fondo, datos, weights, presupuesto, lower_limit, upper_limit, directorio, nombre, procesos=1)
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archivo:
+            for ruta in sorted(Path(directorio).iterdir()):
+                if ruta.name != MANIFIESTO:
+                    archivo.write(ruta, ruta.name)
+        return buffer.getvalue()
+
+
+def main(argv=None):
+    from asignacion.biblioteca import biblioteca
+    from asignacion.formatos import SCHEMAS, read_dataset
+
+    parser = argparse.ArgumentParser(description='Genera las fichas por Entidad Federativa de un escenario guardado')
+    parser.add_argument('--id', type=int, required=True, help='escenario de la biblioteca')
+    parser.add_argument('--salida', type=Path, required=True, help='directorio de las fichas')
+    parser.add_argument('--procesos', type=int, help='procesos en paralelo (por omisión, uno por CPU)')
+    parser.add_argument('--forzar', action='store_true', help='genera todas las fichas, aunque no hayan cambiado')
+    args = parser.parse_args(argv)
+
+    try:
+        escenario = biblioteca.load([args.id])['escenarios'][0]
+    except KeyError as error:
+        print(error.args[0], file=sys.stderr)
+        return 1
+    contenido = biblioteca.load_data(escenario['datos'])
+    if contenido is None:
+        print(f"El archivo de datos del escenario {args.id} no está en la biblioteca", file=sys.stderr)
+        return 1
+    datos = read_dataset(contenido, SCHEMAS[escenario['fondo']])
+    try:
+        resumen = render_reports(escenario['fondo'], datos, escenario['weights'], escenario['presupuesto'],
+                                 escenario['lower_limit'], escenario['upper_limit'], args.salida,
+                                 escenario['nombre'], args.procesos, args.forzar)
+    except BandasInfactibles as error:
+        print(f'Escenario {args.id}: {error}', file=sys.stderr)
+        return 1
+    print(f"{len(resumen['generados'])} fichas generadas y {resumen['sin_cambios']} sin cambios "
+          f"en {resumen['directorio']} en {resumen['segundos']} s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
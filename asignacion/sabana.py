@@ -0,0 +1,240 @@
+"""
+Sábana de datos en Excel: el cálculo completo de un escenario, hoja por hoja, en memoria constante.
+
+La pestaña "Sábana de Datos" sólo mostraba el DataFrame y remitía a una hoja de cálculo en
+SharePoint con el procedimiento. `write_workbook` escribe el cálculo del escenario en un
+XLSX con una hoja por etapa:
+
+- Parametros: fondo, presupuesto, bandas y ponderadores;
+- Datos: las variables de entrada;
+- Proporciones: la proporción normalizada de cada indicador;
+- Montos: el monto de cada indicador (`Monto_*`), el reparto y la asignación bruta;
+- Bandas: una fila por Entidad Federativa e iteración del rebalanceo (asignación al inicio,
+  cotas, excedente o faltante, si recibe remanente, reparto y asignación al final);
+- Resultado: asignación 2025, 2026 y ajustada, con sus variaciones.
+
+Cada etapa se calcula y se escribe antes de pasar a la siguiente, con xlsxwriter en modo
+`constant_memory`: cada fila va al archivo temporal de su hoja en cuanto se escribe, así que
+la memoria no crece con las filas (ni con las iteraciones de la hoja Bandas). Un escenario
+de 32 Entidades tarda unos milisegundos.
+
+Para exportar escenarios de la biblioteca (ver `asignacion.biblioteca`), un libro por
+escenario, en varios procesos:
+
+    python -m asignacion.sabana --fondo FASP --salida sabanas/ --procesos 4
+    python -m asignacion.sabana --ids 12 15 18 --salida sabanas/
+"""
+
+import argparse
+import io
+import multiprocessing
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from asignacion.centavos import band_bounds, rebalance_centavos, to_pesos
+from asignacion.indice import (
+    FASP_VARIABLES, FOFISP_VARIABLES, calculate_index, direct_proportion_normalize, shifted_proportion_normalize,
+)
+
+
+# variables y normalización de cada fondo (las mismas que usan sus apps)
+FONDOS = {
+    'FASP': (FASP_VARIABLES, direct_proportion_normalize),
+    'FOFISP': (FOFISP_VARIABLES, shifted_proportion_normalize),
+}
+
+# formato de Excel por tipo de columna
+_FORMATOS = {
+    'pesos': {'num_format': '$#,##0.00'},
+    'centavos': {'num_format': '#,##0'},
+    'porcentaje': {'num_format': '0.00%'},
+    'proporcion': {'num_format': '0.000000'},
+}
+
+
+def _formato(columna: str) -> str | None:
+    if columna.endswith('_centavos'):
+        return 'centavos'
+    if columna.startswith(('Monto', 'Asignacion', 'Cota', 'Excedente', 'Reparto_remanente', 'Remanente')):
+        return 'pesos'
+    if columna.startswith('Var%') or columna in ('Ponderador', 'Banda'):
+        return 'porcentaje'
+    if columna.endswith('_prop') or columna == 'Reparto':
+        return 'proporcion'
+    return None
+
+
+def band_history(previo, bruta, reparto, lower_limit: float, upper_limit: float,
+                 entidades, max_iterations: int = 20) -> tuple[np.ndarray, pd.DataFrame]:
+    """
+    Rebalanceo con el estado de cada iteración: la asignación ajustada (centavos) y una
+    fila por iteración y Entidad Federativa, en pesos.
+    """
+    lower, upper = band_bounds(previo, lower_limit, upper_limit)
+    historial = []
+    ajustada, _ = rebalance_centavos(bruta, reparto, lower, upper, max_iterations=max_iterations,
+                                     historial=historial)
+    n = len(lower)
+    if not historial:
+        return ajustada, pd.DataFrame(columns=['Iteracion', 'Entidad_Federativa'])
+
+    inicio = np.concatenate([h['asignacion'] for h in historial])
+    cota_inferior, cota_superior = np.tile(lower, len(historial)), np.tile(upper, len(historial))
+    reparto_remanente = np.concatenate([h['reparto'] for h in historial])
+    fin = np.clip(inicio, cota_inferior, cota_superior) + reparto_remanente
+    return ajustada, pd.DataFrame({
+        'Iteracion': np.repeat(np.arange(1, len(historial) + 1), n),
+        'Entidad_Federativa': np.tile(np.asarray(entidades, dtype=object), len(historial)),
+        'Asignacion_inicio': to_pesos(inicio),
+        'Cota_inferior': to_pesos(cota_inferior),
+        'Cota_superior': to_pesos(cota_superior),
+        'Estado': np.select([inicio > cota_superior, inicio < cota_inferior], ['Arriba de la banda', 'Debajo de la banda'],
+                            'Dentro de la banda'),
+        'Excedente': to_pesos(np.maximum(inicio - cota_superior, 0) - np.maximum(cota_inferior - inicio, 0)),
+        'Remanente_iteracion': to_pesos(np.repeat([int(h['remanente'][0]) for h in historial], n)),
+        'Recibe_remanente': np.concatenate([h['elegibles'] for h in historial]),
+        'Reparto_remanente': to_pesos(reparto_remanente),
+        'Asignacion_fin': to_pesos(fin),
+    })
+
+
+def worksheets(fondo: str, datos: pd.DataFrame, weights: dict, presupuesto: float,
+               lower_limit: float, upper_limit: float, nombre: str = ''):
+    """
+    Hojas de la sábana, una a la vez: `(nombre de la hoja, DataFrame)`. Cada etapa se calcula
+    al pedir su hoja, así que quien escribe sólo tiene una en memoria.
+    """
+    variable_map, normalize = FONDOS[fondo]
+    entidad = datos[['Entidad_Federativa']].reset_index(drop=True)
+    datos = datos.reset_index(drop=True)
+
+    yield 'Parametros', pd.DataFrame({
+        'Concepto': ['Escenario', 'Fondo', 'Fecha', 'Presupuesto', 'Banda inferior', 'Banda superior']
+                    + [f'Ponderador {v}' for v in weights],
+        'Valor': [nombre, fondo, datetime.now().strftime('%Y-%m-%d %H:%M'), presupuesto, lower_limit, upper_limit]
+                 + [float(w) for w in weights.values()],
+    })
+    yield 'Datos', datos
+
+    sabana = calculate_index(datos, weights, presupuesto, variable_map=variable_map, normalize=normalize)
+    yield 'Proporciones', pd.concat([entidad, sabana[[f'{v}_prop' for v in variable_map]]], axis=1)
+    montos = [c for c in sabana.columns if c.startswith('Monto_')]
+    yield 'Montos', pd.concat([entidad, sabana[montos + ['Reparto', 'Asignacion_Bruta_centavos', 'Asignacion_Bruta']]], axis=1)
+
+    bruta = sabana['Asignacion_Bruta_centavos'].to_numpy()
+    ajustada, bandas = band_history(datos['Asignacion_2025'].to_numpy(), bruta, sabana['Reparto'].to_numpy(),
+                                    lower_limit, upper_limit, datos['Entidad_Federativa'])
+    del sabana
+    yield 'Bandas', bandas
+
+    previo = datos['Asignacion_2025']
+    yield 'Resultado', entidad.assign(
+        Asignacion_2025=previo,
+        Asignacion_2026=to_pesos(bruta),
+        **{'Var%': to_pesos(bruta) / previo - 1},
+        Asignacion_ajustada_centavos=ajustada,
+        Asignacion_ajustada=to_pesos(ajustada),
+        **{'Var%_ajustada': to_pesos(ajustada) / previo - 1},
+    )
+
+
+def write_workbook(destino, fondo: str, datos: pd.DataFrame, weights: dict, presupuesto: float,
+                   lower_limit: float, upper_limit: float, nombre: str = ''):
+    """Escribe la sábana del escenario en `destino` (ruta o archivo binario) hoja por hoja."""
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(destino, {'constant_memory': True, 'nan_inf_to_errors': True})
+    encabezado = workbook.add_format({'bold': True, 'font_color': '#ffffff', 'bg_color': '#691c32', 'text_wrap': True})
+    formatos = {k: workbook.add_format(v) for k, v in _FORMATOS.items()}
+    try:
+        for hoja, frame in worksheets(fondo, datos, weights, presupuesto, lower_limit, upper_limit, nombre):
+            worksheet = workbook.add_worksheet(hoja)
+            columnas = [str(c) for c in frame.columns]
+            # con constant_memory las filas se escriben en orden: formatos y anchos primero
+            for j, columna in enumerate(columnas):
+                worksheet.set_column(j, j, max(12, min(len(columna) + 2, 40)), formatos.get(_formato(columna)))
+            worksheet.freeze_panes(1, 1)
+            worksheet.write_row(0, 0, columnas, encabezado)
+            for i, fila in enumerate(frame.itertuples(index=False, name=None), start=1):
+                worksheet.write_row(i, 0, [v.item() if isinstance(v, np.generic) else v for v in fila])
+            del frame
+    finally:
+        workbook.close()
+
+
+def workbook_bytes(fondo: str, datos: pd.DataFrame, weights: dict, presupuesto: float,
+                   lower_limit: float, upper_limit: float, nombre: str = '') -> bytes:
+    """`write_workbook` en bytes, para `st.download_button`."""
+    buffer = io.BytesIO()
+    write_workbook(buffer, fondo, datos, weights, presupuesto, lower_limit, upper_limit, nombre)
+    return buffer.getvalue()
+
+
+def _exportar(args) -> tuple[int, str, float]:
+    # un escenario en un proceso del pool: sólo recibe valores, no abre la biblioteca
+    escenario, contenido, destino = args
+    from asignacion.formatos import SCHEMAS, read_dataset
+
+    start = time.perf_counter()
+    datos = read_dataset(contenido, SCHEMAS[escenario['fondo']])
+    write_workbook(destino, escenario['fondo'], datos, escenario['weights'], escenario['presupuesto'],
+                   escenario['lower_limit'], escenario['upper_limit'], escenario['nombre'])
+    return escenario['id'], destino, time.perf_counter() - start
+
+
+def export_batch(ids, directorio, procesos: int | None = None, biblioteca=None):
+    """
+    Un libro por escenario guardado (`{id}_{nombre}.xlsx` en `directorio`), en `procesos`
+    procesos (por omisión, uno por CPU). Regresa `(id, archivo, segundos)` por escenario.
+    """
+    if biblioteca is None:
+        from asignacion.biblioteca import biblioteca
+    directorio = Path(directorio)
+    directorio.mkdir(parents=True, exist_ok=True)
+
+    tareas = []
+    for escenario in biblioteca.load(ids)['escenarios']:
+        contenido = biblioteca.load_data(escenario['datos'])
+        if contenido is None:
+            raise KeyError(f"El archivo de datos del escenario {escenario['id']} no está en la biblioteca")
+        archivo = re.sub(r'[^\w-]+', '_', f"{escenario['id']}_{escenario['nombre']}").strip('_')
+        tareas.append((escenario, contenido, str(directorio / f'{archivo}.xlsx')))
+
+    if procesos == 1 or len(tareas) <= 1:
+        return [_exportar(t) for t in tareas]
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return list(pool.map(_exportar, tareas, chunksize=max(1, len(tareas) // (4 * (procesos or 4)))))
+
+
+def main(argv=None):
+    from asignacion.biblioteca import biblioteca
+
+    parser = argparse.ArgumentParser(description='Exporta la sábana de datos de escenarios guardados a Excel')
+    parser.add_argument('--ids', type=int, nargs='+', help='escenarios de la biblioteca')
+    parser.add_argument('--fondo', choices=list(FONDOS), help='todos los escenarios guardados de un fondo')
+    parser.add_argument('--etiqueta', action='append', default=[], help='sólo los escenarios con esta etiqueta')
+    parser.add_argument('--salida', type=Path, required=True, help='directorio de los libros')
+    parser.add_argument('--procesos', type=int, help='procesos en paralelo (por omisión, uno por CPU)')
+    args = parser.parse_args(argv)
+
+    ids = args.ids or biblioteca.search(args.fondo, args.etiqueta, limit=100_000)['id'].tolist()
+    if not ids:
+        print('No hay escenarios que exportar', file=sys.stderr)
+        return 1
+    start = time.perf_counter()
+    resultados = export_batch(ids, args.salida, args.procesos, biblioteca)
+    tiempos = [r[2] for r in resultados]
+    print(f'{len(resultados)} libros en {args.salida} en {time.perf_counter() - start:.2f} s '
+          f'(mediana {np.median(tiempos) * 1000:.0f} ms por libro)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,42 @@
+"""
+Operaciones segmentadas sobre filas ordenadas por grupo (p. ej. municipios ordenados por estado).
+
+Un segmento se describe con el índice de su primera fila (`starts`) y su número de filas
+(`counts`). Un arreglo sin segmentos explícitos es un solo segmento con todas sus filas.
+"""
+
+import numpy as np
+
+
+def segment_starts(codes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Regresa el índice de inicio y el número de filas de cada segmento.
+    `codes` debe venir ordenado (todas las filas de un mismo estado juntas).
+    """
+    codes = np.asarray(codes)
+    if codes.size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    counts = np.diff(np.r_[starts, codes.size])
+    return starts, counts
+
+
+def single_segment(n: int) -> tuple[np.ndarray, np.ndarray]:
+    """Todo el arreglo como un solo segmento (p. ej. las 32 Entidades Federativas)."""
+    return np.array([0]), np.array([n])
+
+
+def segsum(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    # suma por segmento (funciona igual para vectores y matrices fila x indicador)
+    return np.add.reduceat(values, starts, axis=0)
+
+
+def broadcast(per_segment: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    # repite el valor de cada segmento en todas sus filas
+    return np.repeat(per_segment, counts, axis=0)
+
+
+def segment_ids(counts: np.ndarray) -> np.ndarray:
+    # número de segmento de cada fila
+    return np.repeat(np.arange(len(counts)), counts)
@@ -0,0 +1,374 @@
+"""
+Servicio HTTP local con el motor de asignación de FASP y FOFISP.
+
+Para notebooks (p. ej. `fasp_app/auxiliary.ipynb`), hojas de cálculo y otras herramientas que
+hoy sólo pueden obtener una asignación a través de la interfaz de Streamlit. Se ejecuta con
+
+    python -m asignacion.servicio --port 8600
+
+Rutas:
+
+- `POST /datasets?fondo=FASP` (o `FOFISP`), cuerpo: el archivo (CSV, Parquet o Arrow) que se
+  sube a la app. Se valida igual que en las apps (`asignacion.validacion`): si tiene errores,
+  la respuesta es 400 con el reporte. Regresa `{"dataset": id}`; el id es el hash del
+  contenido, así que registrar dos veces el mismo archivo no repite la lectura ni la
+  normalización. Los datasets se guardan también en el
+  caché en disco (ver `asignacion.disco`): un id sigue siendo válido después de reiniciar.
+- `POST /asignacion`, cuerpo JSON:
+  `{"dataset": id, "weights": {...}, "presupuesto": ..., "lower_limit": ..., "upper_limit": ...}`
+  o `{"dataset": id, "escenarios": [{...}, ...]}`. Con `?formato=arrow` la respuesta es una
+  tabla Arrow (IPC stream) en lugar de JSON. Los ponderadores deben ser los del fondo, finitos
+  y no negativos, y las bandas finitas con -1 <= lower_limit <= upper_limit; si no, 400.
+- `GET /stats`: latencia p50/p99 de `/asignacion` y tamaño de los micro-lotes.
+
+Micro-lotes: los escenarios que llegan casi al mismo tiempo (dentro de `--ventana` ms) para
+el mismo dataset se resuelven juntos en una sola llamada a `scenario_batch`.
+
+Ejemplo desde un notebook:
+
+    requests.post(f'{url}/asignacion', json={'dataset': id, 'weights': weights,
+                  'presupuesto': 9_941_162_915.0, 'lower_limit': 0.0, 'upper_limit': 0.1}).json()
+"""
+
+import argparse
+import io
+import json
+import math
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from asignacion.centavos import BandasInfactibles, band_bounds, check_bands, to_pesos
+from asignacion.escenarios import normalized_matrix, weight_matrix, scenario_batch
+from asignacion.disco import disk_cache
+from asignacion.grafo import content_key
+from asignacion.validacion import validate_dataset
+from asignacion.indice import (
+    FASP_VARIABLES,
+    FOFISP_VARIABLES,
+    direct_proportion_normalize,
+    shifted_proportion_normalize,
+)
+
+
+# variables y normalización de cada fondo (las mismas que usan las apps)
+FONDOS = {
+    'FASP': (FASP_VARIABLES, direct_proportion_normalize),
+    'FOFISP': (FOFISP_VARIABLES, shifted_proportion_normalize),
+}
+
+
+class ErrorSolicitud(ValueError):
+    """Solicitud inválida; el servicio responde 400 con el mensaje (y `reporte`, si lo hay)."""
+
+    def __init__(self, mensaje: str, reporte: dict | None = None):
+        super().__init__(mensaje)
+        self.reporte = reporte
+
+
+class Dataset:
+    """Un archivo registrado: la matriz normalizada y la referencia de las bandas."""
+
+    def __init__(self, fondo: str, data: pd.DataFrame):
+        if fondo not in FONDOS:
+            raise ErrorSolicitud(f'Fondo desconocido: {fondo!r} (use FASP o FOFISP)')
+        data = data.rename(columns={'Entidad': 'Entidad_Federativa'})
+        self.variable_map, normalize = FONDOS[fondo]
+        faltantes = [c for c in [*self.variable_map, 'Entidad_Federativa', 'Asignacion_2025'] if c not in data]
+        if faltantes:
+            raise ErrorSolicitud(f'Faltan columnas en el archivo: {", ".join(faltantes)}')
+
+        self.fondo = fondo
+        self.entidades = data['Entidad_Federativa'].astype(str).tolist()
+        self.previo = data['Asignacion_2025'].to_numpy(dtype=np.float64)
+        self.props = normalized_matrix(data, self.variable_map, normalize)
+
+
+class MicroLotes:
+    """
+    Junta las solicitudes que llegan dentro de `window` segundos y las resuelve con una
+    llamada a `run(dataset, escenarios)` por dataset. Cada solicitud recibe un Future.
+    """
+
+    def __init__(self, run, window: float = 0.002, max_batch: int = 512):
+        self.run = run
+        self.window = window
+        self.max_batch = max_batch
+        self.sizes = deque(maxlen=10_000)
+        self._queue = queue.Queue()
+        threading.Thread(target=self._loop, daemon=True, name='micro-lotes').start()
+
+    def submit(self, dataset, escenario) -> Future:
+        future = Future()
+        self._queue.put((dataset, escenario, future))
+        return future
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            grupos = {}
+            for dataset, escenario, future in batch:
+                grupos.setdefault(id(dataset), (dataset, []))[1].append((escenario, future))
+            for dataset, items in grupos.values():
+                self.sizes.append(len(items))
+                try:
+                    results = self.run(dataset, [escenario for escenario, _ in items])
+                except Exception as error:
+                    for _, future in items:
+                        future.set_exception(error)
+                else:
+                    for (_, future), result in zip(items, results):
+                        future.set_result(result)
+
+
+def allocate(dataset: Dataset, escenarios: list[dict]) -> list[dict]:
+    """Resuelve varios escenarios (ya validados) de un dataset con una sola llamada al motor."""
+    result = scenario_batch(
+        dataset.props, weight_matrix([e['weights'] for e in escenarios], dataset.variable_map),
+        [e['presupuesto'] for e in escenarios], dataset.previo,
+        [e['lower_limit'] for e in escenarios], [e['upper_limit'] for e in escenarios],
+    )
+    return [
+        {'bruta': result['bruta'][i], 'ajustada': result['ajustada'][i], 'iteraciones': int(result['iteraciones'][i]),
+         'factible': bool(result['factible'][i])}
+        for i in range(len(escenarios))
+    ]
+
+
+def _validate(dataset: Dataset, escenario) -> dict:
+    # se valida antes de entrar al lote: un escenario inválido no debe tumbar a los demás
+    if not isinstance(escenario, dict) or not isinstance(escenario.get('weights'), dict):
+        raise ErrorSolicitud('Cada escenario necesita "weights" (un objeto) y "presupuesto"')
+    faltantes = [c for c in dataset.variable_map if c not in escenario['weights']]
+    if faltantes:
+        raise ErrorSolicitud(f'Faltan ponderadores: {", ".join(faltantes)}')
+    # 'Monto base' sólo existe en el FASP (la app del FOFISP no lo tiene)
+    permitidos = [*dataset.variable_map, *(['Monto base'] if dataset.fondo == 'FASP' else [])]
+    desconocidos = [c for c in escenario['weights'] if c not in permitidos]
+    if desconocidos:
+        raise ErrorSolicitud(f'Ponderadores desconocidos para el {dataset.fondo}: {", ".join(map(str, desconocidos))}')
+    try:
+        validado = {
+            'weights': {c: float(v) for c, v in escenario['weights'].items()},
+            'presupuesto': float(escenario['presupuesto']),
+            'lower_limit': float(escenario.get('lower_limit', 0.0)),
+            'upper_limit': float(escenario.get('upper_limit', 0.1)),
+        }
+    except (KeyError, TypeError, ValueError):
+        raise ErrorSolicitud('"presupuesto", las bandas y los ponderadores deben ser números') from None
+    # NaN, infinitos o negativos llegarían al motor como centavos sin sentido
+    invalidos = [c for c, v in validado['weights'].items() if not (math.isfinite(v) and v >= 0)]
+    if invalidos:
+        raise ErrorSolicitud(f'Los ponderadores deben ser números finitos no negativos: {", ".join(invalidos)}')
+    if not (math.isfinite(validado['presupuesto']) and validado['presupuesto'] >= 0):
+        raise ErrorSolicitud('"presupuesto" debe ser un número finito no negativo')
+    lower_limit, upper_limit = validado['lower_limit'], validado['upper_limit']
+    if not (math.isfinite(lower_limit) and math.isfinite(upper_limit) and -1 <= lower_limit <= upper_limit):
+        raise ErrorSolicitud('Las bandas deben ser números finitos con -1 <= lower_limit <= upper_limit')
+    return validado
+
+
+def _json_result(dataset: Dataset, result: dict) -> dict:
+    return {
+        'Entidad_Federativa': dataset.entidades,
+        'Asignacion_Bruta': to_pesos(result['bruta']).tolist(),
+        'Asignacion_ajustada': to_pesos(result['ajustada']).tolist(),
+        'Asignacion_ajustada_centavos': result['ajustada'].tolist(),
+        'iteraciones': result['iteraciones'],
+    }
+
+
+def _arrow_result(dataset: Dataset, results: list[dict]) -> bytes:
+    # tabla larga: una fila por escenario y Entidad Federativa
+    n = len(dataset.entidades)
+    bruta = np.concatenate([r['bruta'] for r in results])
+    ajustada = np.concatenate([r['ajustada'] for r in results])
+    table = pa.table({
+        'escenario': np.repeat(np.arange(len(results)), n),
+        'Entidad_Federativa': dataset.entidades * len(results),
+        'Asignacion_Bruta_centavos': bruta,
+        'Asignacion_ajustada_centavos': ajustada,
+        'Asignacion_Bruta': to_pesos(bruta),
+        'Asignacion_ajustada': to_pesos(ajustada),
+        'iteraciones': np.repeat([r['iteraciones'] for r in results], n),
+    })
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+class Servicio:
+    """Estado del servicio: datasets registrados, micro-lotes y latencias."""
+
+    def __init__(self, window: float = 0.002, disco=disk_cache):
+        self.datasets = {}
+        self.disco = disco
+        self.lotes = MicroLotes(allocate, window)
+        self.latencias = deque(maxlen=10_000)
+        self._lock = threading.Lock()
+
+    def register(self, fondo: str, body: bytes) -> str:
+        key = content_key((fondo, body))
+        if self.dataset(key) is not None:
+            return key
+        if fondo not in FONDOS:
+            raise ErrorSolicitud(f'Fondo desconocido: {fondo!r} (use FASP o FOFISP)')
+        # el mismo esquema y los mismos rangos que las apps: lo que ellas rechazan, aquí también
+        reporte = validate_dataset(body, fondo)
+        if not reporte.ok:
+            raise ErrorSolicitud(reporte.message(), reporte.to_dict())
+        dataset = Dataset(fondo, reporte.datos)
+        with self._lock:
+            self.datasets.setdefault(key, dataset)
+        if self.disco is not None:
+            self.disco.set(('dataset', key), dataset)
+        return key
+
+    def dataset(self, key) -> Dataset | None:
+        dataset = self.datasets.get(key)
+        if dataset is None and isinstance(key, str) and self.disco is not None:
+            dataset = self.disco.get(('dataset', key))
+            if dataset is not None:
+                with self._lock:
+                    dataset = self.datasets.setdefault(key, dataset)
+        return dataset
+
+    def allocate(self, request) -> tuple[Dataset, list[dict]]:
+        if not isinstance(request, dict):
+            raise ErrorSolicitud('El cuerpo debe ser un objeto JSON')
+        key = request.get('dataset')
+        if not isinstance(key, str):
+            raise ErrorSolicitud('"dataset" debe ser el id (texto) que regresó /datasets')
+        dataset = self.dataset(key)
+        if dataset is None:
+            raise ErrorSolicitud('Dataset no registrado; súbalo primero a /datasets')
+        escenarios = request['escenarios'] if 'escenarios' in request else [request]
+        if not isinstance(escenarios, list):
+            raise ErrorSolicitud('"escenarios" debe ser una lista')
+        escenarios = [_validate(dataset, e) for e in escenarios]
+        futures = [self.lotes.submit(dataset, e) for e in escenarios]
+        results = [f.result() for f in futures]
+        for i, (escenario, result) in enumerate(zip(escenarios, results)):
+            if not result['factible']:
+                # el lote no se detiene por un escenario infactible; la solicitud sí
+                lower, upper = band_bounds(dataset.previo, escenario['lower_limit'], escenario['upper_limit'])
+                try:
+                    check_bands(result['bruta'], lower, upper)
+                except BandasInfactibles as error:
+                    raise ErrorSolicitud(f'Escenario {i}: {error}' if len(escenarios) > 1 else str(error)) from None
+        return dataset, results
+
+    def stats(self) -> dict:
+        latencias = np.array(self.latencias) * 1000
+        sizes = np.array(self.lotes.sizes)
+        return {
+            'solicitudes': int(latencias.size),
+            'p50_ms': float(np.percentile(latencias, 50)) if latencias.size else None,
+            'p99_ms': float(np.percentile(latencias, 99)) if latencias.size else None,
+            'lotes': int(sizes.size),
+            'escenarios_por_lote': float(sizes.mean()) if sizes.size else None,
+            'datasets': len(self.datasets),
+            'disco': self.disco.stats() if self.disco is not None else None,
+        }
+
+
+def make_handler(servicio: Servicio):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _send(self, status: int, body: bytes, content_type='application/json'):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self, status: int, value):
+            self._send(status, json.dumps(value, ensure_ascii=False).encode())
+
+        def _body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        def do_GET(self):
+            if urlparse(self.path).path == '/stats':
+                self._json(200, servicio.stats())
+            else:
+                self._json(404, {'error': 'Ruta no encontrada'})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            try:
+                if url.path == '/datasets':
+                    fondo = params.get('fondo', ['FASP'])[0].upper()
+                    self._json(200, {'dataset': servicio.register(fondo, self._body()), 'fondo': fondo})
+                elif url.path == '/asignacion':
+                    start = time.perf_counter()
+                    try:
+                        request = json.loads(self._body())
+                    except ValueError:
+                        raise ErrorSolicitud('El cuerpo debe ser JSON') from None
+                    dataset, results = servicio.allocate(request)
+                    if params.get('formato', ['json'])[0] == 'arrow':
+                        self._send(200, _arrow_result(dataset, results), 'application/vnd.apache.arrow.stream')
+                    elif 'escenarios' in request:
+                        self._json(200, {'escenarios': [_json_result(dataset, r) for r in results]})
+                    else:
+                        self._json(200, _json_result(dataset, results[0]))
+                    servicio.latencias.append(time.perf_counter() - start)
+                else:
+                    self._json(404, {'error': 'Ruta no encontrada'})
+            except ErrorSolicitud as error:
+                self._json(400, {'error': str(error), **({'reporte': error.reporte} if error.reporte else {})})
+            except Exception as error:
+                self._json(500, {'error': f'{type(error).__name__}: {error}'})
+
+        def log_message(self, format, *args):
+            # sin una línea en la consola por cada solicitud
+            pass
+
+    return Handler
+
+
+class Servidor(ThreadingHTTPServer):
+    # la cola de conexiones por omisión (5) se desborda con unos cuantos clientes a la vez
+    request_queue_size = 128
+
+
+def serve(host: str = '127.0.0.1', port: int = 8600, window: float = 0.002) -> Servidor:
+    """Crea el servidor (sin arrancarlo); `serve_forever()` lo pone a atender."""
+    servicio = Servicio(window)
+    server = Servidor((host, port), make_handler(servicio))
+    server.servicio = servicio
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Servicio HTTP local de asignación (FASP/FOFISP)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--ventana', type=float, default=2.0, help='ventana de micro-lotes en ms')
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.ventana / 1000)
+    print(f'Servicio de asignación en http://{args.host}:{args.port}')
+    server.serve_forever()
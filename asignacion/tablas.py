@@ -0,0 +1,110 @@
+"""
+Caché de tablas ya renderizadas, compartido por todas las sesiones del proceso.
+
+Construir y renderizar un `GT` o un `Styler` cuesta más que el cálculo de la asignación
+y sus entradas casi nunca cambian. Aquí se guarda:
+
+- el HTML de las tablas GT, listo para `st.html`;
+- la tabla Arrow con los datos y los formatos de columna para `st.dataframe`: el formato
+  lo aplica el navegador (`column_config`), así que el servidor no vuelve a formatear
+  celda por celda y las columnas siguen siendo numéricas (se ordenan bien).
+
+La llave combina el hash del contenido del DataFrame con la especificación del formato
+(el código de la función que arma la tabla GT); las tablas Arrow no dependen del formato. La
+memoria está acotada en bytes; al llenarse se descartan las tablas usadas hace más tiempo.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+
+import pyarrow as pa
+import streamlit as st
+
+from asignacion.grafo import code_key, content_key
+
+
+class RenderCache:
+    """LRU acotado por tamaño (bytes), seguro entre hilos (una sesión de Streamlit = un hilo)."""
+
+    def __init__(self, max_bytes: int = 64 * 2**20):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_render(self, key, render, size):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key][0]
+            self.misses += 1
+
+        # se renderiza fuera del candado; si dos sesiones coinciden, ambas calculan lo mismo
+        value = render()
+        nbytes = size(value)
+        with self._lock:
+            if key not in self._items and nbytes <= self.max_bytes:
+                self._items[key] = (value, nbytes)
+                self.nbytes += nbytes
+                while self.nbytes > self.max_bytes:
+                    _, (_, dropped) = self._items.popitem(last=False)
+                    self.nbytes -= dropped
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+
+
+# una sola instancia por proceso
+render_cache = RenderCache()
+
+
+def gt_html(frame, build) -> str:
+    """HTML de `build(frame)` (un GT) desde el caché; `build` no debe depender de nada más."""
+    key = ('gt', content_key(frame), code_key(build))
+    # _repr_html_ es lo que usa st.html con un objeto GT
+    return render_cache.get_or_render(key, lambda: build(frame)._repr_html_(), len)
+
+
+def column_format(fmt: str) -> str:
+    """
+    Traduce un formato de `Styler.format` ('${:,.2f}', '{:.2f}%', '{:.2%}', ...) al formato
+    equivalente de `st.column_config.NumberColumn`.
+    """
+    match = re.fullmatch(r'(.*)\{:(,?)\.(\d+)([f%])\}(.*)', fmt)
+    if match is None:
+        raise ValueError(f'Formato no soportado: {fmt!r}')
+    prefix, comma, decimals, kind, suffix = match.groups()
+
+    if kind == '%':
+        return 'percent'
+    if comma and prefix == '$' and decimals == '2' and not suffix:
+        return 'dollar'
+    if comma and not prefix and not suffix:
+        return 'localized'
+    return f"{prefix.replace('%', '%%')}%.{decimals}f{suffix.replace('%', '%%')}"
+
+
+def formatted_table(frame, formats: dict, index: bool = True) -> dict:
+    """
+    Argumentos para `st.dataframe(**formatted_table(df, {...}))`: la tabla Arrow y su
+    `column_config`. Reemplaza a `df.style.format({...})` cuando el Styler sólo da formato.
+    """
+    formats = {col: fmt for col, fmt in formats.items() if col in frame.columns}
+    # el formato no cambia los datos Arrow, sólo el column_config
+    key = ('arrow', content_key(frame), index)
+    table = render_cache.get_or_render(
+        key, lambda: pa.Table.from_pandas(frame, preserve_index=index), lambda t: t.nbytes,
+    )
+    return {
+        'data': table,
+        'column_config': {
+            col: st.column_config.NumberColumn(format=column_format(fmt)) for col, fmt in formats.items()
+        },
+    }
@@ -0,0 +1,400 @@
+"""
+Trabajos pesados (lotes de escenarios, barridos, simulaciones) fuera del hilo de la sesión.
+
+Streamlit atiende todas las sesiones en hilos de un mismo proceso, así que un cálculo largo
+en el script compite por el GIL con las demás sesiones. Aquí los trabajos se mandan a un
+pool de procesos compartido, creado una vez por proceso y precalentado: sus procesos ya
+importaron numpy, pandas y el motor cuando llega el primer trabajo.
+
+Un trabajo se divide en bloques independientes (p. ej. 1,000 escenarios cada uno). El avance
+es la fracción de bloques terminados y cancelar un trabajo descarta los bloques que aún no
+empiezan; un bloque en curso termina, pero su resultado se ignora.
+
+Los bloques no van directo al pool: el planificador (`Planificador`) los reparte según la
+prioridad del trabajo y los límites por usuario, de modo que unas cuantas simulaciones
+grandes no dejan sin procesos al trabajo interactivo de los demás. Todo corre dentro del
+proceso de Streamlit, sin broker externo.
+
+Para lo que usa funciones del script de la app (que los procesos del pool no pueden
+importar) hay `Tarea`: pasos en un hilo del mismo proceso, p. ej. adelantar el cálculo
+mientras se lee el reporte ejecutivo.
+
+Con `persist=True` el resultado de cada bloque se guarda en el caché en disco (ver
+`asignacion.disco`) al terminar el trabajo; el mismo trabajo después de un reinicio ya no
+pasa por el pool.
+"""
+
+import contextlib
+import heapq
+import itertools
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import types
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from asignacion.disco import disk_cache
+from asignacion.grafo import content_key
+
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+# clases de prioridad: el trabajo interactivo (un escenario) va antes que los lotes
+INTERACTIVO = 0
+LOTE = 1
+
+
+def _warm():
+    # se ejecuta al arrancar cada proceso del pool
+    import numpy  # noqa: F401
+    import pandas  # noqa: F401
+    import asignacion  # noqa: F401
+    import asignacion.escenarios  # noqa: F401
+
+
+def _ping():
+    return os.getpid()
+
+
+@contextlib.contextmanager
+def _empty_main():
+    # Streamlit ejecuta el script de la app como `__main__` y 'spawn' lo volvería a
+    # ejecutar en cada proceso nuevo; mientras arrancan se usa un `__main__` vacío
+    main = sys.modules['__main__']
+    sys.modules['__main__'] = types.ModuleType('__main__')
+    try:
+        yield
+    finally:
+        sys.modules['__main__'] = main
+
+
+def worker_pool(max_workers: int | None = None) -> ProcessPoolExecutor:
+    """
+    Pool de procesos del proceso de Streamlit (se crea con la primera llamada).
+
+    Usa 'spawn' para no copiar los hilos del servidor al crear los procesos; por eso
+    `_warm` importa el motor en cada uno y se mandan tareas vacías para arrancarlos todos
+    desde el principio. Por omisión usa la mitad de los CPUs (o `ASIGNACION_WORKERS`),
+    para dejar lugar a las sesiones interactivas.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None:
+            max_workers = (max_workers or _pool_workers or int(os.environ.get('ASIGNACION_WORKERS', 0))
+                           or max(1, (os.cpu_count() or 2) // 2))
+            _pool_workers = max_workers
+            _pool = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_warm,
+            )
+            # cada tarea vacía arranca un proceso (el pool los crea conforme llegan tareas)
+            with _empty_main():
+                for _ in range(max_workers):
+                    _pool.submit(_ping)
+        return _pool
+
+
+def _discard_pool():
+    # un proceso murió (p. ej. por falta de memoria) y el pool ya no sirve; se vuelve a
+    # crear en la siguiente llamada a `worker_pool`
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+class ColaLlena(RuntimeError):
+    """El planificador no admite el trabajo: la cola (total o del usuario) está llena."""
+
+
+class Trabajo:
+    """
+    Un trabajo del planificador: `func(*args)` por cada bloque de `chunks` y, al final,
+    `combine(resultados)` en el orden de los bloques.
+
+    Varias sesiones pueden compartir el mismo trabajo (ver `Planificador.submit`); sólo se
+    cancela cuando todas lo sueltan. `func` debe poder importarse desde un módulo (no del
+    script de la app) para que los procesos del pool la encuentren.
+    """
+
+    def __init__(self, scheduler, func, chunks, combine, key, user, priority, persist=False):
+        self.scheduler = scheduler
+        self.func = func
+        self.chunks = list(chunks)
+        self.combine = combine
+        self.key = key
+        self.user = user
+        self.priority = priority
+        self.persist = persist
+        self.cancelled = False
+        self.subscribers = 1
+        self.futures = [Future() for _ in self.chunks]
+
+    def __len__(self):
+        return len(self.futures)
+
+    @property
+    def completed(self) -> int:
+        return sum(f.done() and not f.cancelled() for f in self.futures)
+
+    @property
+    def started(self) -> bool:
+        return any(f.running() or f.done() for f in self.futures)
+
+    @property
+    def progress(self) -> float:
+        """Fracción de bloques terminados (0 a 1)."""
+        return self.completed / len(self.futures) if self.futures else 1.0
+
+    def done(self) -> bool:
+        return all(f.done() for f in self.futures)
+
+    def cancel(self):
+        """Suelta el trabajo; si nadie más lo usa, se cancelan sus bloques pendientes."""
+        self.scheduler.release(self)
+
+    def result(self, timeout=None):
+        """Espera a todos los bloques y regresa el resultado combinado."""
+        if self.cancelled:
+            raise RuntimeError('El trabajo fue cancelado')
+        return self.combine([f.result(timeout) for f in self.futures])
+
+
+class Planificador:
+    """
+    Cola con prioridad frente al pool de procesos.
+
+    - Prioridad: los bloques de trabajos `INTERACTIVO` salen antes que los de `LOTE`; con la
+      misma prioridad, en orden de llegada. `reserved` procesos quedan siempre libres para
+      trabajo interactivo.
+    - Concurrencia: cada usuario tiene a lo sumo `max_per_user` bloques corriendo a la vez.
+    - Admisión: a lo sumo `max_jobs` trabajos pendientes en total y `max_jobs_per_user` por
+      usuario; un trabajo más se rechaza con `ColaLlena` (la app muestra el aviso).
+    - Deduplicación: un trabajo idéntico (misma función y mismos argumentos) a uno que sigue
+      pendiente no se vuelve a encolar; se comparte el mismo `Trabajo`.
+    - Persistencia: los trabajos con `persist=True` se buscan primero en `disco`.
+    """
+
+    def __init__(self, max_per_user: int = 2, reserved: int = 1, max_jobs: int = 32, max_jobs_per_user: int = 4,
+                 disco=disk_cache):
+        self.disco = disco
+        self.max_per_user = max_per_user
+        self.reserved = reserved
+        self.max_jobs = max_jobs
+        self.max_jobs_per_user = max_jobs_per_user
+        self._heap = []
+        self._order = itertools.count()
+        self._jobs = {}
+        self._running = 0
+        self._running_by_user = Counter()
+        self._lock = threading.RLock()
+
+    def submit(self, func, chunks, combine=list, user='local', priority: int = LOTE, persist: bool = False) -> Trabajo:
+        """
+        Encola un trabajo (o regresa el idéntico que ya está pendiente). Con `persist`, un
+        trabajo que ya terminó antes (en éste o en otro proceso) regresa ya resuelto.
+        """
+        chunks = list(chunks)
+        key = content_key((func.__module__, func.__qualname__, chunks))
+        if persist and self.disco is not None:
+            stored = self.disco.get(('trabajo', key))
+            if stored is not None:
+                job = Trabajo(self, func, chunks, combine, key, user, priority)
+                for future, value in zip(job.futures, stored):
+                    future.set_result(value)
+                return job
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None:
+                job.subscribers += 1
+                return job
+
+            pendientes = Counter(j.user for j in self._jobs.values())
+            if len(self._jobs) >= self.max_jobs:
+                raise ColaLlena(f'El servidor tiene {len(self._jobs)} trabajos en cola; intenta de nuevo en unos minutos.')
+            if pendientes[user] >= self.max_jobs_per_user:
+                raise ColaLlena(f'Ya tienes {pendientes[user]} trabajos en cola; espera a que terminen o cancela alguno.')
+
+            job = Trabajo(self, func, chunks, combine, key, user, priority, persist)
+            self._jobs[key] = job
+            for index in range(len(chunks)):
+                heapq.heappush(self._heap, (priority, next(self._order), index, job))
+            self._dispatch()
+        return job
+
+    def release(self, job: Trabajo):
+        with self._lock:
+            job.subscribers -= 1
+            if job.subscribers > 0 or job.cancelled:
+                return
+            job.cancelled = True
+            for f in job.futures:
+                f.cancel()
+            self._forget(job)
+
+    def ahead(self, job: Trabajo) -> int:
+        """Bloques de otros trabajos que saldrán antes que el siguiente bloque de `job`."""
+        with self._lock:
+            mine = [(p, o) for p, o, _, j in self._heap if j is job]
+            if not mine:
+                return 0
+            first = min(mine)
+            return sum((p, o) < first for p, o, i, j in self._heap if not j.futures[i].cancelled())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'trabajos': len(self._jobs),
+                'bloques_en_cola': sum(not j.futures[i].cancelled() for _, _, i, j in self._heap),
+                'bloques_corriendo': self._running,
+                'procesos': _pool_workers,
+            }
+
+    def _forget(self, job):
+        if self._jobs.get(job.key) is job:
+            del self._jobs[job.key]
+
+    def _dispatch(self):
+        # se llama con el candado tomado: manda al pool los bloques que caben
+        worker_pool()
+        capacity = _pool_workers
+        batch_capacity = max(1, capacity - self.reserved)
+        skipped = []
+        while self._heap and self._running < capacity:
+            item = heapq.heappop(self._heap)
+            priority, _, index, job = item
+            future = job.futures[index]
+            if future.cancelled():
+                continue
+            if (self._running_by_user[job.user] >= self.max_per_user
+                    or (priority == LOTE and self._running >= batch_capacity)):
+                skipped.append(item)
+                continue
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                pool_future = worker_pool().submit(job.func, *job.chunks[index])
+            except BrokenProcessPool as error:
+                _discard_pool()
+                future.set_exception(error)
+                if job.done():
+                    self._forget(job)
+                continue
+            self._running += 1
+            self._running_by_user[job.user] += 1
+            pool_future.add_done_callback(partial(self._finished, job, index))
+        for item in skipped:
+            heapq.heappush(self._heap, item)
+
+    def _finished(self, job, index, pool_future):
+        # callback del pool (otro hilo): pasa el resultado al bloque y reparte lo que sigue
+        finished = False
+        with self._lock:
+            self._running -= 1
+            self._running_by_user[job.user] -= 1
+            error = pool_future.exception()
+            if error is None:
+                job.futures[index].set_result(pool_future.result())
+            else:
+                if isinstance(error, BrokenProcessPool):
+                    _discard_pool()
+                job.futures[index].set_exception(error)
+            if job.done():
+                self._forget(job)
+                finished = True
+            self._dispatch()
+        # la escritura en disco va fuera del candado para no detener el reparto
+        if finished and job.persist and self.disco is not None and not job.cancelled:
+            if all(f.exception() is None for f in job.futures):
+                self.disco.set(('trabajo', job.key), [f.result() for f in job.futures])
+
+
+# una sola instancia por proceso
+planificador = Planificador()
+
+
+class Tarea:
+    """
+    Tarea en segundo plano en un hilo del proceso de Streamlit: corre `steps` en orden.
+
+    Cada paso recibe `valores`, un dict que comparten todos los pasos (p. ej. la memoria de
+    `Grafo.run`). Si un paso regresa un `Trabajo` del planificador, la tarea espera a que
+    termine. Cancelar detiene la tarea antes del siguiente paso y suelta los trabajos que
+    haya lanzado; un paso en curso termina. Los pasos no deben llamar a `st.*`.
+    """
+
+    def __init__(self, steps, name: str = 'tarea'):
+        self.steps = list(steps)
+        self.valores = {}
+        self.completed = 0
+        self.cancelled = False
+        self.error = None
+        self.trabajos = []
+        self._done = threading.Event()
+        threading.Thread(target=self._run, name=name, daemon=True).start()
+
+    def __len__(self):
+        return len(self.steps)
+
+    @property
+    def progress(self) -> float:
+        return self.completed / len(self.steps) if self.steps else 1.0
+
+    def _run(self):
+        try:
+            for step in self.steps:
+                if self.cancelled:
+                    break
+                job = step(self.valores)
+                if isinstance(job, Trabajo):
+                    self.trabajos.append(job)
+                    while not job.done() and not self.cancelled:
+                        time.sleep(0.05)
+                self.completed += 1
+        except Exception as error:
+            self.error = error
+        finally:
+            self._done.set()
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def cancel(self):
+        self.cancelled = True
+        for job in self.trabajos:
+            job.cancel()
+
+    def result(self, timeout=None) -> dict:
+        """Espera a que termine y regresa `valores`."""
+        self._done.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return self.valores
+
+
+def session_job(state, name: str, key, start=None) -> Trabajo | Tarea | None:
+    """
+    Trabajo `name` de la sesión (`state` es `st.session_state`) para los parámetros `key`.
+
+    Si la sesión volvió a correr con otros parámetros (o `key` es None), la sesión suelta el
+    trabajo anterior. Si no hay trabajo vigente y se da `start` (una función que regresa un
+    `Trabajo` o una `Tarea`), se lanza uno nuevo; `start` puede lanzar `ColaLlena`.
+    """
+    entry = state.get(name)
+    if entry is not None and (entry[0] != key or entry[1].cancelled):
+        entry[1].cancel()
+        del state[name]
+        entry = None
+    if entry is None and start is not None:
+        entry = (key, start())
+        state[name] = entry
+    return entry[1] if entry is not None else None
@@ -0,0 +1,305 @@
+"""
+Validación de los archivos subidos, una vez por archivo y antes de cualquier cálculo.
+
+Un archivo con una columna de menos, 31 renglones o texto en un indicador fallaba hasta
+`calculate_index` o el formato de las tablas (FASP/FOFISP), o se perdía en un
+`except Exception` (FORTAMUN). Aquí cada archivo se revisa de una vez, con operaciones sobre
+todas las columnas a la vez (numpy para FASP/FOFISP, un solo `select` de polars para
+FORTAMUN), y el resultado es un `Reporte`:
+
+- errores, que rechazan el archivo: columnas faltantes o de otro tipo (ver
+  `asignacion.formatos`; si un CSV trae texto en una columna numérica, cada columna con
+  sus filas), renglones contra el catálogo de Entidades Federativas, vacíos,
+  valores no finitos y valores imposibles (población negativa, variación menor a -100%...);
+- avisos, que no lo rechazan: valores fuera del rango habitual de un indicador (p. ej. una
+  proporción mayor a 1, que suele ser un porcentaje capturado en escala 0-100) o nombres
+  de estado que no están en el catálogo.
+
+Las apps muestran `Reporte.message()` con `st.error` y se detienen; los avisos van en un
+`st.warning`.
+"""
+
+import time
+import unicodedata
+
+import numpy as np
+import pyarrow as pa
+
+from asignacion.formatos import ALIAS, DatosInvalidos, SCHEMAS, read_as_text, read_table
+
+
+ENTIDADES = [
+    'Aguascalientes', 'Baja California', 'Baja California Sur', 'Campeche', 'Coahuila', 'Colima',
+    'Chiapas', 'Chihuahua', 'Ciudad de México', 'Durango', 'Guanajuato', 'Guerrero', 'Hidalgo',
+    'Jalisco', 'México', 'Michoacán', 'Morelos', 'Nayarit', 'Nuevo León', 'Oaxaca', 'Puebla',
+    'Querétaro', 'Quintana Roo', 'San Luis Potosí', 'Sinaloa', 'Sonora', 'Tabasco', 'Tamaulipas',
+    'Tlaxcala', 'Veracruz', 'Yucatán', 'Zacatecas',
+]
+
+# municipios del archivo del FORTAMUN (Censo 2020); otro número sólo genera un aviso
+MUNICIPIOS = 2_469
+
+# límites de cada indicador: (mínimo, máximo) fuera de los cuales el valor es imposible
+# (error) y (mínimo, máximo) habituales (aviso); None es sin límite
+# índices del FASP que pueden ser negativos: `direct_proportion_normalize` los corre por
+# prom + 3*stdev, así que fuera de lo habitual sólo hay aviso
+_PROPORCION = ((None, None), (0, 1))
+LIMITES = {
+    'FASP': {
+        'Pob': ((1, None), (100_000, 20_000_000)),
+        'Inc_del': ((-1, None), (-1, 1)),
+        'Tasa_policial': ((0, None), (0, 10)),
+        'Profesionalizacion': ((0, None), (None, None)),
+        'Ctrl_conf': ((0, 100), (0, 100)),
+        # variación: negativa en 24 de 32 estados en el archivo real
+        'Dig_salarial': ((None, None), (-1, 1)),
+        'Disp_camaras': _PROPORCION,
+        'Disp_lectores_veh': _PROPORCION,
+        'Tasa_abandono_llamadas': _PROPORCION,
+        'Cump_presup': _PROPORCION,
+        'Sobrepob_penitenciaria': ((None, None), (0, 3)),
+        'Proc_justicia': _PROPORCION,
+        'Servs_forenses': _PROPORCION,
+        'Eficiencia_procesal': _PROPORCION,
+        'Asignacion_2025': ((0.01, None), (None, None)),
+    },
+    'FOFISP': {
+        'Población': ((1, None), (100_000, 20_000_000)),
+        'Var_incidencia_del': ((-1, None), (-1, 1)),
+        'Tasa_policial': ((0, None), (0, 10)),
+        'Academias': ((0, None), (0, 50)),
+        'Asignacion_2025': ((0.01, None), (None, None)),
+    },
+}
+
+# columnas del archivo del FORTAMUN (antes de renombrarlas) y sus límites
+FORTAMUN_TEXTO = ['NOM_ENT', 'NOM_MUN']
+FORTAMUN_LIMITES = {
+    'CLAVE': ((1, 32), (1, 32)),
+    'CVE_MUN': ((0, None), (None, None)),
+    'ASIGNACIÓN FORTAMUN ESTATAL': ((0, None), (None, None)),
+    'POB_TOTAL': ((0, None), (None, None)),
+    'TOTAL DE VIVIENDAS HABITADAS': ((0, None), (None, None)),
+    'Municipios que informaron haber destinado recursos del FORTAMUN a la atención de necesidades '
+    'directamente vinculadas con la seguridad pública': ((0, 1), (0, 1)),
+    'Asignación municipal (Gacetas estatales)': ((0, None), (None, None)),
+    'INCIDENCIA DELICTIVA DE ALTO IMPACTO': ((0, None), (None, None)),
+    '56 Municipios prioritarios': ((0, 1), (0, 1)),
+}
+FORTAMUN_COLUMNAS = FORTAMUN_TEXTO + list(FORTAMUN_LIMITES)
+
+
+class Reporte:
+    """
+    Resultado de validar un archivo: errores (lo rechazan), avisos y los datos leídos.
+
+    Cada error o aviso es un dict con 'columna' (None si es del archivo completo),
+    'problema' y, si aplica, 'filas' (cuántas) y 'ejemplo' (la primera fila, desde 1).
+    """
+
+    def __init__(self, fondo: str):
+        self.fondo = fondo
+        self.filas = 0   # None si el archivo no se pudo leer
+        self.errores = []
+        self.avisos = []
+        self.datos = None
+        self.ms = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return not self.errores
+
+    def error(self, columna, problema, filas=None, ejemplo=None):
+        self.errores.append(_hallazgo(columna, problema, filas, ejemplo))
+
+    def aviso(self, columna, problema, filas=None, ejemplo=None):
+        self.avisos.append(_hallazgo(columna, problema, filas, ejemplo))
+
+    def raise_for_errors(self):
+        """`DatosInvalidos` con el mensaje del reporte si hubo errores."""
+        if self.errores:
+            raise DatosInvalidos(self.message())
+
+    def message(self, avisos: bool = False) -> str:
+        """Errores (o avisos) como lista en markdown, para `st.error` / `st.warning`."""
+        hallazgos = self.avisos if avisos else self.errores
+        filas = f' ({self.filas} filas)' if self.filas is not None else ''
+        titulo = f'Revisa el archivo del {self.fondo}{filas}:' if avisos else f'El archivo del {self.fondo} no es válido{filas}:'
+        return '\n'.join([titulo] + [f'- {_texto(h)}' for h in hallazgos])
+
+    def to_dict(self) -> dict:
+        return {
+            'fondo': self.fondo, 'filas': self.filas, 'ok': self.ok,
+            'errores': self.errores, 'avisos': self.avisos, 'ms': round(self.ms, 2),
+        }
+
+
+def _hallazgo(columna, problema, filas, ejemplo) -> dict:
+    hallazgo = {'columna': columna, 'problema': problema}
+    if filas is not None:
+        hallazgo['filas'] = int(filas)
+    if ejemplo is not None:
+        hallazgo['ejemplo'] = int(ejemplo)
+    return hallazgo
+
+
+def _texto(hallazgo) -> str:
+    texto = f"**{hallazgo['columna']}**: {hallazgo['problema']}" if hallazgo['columna'] else hallazgo['problema']
+    if 'filas' in hallazgo:
+        texto += f" ({hallazgo['filas']} {'fila' if hallazgo['filas'] == 1 else 'filas'}"
+        texto += f", p. ej. la fila {hallazgo['ejemplo']})" if 'ejemplo' in hallazgo else ')'
+    return texto
+
+
+def _normalizar(nombre) -> str:
+    # sin acentos ni mayúsculas, para comparar contra el catálogo
+    nombre = unicodedata.normalize('NFKD', str(nombre).strip().casefold())
+    return ''.join(c for c in nombre if not unicodedata.combining(c))
+
+
+_CATALOGO = {_normalizar(e) for e in ENTIDADES}
+
+
+def _rangos(reporte: Reporte, columnas: list[str], X: np.ndarray, limites: dict):
+    # todas las columnas a la vez: vacíos, no finitos, fuera de límite y fuera de lo habitual
+    def cotas(i):
+        return (np.array([-np.inf if limites[c][i][0] is None else limites[c][i][0] for c in columnas]),
+                np.array([np.inf if limites[c][i][1] is None else limites[c][i][1] for c in columnas]))
+
+    (minimo, maximo), (habitual_min, habitual_max) = cotas(0), cotas(1)
+    with np.errstate(invalid='ignore'):
+        pruebas = [
+            (np.isnan(X), 'error', 'valores vacíos'),
+            (np.isinf(X), 'error', 'valores infinitos'),
+            (X < minimo, 'error', 'valores menores a {minimo:g}'),
+            (X > maximo, 'error', 'valores mayores a {maximo:g}'),
+            ((X < habitual_min) & (X >= minimo), 'aviso', 'valores menores a {habitual_min:g}, fuera de lo habitual'),
+            ((X > habitual_max) & (X <= maximo), 'aviso', 'valores mayores a {habitual_max:g}, fuera de lo habitual'),
+        ]
+    for mascara, nivel, problema in pruebas:
+        cuantas = mascara.sum(axis=0)
+        primera = mascara.argmax(axis=0)
+        for j in np.flatnonzero(cuantas):
+            texto = problema.format(minimo=minimo[j], maximo=maximo[j],
+                                    habitual_min=habitual_min[j], habitual_max=habitual_max[j])
+            getattr(reporte, nivel)(columnas[j], texto, cuantas[j], primera[j] + 1)
+
+
+def _no_numericos(reporte: Reporte, archivo: bytes, schema: pa.Schema) -> bool:
+    # el CSV no se pudo leer con los tipos del esquema: se vuelve a leer como texto para
+    # reportar cada columna numérica con texto y sus filas (pyarrow sólo da la primera)
+    import pandas as pd
+
+    try:
+        table = read_as_text(archivo, schema)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return False
+    if table is None:
+        return False
+    columnas = [ALIAS.get(c, c) for c in table.column_names]
+    con_texto = False
+    for field in schema:
+        if field.name not in columnas:
+            reporte.error(field.name, 'falta la columna')
+        elif pa.types.is_integer(field.type) or pa.types.is_floating(field.type):
+            texto = table.column(columnas.index(field.name)).to_pandas()
+            malos = pd.to_numeric(texto, errors='coerce').isna() & texto.notna()
+            if malos.any():
+                valores = ', '.join(repr(v) for v in texto[malos].drop_duplicates().head(3))
+                reporte.error(field.name, f'texto donde se esperaba un número ({valores})',
+                              malos.sum(), np.flatnonzero(malos)[0] + 1)
+                con_texto = True
+    if not con_texto:
+        # el error era otro (p. ej. una fila con más campos): se reporta el de pyarrow
+        reporte.errores.clear()
+        return False
+    reporte.filas = table.num_rows
+    return True
+
+
+def validate_dataset(archivo: bytes, fondo: str) -> Reporte:
+    """
+    Lee y valida el archivo (CSV, Parquet o Arrow) de FASP o FOFISP. Si no hay errores, el
+    DataFrame queda en `Reporte.datos` (ya no hace falta leer el archivo otra vez).
+    """
+    start = time.perf_counter()
+    reporte = Reporte(fondo)
+    try:
+        table = read_table(archivo, SCHEMAS[fondo])
+    except DatosInvalidos as error:
+        # sin una tabla legible no se revisa lo demás (ni se sabe cuántas filas tiene)
+        reporte.filas = None
+        if not (isinstance(error.__cause__, pa.ArrowInvalid) and _no_numericos(reporte, archivo, SCHEMAS[fondo])):
+            for problema in str(error).split('; '):
+                reporte.error(None, problema)
+        reporte.ms = (time.perf_counter() - start) * 1000
+        return reporte
+
+    datos = table.to_pandas()
+    reporte.filas = len(datos)
+
+    # renglones contra el catálogo de Entidades Federativas
+    entidades = datos['Entidad_Federativa'].map(_normalizar)
+    if len(datos) != len(ENTIDADES):
+        reporte.error('Entidad_Federativa', f'{len(datos)} filas, se esperaba una por cada una de las {len(ENTIDADES)} Entidades Federativas')
+    repetidas = entidades.duplicated()
+    if repetidas.any():
+        reporte.error('Entidad_Federativa', 'Entidades repetidas', repetidas.sum(), np.flatnonzero(repetidas)[0] + 1)
+    desconocidas = ~entidades.isin(_CATALOGO)
+    if desconocidas.any():
+        nombres = ', '.join(datos.loc[desconocidas, 'Entidad_Federativa'].astype(str).head(3))
+        reporte.aviso('Entidad_Federativa', f'nombres fuera del catálogo ({nombres})',
+                      desconocidas.sum(), np.flatnonzero(desconocidas)[0] + 1)
+
+    columnas = list(LIMITES[fondo])
+    _rangos(reporte, columnas, datos[columnas].to_numpy(dtype=np.float64, na_value=np.nan), LIMITES[fondo])
+
+    if reporte.ok:
+        reporte.datos = datos
+    reporte.ms = (time.perf_counter() - start) * 1000
+    return reporte
+
+
+def validate_fortamun(data) -> Reporte:
+    """
+    Valida el archivo del FORTAMUN ya leído (DataFrame de polars, columnas originales):
+    columnas y tipos, claves de estado, vacíos, rangos y el número de estados y municipios.
+    """
+    import polars as pl
+
+    start = time.perf_counter()
+    reporte = Reporte('FORTAMUN')
+    reporte.filas = data.height
+
+    for columna in FORTAMUN_COLUMNAS:
+        if columna not in data.columns:
+            reporte.error(columna, 'falta la columna')
+    numericas = [c for c in FORTAMUN_LIMITES if c in data.columns]
+    for columna in numericas:
+        if not data.schema[columna].is_numeric():
+            reporte.error(columna, f'es {data.schema[columna]}, se esperaba un número')
+    if not reporte.ok:
+        reporte.ms = (time.perf_counter() - start) * 1000
+        return reporte
+
+    # vacíos y rangos en una sola consulta
+    X = data.select(pl.col(numericas).cast(pl.Float64)).to_numpy()
+    _rangos(reporte, numericas, X, FORTAMUN_LIMITES)
+    resumen = data.select(
+        *(pl.col(c).null_count().alias(c) for c in FORTAMUN_TEXTO),
+        pl.col('CLAVE').n_unique().alias('estados'),
+        (pl.col('ASIGNACIÓN FORTAMUN ESTATAL').n_unique().over('CLAVE') > 1).sum().alias('estatal_distinta'),
+    ).row(0, named=True)
+    for columna in FORTAMUN_TEXTO:
+        if resumen[columna]:
+            reporte.error(columna, 'valores vacíos', resumen[columna])
+    if resumen['estados'] != len(ENTIDADES):
+        reporte.aviso('CLAVE', f"{resumen['estados']} estados, se esperaban {len(ENTIDADES)}")
+    if data.height != MUNICIPIOS:
+        reporte.aviso(None, f'{data.height} municipios; el catálogo tiene {MUNICIPIOS}')
+    if resumen['estatal_distinta']:
+        reporte.aviso('ASIGNACIÓN FORTAMUN ESTATAL', 'montos distintos dentro de un mismo estado; se usa el primero',
+                      resumen['estatal_distinta'])
+
+    reporte.ms = (time.perf_counter() - start) * 1000
+    return reporte
@@ -1,7 +1,13 @@
 # libraries
 import streamlit as st
-from PIL import Image
 import os
+import sys
+from pathlib import Path
+
+# paquete compartido 'asignacion' en la raíz del repositorio (logo leído una vez por
+# proceso, ver asignacion.arranque)
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from asignacion.arranque import cached_logo
 
 
 # core script
@@ -11,7 +17,7 @@ def main():
     st.markdown('<a href="https://tinyurl.com/sesnsp-dgp-blog" target="_self">Home</a>', unsafe_allow_html=True)
 
     # load image
-    im = Image.open('logo.png')
+    im = cached_logo('logo.png')
     # add image
     st.set_page_config(page_title="ENSU", page_icon = im, layout='wide')
 
@@ -9,9 +9,15 @@ from PIL import Image
 from great_tables import GT, md
 import os
 import io
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 load_dotenv('.env')
 
+# paquete compartido 'asignacion' en la raíz del repositorio
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from asignacion.graficas import cached_figure
+
 
 # --- app settings ---
 # blog home link
@@ -416,65 +422,75 @@ else:
         )
 
         # Gráfico de barras de asignacion de fondos (Simplified Title)
-        fig = px.bar(
-            df_results,
-            x='Entidad_Federativa',
-            y='Asignacion_2026',
-            text='Asignacion_2026',
-            title="Asignación de Fondos 2026 (Según Ponderadores Aplicados)",
-            template='ggplot2',
-            hover_data={
-                'Entidad_Federativa':False,
-                'Asignacion_2026':':$,.2f', # customize hover for column of y attribute
-                'Var%':':.2%',
-                },
-            labels={
-                'Entidad_Federativa':'Entidad Federativa',
-                'Asignacion_2026':'Asignación 2026',
-                'Var%':'Variación',
-                },
-        )
-            
-        fig.update_traces(
-            textposition='outside',
-            marker_color='#235b4e',
-            opacity=0.9,
-            marker_line_color='#6f7271',
-            marker_line_width=1.2,
-            texttemplate='$%{text:,.2f}',
-            textfont_size=20,
+        # figuras completas; se arman una vez por proceso y en los reruns sólo se
+        # reemplazan los montos (ver asignacion.graficas)
+        def asignacion_2026(df_results):
+            fig = px.bar(
+                df_results,
+                x='Entidad_Federativa',
+                y='Asignacion_2026',
+                title="Asignación de Fondos 2026",
+                template='ggplot2',
+                hover_data={
+                    'Entidad_Federativa':False,
+                    'Asignacion_2026':':$,.2f', # customize hover for column of y attribute
+                    'Var%':':.2%',
+                    },
+                labels={
+                    'Entidad_Federativa':'Entidad Federativa',
+                    'Asignacion_2026':'Asignación 2026',
+                    'Var%':'Variación',
+                    },
             )
 
-        fig.update_layout(
-            uniformtext_minsize=8, uniformtext_mode='hide',
-            hovermode="x unified",
-            autosize=True,
-            height=600,
-            xaxis_title='',
-            yaxis_title='Asignacion 2026',
-            hoverlabel=dict(
-                bgcolor="#fff",
-                font_size=16,
-                font_family="Noto Sans",
+            fig.update_traces(
+                textposition='outside',
+                marker_color='#235b4e',
+                opacity=0.9,
+                marker_line_color='#6f7271',
+                marker_line_width=1.2,
+                texttemplate='$%{y:,.2f}',
+                textfont_size=20,
                 )
-            )
 
-        fig.update_xaxes(
-            showgrid=True,
-            title_font=dict(size=18, family='Noto Sans', color='#691c32'),  # X-axis title font size
-            tickfont=dict(size=15, family='Noto Sans', color='#4f4f4f'),  # X-axis tick label font size
-            tickangle=-75,
-            )
+            fig.update_layout(
+                uniformtext_minsize=8, uniformtext_mode='hide',
+                hovermode="x unified",
+                autosize=True,
+                height=600,
+                xaxis_title='',
+                yaxis_title='Asignacion 2026',
+                hoverlabel=dict(
+                    bgcolor="#fff",
+                    font_size=16,
+                    font_family="Noto Sans",
+                    )
+                )
 
-        fig.update_yaxes(
-            tickprefix="$",
-            tickformat=',.0f',
-            showgrid=True,
-            title_font=dict(size=16, family='Noto Sans', color='#28282b'),
-            tickfont=dict(size=15, family='Noto Sans', color='#4f4f4f'),
-            tickangle=0,
-            )
-            
+            fig.update_xaxes(
+                showgrid=True,
+                title_font=dict(size=18, family='Noto Sans', color='#691c32'),  # X-axis title font size
+                tickfont=dict(size=15, family='Noto Sans', color='#4f4f4f'),  # X-axis tick label font size
+                tickangle=-75,
+                )
+
+            fig.update_yaxes(
+                tickprefix="$",
+                tickformat=',.0f',
+                showgrid=True,
+                title_font=dict(size=16, family='Noto Sans', color='#28282b'),
+                tickfont=dict(size=15, family='Noto Sans', color='#4f4f4f'),
+                tickangle=0,
+                )
+            return fig
+
+        fig = cached_figure(
+            asignacion_2026,
+            df_results,
+            [{'y': df_results['Asignacion_2026'].to_numpy(), 'customdata': df_results[['Var%']].to_numpy()}],
+            layout={'title': {'text': "Asignación de Fondos 2026 (Según Ponderadores Aplicados)"}},
+            key=tuple(df_results['Entidad_Federativa']),
+        )
         st.plotly_chart(fig, use_container_width=True)
 
 
@@ -482,62 +498,68 @@ else:
         # create positive and negative colors using if and list comprehension
         var_color = ['#235b4e' if v > 0 else '#9f2241' for v in df_results['Var%']]
 
-        fig_var = px.bar(
-            df_results,
-            x='Entidad_Federativa',
-            y='Var%',
-            text='Var%',
-            title=f"Variación en la Asignación de Fondos con respecto al Ejercicio Anterior",
-            template='ggplot2',
-            hover_data={
-                'Entidad_Federativa':False,
-                'Var%':':.2%',
-                },
-            labels={
-                'Entidad_Federativa':'Entidad Federativa',
-                'Var%':'Variación',
-                },
-        )
-            
-        fig_var.update_traces(
-            textposition='outside',
-            marker_color=var_color,
-            opacity=0.9,
-            marker_line_color='#6f7271',
-            marker_line_width=1.2,
-            texttemplate='%{text:.2%}',
-            textfont_size=20,
+        def variacion(df_results):
+            fig_var = px.bar(
+                df_results,
+                x='Entidad_Federativa',
+                y='Var%',
+                title=f"Variación en la Asignación de Fondos con respecto al Ejercicio Anterior",
+                template='ggplot2',
+                hover_data={
+                    'Entidad_Federativa':False,
+                    'Var%':':.2%',
+                    },
+                labels={
+                    'Entidad_Federativa':'Entidad Federativa',
+                    'Var%':'Variación',
+                    },
             )
 
-        fig_var.update_layout(
-            uniformtext_minsize=8, uniformtext_mode='hide',
-            hovermode="x unified",
-            autosize=True,
-            height=600,
-            xaxis_title='',
-            yaxis_title='Variación %',
-            hoverlabel=dict(
-                bgcolor="#fff",
-                font_size=16,
-                font_family="Noto Sans",
+            fig_var.update_traces(
+                textposition='outside',
+                opacity=0.9,
+                marker_line_color='#6f7271',
+                marker_line_width=1.2,
+                texttemplate='%{y:.2%}',
+                textfont_size=20,
                 )
-            )
 
-        fig_var.update_xaxes(
-            showgrid=True,
-            title_font=dict(size=18, family='Noto Sans', color='#bc955c'),  # X-axis title font size
-            tickfont=dict(size=15, family='Noto Sans', color='#4f4f4f'),  # X-axis tick label font size
-            tickangle=-75,
-        )
+            fig_var.update_layout(
+                uniformtext_minsize=8, uniformtext_mode='hide',
+                hovermode="x unified",
+                autosize=True,
+                height=600,
+                xaxis_title='',
+                yaxis_title='Variación %',
+                hoverlabel=dict(
+                    bgcolor="#fff",
+                    font_size=16,
+                    font_family="Noto Sans",
+                    )
+                )
 
-        fig_var.update_yaxes(
-            tickformat='.0%',
-            showgrid=True,
-            title_font=dict(size=16, family='Noto Sans', color='#28282b'),
-            tickfont=dict(size=15, family='Noto Sans', color='#4f4f4f'),
-            tickangle=0,
+            fig_var.update_xaxes(
+                showgrid=True,
+                title_font=dict(size=18, family='Noto Sans', color='#bc955c'),  # X-axis title font size
+                tickfont=dict(size=15, family='Noto Sans', color='#4f4f4f'),  # X-axis tick label font size
+                tickangle=-75,
             )
-            
+
+            fig_var.update_yaxes(
+                tickformat='.0%',
+                showgrid=True,
+                title_font=dict(size=16, family='Noto Sans', color='#28282b'),
+                tickfont=dict(size=15, family='Noto Sans', color='#4f4f4f'),
+                tickangle=0,
+                )
+            return fig_var
+
+        fig_var = cached_figure(
+            variacion,
+            df_results,
+            [{'y': df_results['Var%'].to_numpy(), 'marker': {'color': var_color}}],
+            key=tuple(df_results['Entidad_Federativa']),
+        )
         st.plotly_chart(fig_var, use_container_width=True)
 
 
@@ -683,62 +705,71 @@ else:
 
         # grafico2
         # Gráfico de barras de reasignacion de remanente 2026 vs 2025
-        fig2 = go.Figure(data=[
-            go.Bar(name='Ejercicio 2025',
-                x=df_results['Entidad_Federativa'],
-                y=df_results['Asignacion_2025'],
-                marker_color='#bc955c',
-                ),
-            go.Bar(name='Ejercicio 2026',
-                x=df_results['Entidad_Federativa'],
-                y=df_results['Asignacion_ajustada'],
-                marker_color='#691c32',
-                ),
-            ])
-
-        # Update layout to group bars
-        fig2.update_traces(
-            textposition='outside',
-            opacity=0.9,
-            marker_line_color='#6f7271',
-            marker_line_width=1.2,
-            texttemplate='$%{text:,.2f}',
-            textfont_size=20,
-            )
+        def reasignacion(df_results):
+            fig2 = go.Figure(data=[
+                go.Bar(name='Ejercicio 2025',
+                    x=df_results['Entidad_Federativa'],
+                    y=df_results['Asignacion_2025'],
+                    marker_color='#bc955c',
+                    ),
+                go.Bar(name='Ejercicio 2026',
+                    x=df_results['Entidad_Federativa'],
+                    y=df_results['Asignacion_ajustada'],
+                    marker_color='#691c32',
+                    ),
+                ])
+
+            # Update layout to group bars
+            fig2.update_traces(
+                textposition='outside',
+                opacity=0.9,
+                marker_line_color='#6f7271',
+                marker_line_width=1.2,
+                texttemplate='$%{text:,.2f}',
+                textfont_size=20,
+                )
 
-        fig2.update_layout(
-            barmode='group',
-            title=f"Reasignación de Fondos por Entidad Federativa después de Remanente de la banda de $\pm$10%",
-            template='ggplot2',
-            uniformtext_minsize=8, uniformtext_mode='hide',
-            hovermode="x unified",
-            autosize=True,
-            height=600,
-            xaxis_title='',
-            yaxis_title='Asignacion 2026',
-            hoverlabel=dict(
-                bgcolor="#fff",
-                font_size=16,
-                font_family="Noto Sans",
+            fig2.update_layout(
+                barmode='group',
+                title=f"Reasignación de Fondos por Entidad Federativa después de Remanente de la banda de $\pm$10%",
+                template='ggplot2',
+                uniformtext_minsize=8, uniformtext_mode='hide',
+                hovermode="x unified",
+                autosize=True,
+                height=600,
+                xaxis_title='',
+                yaxis_title='Asignacion 2026',
+                hoverlabel=dict(
+                    bgcolor="#fff",
+                    font_size=16,
+                    font_family="Noto Sans",
+                    )
                 )
-            )
 
-        fig2.update_xaxes(
-            showgrid=True,
-            title_font=dict(size=18, family='Noto Sans', color='#691c32'),  # X-axis title font size
-            tickfont=dict(size=15, family='Noto Sans', color='#4f4f4f'),  # X-axis tick label font size
-            tickangle=-75,
-            )
+            fig2.update_xaxes(
+                showgrid=True,
+                title_font=dict(size=18, family='Noto Sans', color='#691c32'),  # X-axis title font size
+                tickfont=dict(size=15, family='Noto Sans', color='#4f4f4f'),  # X-axis tick label font size
+                tickangle=-75,
+                )
 
-        fig2.update_yaxes(
-            tickprefix="$",
-            tickformat=',.0f',
-            showgrid=True,
-            title_font=dict(size=16, family='Noto Sans', color='#28282b'),
-            tickfont=dict(size=15, family='Noto Sans', color='#4f4f4f'),
-            tickangle=0,
-            )
-        # fig2.show() # Removed as it's not needed in Streamlit
+            fig2.update_yaxes(
+                tickprefix="$",
+                tickformat=',.0f',
+                showgrid=True,
+                title_font=dict(size=16, family='Noto Sans', color='#28282b'),
+                tickfont=dict(size=15, family='Noto Sans', color='#4f4f4f'),
+                tickangle=0,
+                )
+            # fig2.show() # Removed as it's not needed in Streamlit
+            return fig2
+
+        fig2 = cached_figure(
+            reasignacion,
+            df_results,
+            [{'y': df_results['Asignacion_2025'].to_numpy()}, {'y': df_results['Asignacion_ajustada'].to_numpy()}],
+            key=tuple(df_results['Entidad_Federativa']),
+        )
         st.plotly_chart(fig2, use_container_width=True)
 
         
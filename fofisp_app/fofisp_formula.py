@@ -2,16 +2,27 @@
 import streamlit as st
 import numpy as np
 import pandas as pd
-import polars as pl
-import plotly.express as px
-import plotly.graph_objects as go
-from PIL import Image
-from great_tables import GT, md
 import os
-import io
-from dotenv import load_dotenv
-load_dotenv('.env')
-
+import sys
+from pathlib import Path
+
+# paquete compartido 'asignacion' en la raíz del repositorio
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+# plotly y great_tables se importan hasta que se usan; .env, logo e indicadores se leen
+# una vez por proceso (ver asignacion.arranque)
+from asignacion.arranque import lazy_import, load_env, cached_logo, cached_catalog
+px = lazy_import('plotly.express')
+go = lazy_import('plotly.graph_objects')
+GT, md = lazy_import('great_tables', 'GT', 'md')
+load_env('.env')
+from asignacion.graficas import cached_figure
+from asignacion.medicion import medicion, span
+from asignacion.formatos import UPLOAD_TYPES
+from asignacion.validacion import validate_dataset
+
+
+# medición opcional de etapas y cachés (ASIGNACION_MEDICION=1, ver asignacion.medicion)
+medida = medicion('FOFISP')
 
 # --- app settings ---
 # blog home link
@@ -26,7 +37,7 @@ hide_default_format = """
     """
 
 # load icon image
-im = Image.open('images/logo.png')
+im = cached_logo('images/logo.png')
 
 # page layout config and add image
 st.set_page_config(layout="wide", page_title="FOFISP App", page_icon=im)
@@ -149,15 +160,24 @@ weights = {
 
 # upload final variables dataset
 # widget para subir archivos
-uploaded_file = st.file_uploader("", type=['csv'], )
+uploaded_file = st.file_uploader("", type=UPLOAD_TYPES, )
 
 if uploaded_file is None:
-    st.text('Sube el archivo con las variables para la asignación del fondo en formato csv.')
+    st.text('Sube el archivo con las variables para la asignación del fondo en formato csv, parquet o arrow.')
 else:
-    data = pd.read_csv(io.BytesIO(uploaded_file.getvalue()))    
+    # CSV, Parquet o Arrow: esquema, Entidades y rangos en una pasada, antes de cualquier
+    # cálculo (ver asignacion.validacion)
+    with span('datos'):
+        reporte = validate_dataset(uploaded_file.getvalue(), 'FOFISP')
+    if not reporte.ok:
+        st.error(reporte.message())
+        st.stop()
+    if reporte.avisos:
+        st.warning(reporte.message(avisos=True))
+    data = reporte.datos
 
     # tabla de indicadores
-    indicadores_fofisp = pd.read_csv('data/indicadores_fofisp.csv')
+    indicadores_fofisp = cached_catalog('data/indicadores_fofisp.csv')
     indicadores_fofisp['Categoría'] = indicadores_fofisp['Categoría'].fillna('')
     indicadores_fofisp['Ponderación_categoría'] = indicadores_fofisp['Ponderación_categoría'].fillna(0)
 
@@ -199,50 +219,53 @@ else:
     )
     
 
-    # tab layout
-    tab1, tab2, tab3, tab4 = st.tabs(['1.Introducción', '2.Cálculo', '3.Nota metodológica', '4.Nota técnica'])
-
-    with tab1:
-
-        # header
-        st.subheader('1. Introducción')
-        st.markdown('''
-        <div style="text-align: justify;">
-        A continuación se enlistan los indicadores subyacentes para la asignación del <b>Fondo para el Fortalecimiento
-        de las Instituciones de Seguridad Pública</b> (FOFISP) <b>2026</b>.
-        </div>''',
-         unsafe_allow_html=True)
-
-        st.html(indicadores)
-        st.caption('Tabla 1. Indicadores utilizados para la asignación de fondos y ponderaciones predeterminadas.')
-
-        st.markdown('''
-        ##### ¿Cómo funciona esta aplicación?
-        ''')
-
-        st.markdown('''
-        <div style="text-align: justify;">
-        Esta aplicación interactiva sirve como una herramienta de análisis de escenarios que utiliza un <i>Índice de Asignación de Seguridad Pública Normalizado</i>.
+    # tab layout: las pestañas de texto y la sábana sólo se ejecutan abiertas; la de cálculo
+    # siempre corre porque ahí se obtiene df_results
+    tab1, tab2, tab3, tab4 = st.tabs(['1.Introducción', '2.Cálculo', '3.Nota metodológica', '4.Nota técnica'],
+                                     key='tabs_fofisp', on_change='rerun')
+
+    if tab1.open:
+        with tab1:
+
+            # header
+            st.subheader('1. Introducción')
+            st.markdown('''
+            <div style="text-align: justify;">
+            A continuación se enlistan los indicadores subyacentes para la asignación del <b>Fondo para el Fortalecimiento
+            de las Instituciones de Seguridad Pública</b> (FOFISP) <b>2026</b>.
+            </div>''',
+             unsafe_allow_html=True)
+
+            st.html(indicadores)
+            st.caption('Tabla 1. Indicadores utilizados para la asignación de fondos y ponderaciones predeterminadas.')
+
+            st.markdown('''
+            ##### ¿Cómo funciona esta aplicación?
+            ''')
+
+            st.markdown('''
+            <div style="text-align: justify;">
+            Esta aplicación interactiva sirve como una herramienta de análisis de escenarios que utiliza un <i>Índice de Asignación de Seguridad Pública Normalizado</i>.
         
-        El corazón de la aplicación es la ponderación.
-        Al usar los controles deslizantes en la barra lateral, se pueden simular diferentes prioridades de política pública.
+            El corazón de la aplicación es la ponderación.
+            Al usar los controles deslizantes en la barra lateral, se pueden simular diferentes prioridades de política pública.
         
-        Al ajustar estas ponderaciones, la aplicación recalcula el índice en tiempo real, permitiéndo ver cómo los
-        supuestos de ponderación impactan la clasificación final de las Entidades Federativas.
-        Esto proporciona una base objetiva para discutir y justificar las decisiones de asignación de fondos,
-        asegurando que los recursos se dirijan donde son más necesarios o donde generarán el mayor impacto.
-        </div>''',
-        unsafe_allow_html=True)
+            Al ajustar estas ponderaciones, la aplicación recalcula el índice en tiempo real, permitiéndo ver cómo los
+            supuestos de ponderación impactan la clasificación final de las Entidades Federativas.
+            Esto proporciona una base objetiva para discutir y justificar las decisiones de asignación de fondos,
+            asegurando que los recursos se dirijan donde son más necesarios o donde generarán el mayor impacto.
+            </div>''',
+            unsafe_allow_html=True)
         
-        st.markdown('''
-        ##### Referencias
+            st.markdown('''
+            ##### Referencias
 
-        [Fondo para el Fortalecimiento de las Instituciones de Seguridad Pública (FOFISP) 2025](https://www.gob.mx/sesnsp/acciones-y-programas/fondo-para-el-fortalecimiento-de-las-instituciones-de-seguridad-publica-fofisp?state=published)
+            [Fondo para el Fortalecimiento de las Instituciones de Seguridad Pública (FOFISP) 2025](https://www.gob.mx/sesnsp/acciones-y-programas/fondo-para-el-fortalecimiento-de-las-instituciones-de-seguridad-publica-fofisp?state=published)
         
-        ---
+            ---
 
-        *© Dirección General de Planeación*
-        ''')
+            *© Dirección General de Planeación*
+            ''')
 
 
     with tab2:
@@ -324,7 +347,8 @@ else:
 
                 # --- Cálculo y Visualización ---
         # Calcular el índice
-        df_results = calculate_index(fofisp_datos_entrada, weights)
+        with span('indice'):
+            df_results = calculate_index(fofisp_datos_entrada, weights)
         
         # Mostrar la tabla final de resultados
         st.subheader("2.2 Resultados")
@@ -352,65 +376,76 @@ else:
         )
 
         # Gráfico de barras de asignacion de fondos
-        fig = px.bar(
-            df_results,
-            x='Entidad_Federativa',
-            y='Asignacion_2026',
-            text='Asignacion_2026',
-            title=f"Población={w_pob*100:.0f}%, Tasa policial={w_edo_fza*100:.0f}%, Incidencia delictiva={w_var_incidencia_del*100:.0f}%, Academias={w_academias*100:.0f}%",
-            template='ggplot2',
-            hover_data={
-                'Entidad_Federativa':False,
-                'Asignacion_2026':':$,.2f', # customize hover for column of y attribute
-                'Var%':':.2%',
-                },
-            labels={
-                'Entidad_Federativa':'Entidad Federativa',
-                'Asignacion_2026':'Asignación 2026',
-                'Var%':'Variación',
-                },
-        )
-            
-        fig.update_traces(
-            textposition='outside',
-            marker_color='#235b4e',
-            opacity=0.9,
-            marker_line_color='#6f7271',
-            marker_line_width=1.2,
-            texttemplate='$%{text:,.2f}',
-            textfont_size=20,
+        # figuras completas; se arman una vez por proceso y en los reruns sólo se
+        # reemplazan los montos (ver asignacion.graficas)
+        def asignacion_2026(df_results):
+            fig = px.bar(
+                df_results,
+                x='Entidad_Federativa',
+                y='Asignacion_2026',
+                title="Asignación de Fondos 2026",
+                template='ggplot2',
+                hover_data={
+                    'Entidad_Federativa':False,
+                    'Asignacion_2026':':$,.2f', # customize hover for column of y attribute
+                    'Var%':':.2%',
+                    },
+                labels={
+                    'Entidad_Federativa':'Entidad Federativa',
+                    'Asignacion_2026':'Asignación 2026',
+                    'Var%':'Variación',
+                    },
             )
 
-        fig.update_layout(
-            uniformtext_minsize=8, uniformtext_mode='hide',
-            hovermode="x unified",
-            autosize=True,
-            height=600,
-            xaxis_title='',
-            yaxis_title='Asignacion 2026',
-            hoverlabel=dict(
-                bgcolor="#fff",
-                font_size=16,
-                font_family="Noto Sans",
+            fig.update_traces(
+                textposition='outside',
+                marker_color='#235b4e',
+                opacity=0.9,
+                marker_line_color='#6f7271',
+                marker_line_width=1.2,
+                texttemplate='$%{y:,.2f}',
+                textfont_size=20,
                 )
-            )
 
-        fig.update_xaxes(
-            showgrid=True,
-            title_font=dict(size=18, family='Noto Sans', color='#691c32'),  # X-axis title font size
-            tickfont=dict(size=15, family='Noto Sans', color='#4f4f4f'),  # X-axis tick label font size
-            tickangle=-75,
-            )
+            fig.update_layout(
+                uniformtext_minsize=8, uniformtext_mode='hide',
+                hovermode="x unified",
+                autosize=True,
+                height=600,
+                xaxis_title='',
+                yaxis_title='Asignacion 2026',
+                hoverlabel=dict(
+                    bgcolor="#fff",
+                    font_size=16,
+                    font_family="Noto Sans",
+                    )
+                )
+
+            fig.update_xaxes(
+                showgrid=True,
+                title_font=dict(size=18, family='Noto Sans', color='#691c32'),  # X-axis title font size
+                tickfont=dict(size=15, family='Noto Sans', color='#4f4f4f'),  # X-axis tick label font size
+                tickangle=-75,
+                )
 
-        fig.update_yaxes(
-            tickprefix="$",
-            tickformat=',.0f',
-            showgrid=True,
-            title_font=dict(size=16, family='Noto Sans', color='#28282b'),
-            tickfont=dict(size=15, family='Noto Sans', color='#4f4f4f'),
-            tickangle=0,
+            fig.update_yaxes(
+                tickprefix="$",
+                tickformat=',.0f',
+                showgrid=True,
+                title_font=dict(size=16, family='Noto Sans', color='#28282b'),
+                tickfont=dict(size=15, family='Noto Sans', color='#4f4f4f'),
+                tickangle=0,
+                )
+            return fig
+
+        with span('figura'):
+            fig = cached_figure(
+                asignacion_2026,
+                df_results,
+                [{'y': df_results['Asignacion_2026'].to_numpy(), 'customdata': df_results[['Var%']].to_numpy()}],
+                layout={'title': {'text': f"Población={w_pob*100:.0f}%, Tasa policial={w_edo_fza*100:.0f}%, Incidencia delictiva={w_var_incidencia_del*100:.0f}%, Academias={w_academias*100:.0f}%"}},
+                key=tuple(df_results['Entidad_Federativa']),
             )
-            
         st.plotly_chart(fig, use_container_width=True)
 
 
@@ -418,62 +453,69 @@ else:
         # create positive and negative colors using if and list comprehension
         var_color = ['#235b4e' if v > 0 else '#9f2241' for v in df_results['Var%']]
 
-        fig_var = px.bar(
-            df_results,
-            x='Entidad_Federativa',
-            y='Var%',
-            text='Var%',
-            title=f"Variación en la Asignación de Fondos con respecto al Ejercicio Anterior",
-            template='ggplot2',
-            hover_data={
-                'Entidad_Federativa':False,
-                'Var%':':.2%',
-                },
-            labels={
-                'Entidad_Federativa':'Entidad Federativa',
-                'Var%':'Variación',
-                },
-        )
-            
-        fig_var.update_traces(
-            textposition='outside',
-            marker_color=var_color,
-            opacity=0.9,
-            marker_line_color='#6f7271',
-            marker_line_width=1.2,
-            texttemplate='%{text:.2%}',
-            textfont_size=20,
+        def variacion(df_results):
+            fig_var = px.bar(
+                df_results,
+                x='Entidad_Federativa',
+                y='Var%',
+                title=f"Variación en la Asignación de Fondos con respecto al Ejercicio Anterior",
+                template='ggplot2',
+                hover_data={
+                    'Entidad_Federativa':False,
+                    'Var%':':.2%',
+                    },
+                labels={
+                    'Entidad_Federativa':'Entidad Federativa',
+                    'Var%':'Variación',
+                    },
             )
 
-        fig_var.update_layout(
-            uniformtext_minsize=8, uniformtext_mode='hide',
-            hovermode="x unified",
-            autosize=True,
-            height=600,
-            xaxis_title='',
-            yaxis_title='Variación %',
-            hoverlabel=dict(
-                bgcolor="#fff",
-                font_size=16,
-                font_family="Noto Sans",
+            fig_var.update_traces(
+                textposition='outside',
+                opacity=0.9,
+                marker_line_color='#6f7271',
+                marker_line_width=1.2,
+                texttemplate='%{y:.2%}',
+                textfont_size=20,
                 )
-            )
 
-        fig_var.update_xaxes(
-            showgrid=True,
-            title_font=dict(size=18, family='Noto Sans', color='#bc955c'),  # X-axis title font size
-            tickfont=dict(size=15, family='Noto Sans', color='#4f4f4f'),  # X-axis tick label font size
-            tickangle=-75,
-        )
+            fig_var.update_layout(
+                uniformtext_minsize=8, uniformtext_mode='hide',
+                hovermode="x unified",
+                autosize=True,
+                height=600,
+                xaxis_title='',
+                yaxis_title='Variación %',
+                hoverlabel=dict(
+                    bgcolor="#fff",
+                    font_size=16,
+                    font_family="Noto Sans",
+                    )
+                )
 
-        fig_var.update_yaxes(
-            tickformat='.0%',
-            showgrid=True,
-            title_font=dict(size=16, family='Noto Sans', color='#28282b'),
-            tickfont=dict(size=15, family='Noto Sans', color='#4f4f4f'),
-            tickangle=0,
+            fig_var.update_xaxes(
+                showgrid=True,
+                title_font=dict(size=18, family='Noto Sans', color='#bc955c'),  # X-axis title font size
+                tickfont=dict(size=15, family='Noto Sans', color='#4f4f4f'),  # X-axis tick label font size
+                tickangle=-75,
+            )
+
+            fig_var.update_yaxes(
+                tickformat='.0%',
+                showgrid=True,
+                title_font=dict(size=16, family='Noto Sans', color='#28282b'),
+                tickfont=dict(size=15, family='Noto Sans', color='#4f4f4f'),
+                tickangle=0,
+                )
+            return fig_var
+
+        with span('figura'):
+            fig_var = cached_figure(
+                variacion,
+                df_results,
+                [{'y': df_results['Var%'].to_numpy(), 'marker': {'color': var_color}}],
+                key=tuple(df_results['Entidad_Federativa']),
             )
-            
         st.plotly_chart(fig_var, use_container_width=True)
 
 
@@ -540,7 +582,7 @@ else:
                 'Superavit': '${:,.2f}',
                 'Deficit': '${:,.2f}',
                 })
-            .applymap(
+            .map(
             highlight_zeros_yellow,
                 subset=['Superavit','Deficit']
             )
@@ -619,62 +661,72 @@ else:
 
         # grafico2
         # Gráfico de barras de reasignacion de remanente 2026 vs 2025
-        fig2 = go.Figure(data=[
-            go.Bar(name='Ejercicio 2025',
-                x=df_results['Entidad_Federativa'],
-                y=df_results['Asignacion_2025'],
-                marker_color='#bc955c',
-                ),
-            go.Bar(name='Ejercicio 2026',
-                x=df_results['Entidad_Federativa'],
-                y=df_results['Asignacion_ajustada'],
-                marker_color='#691c32',
-                ),
-            ])
-
-        # Update layout to group bars
-        fig2.update_traces(
-            textposition='outside',
-            opacity=0.9,
-            marker_line_color='#6f7271',
-            marker_line_width=1.2,
-            texttemplate='$%{text:,.2f}',
-            textfont_size=20,
-            )
+        def reasignacion(df_results):
+            fig2 = go.Figure(data=[
+                go.Bar(name='Ejercicio 2025',
+                    x=df_results['Entidad_Federativa'],
+                    y=df_results['Asignacion_2025'],
+                    marker_color='#bc955c',
+                    ),
+                go.Bar(name='Ejercicio 2026',
+                    x=df_results['Entidad_Federativa'],
+                    y=df_results['Asignacion_ajustada'],
+                    marker_color='#691c32',
+                    ),
+                ])
+
+            # Update layout to group bars
+            fig2.update_traces(
+                textposition='outside',
+                opacity=0.9,
+                marker_line_color='#6f7271',
+                marker_line_width=1.2,
+                texttemplate='$%{text:,.2f}',
+                textfont_size=20,
+                )
 
-        fig2.update_layout(
-            barmode='group',
-            title=f"Reasignación de Fondos por Entidad Federativa después de Remanente de la banda de ±10%",
-            template='ggplot2',
-            uniformtext_minsize=8, uniformtext_mode='hide',
-            hovermode="x unified",
-            autosize=True,
-            height=600,
-            xaxis_title='',
-            yaxis_title='Asignacion 2026',
-            hoverlabel=dict(
-                bgcolor="#fff",
-                font_size=16,
-                font_family="Noto Sans",
+            fig2.update_layout(
+                barmode='group',
+                title=f"Reasignación de Fondos por Entidad Federativa después de Remanente de la banda de ±10%",
+                template='ggplot2',
+                uniformtext_minsize=8, uniformtext_mode='hide',
+                hovermode="x unified",
+                autosize=True,
+                height=600,
+                xaxis_title='',
+                yaxis_title='Asignacion 2026',
+                hoverlabel=dict(
+                    bgcolor="#fff",
+                    font_size=16,
+                    font_family="Noto Sans",
+                    )
                 )
-            )
 
-        fig2.update_xaxes(
-            showgrid=True,
-            title_font=dict(size=18, family='Noto Sans', color='#691c32'),  # X-axis title font size
-            tickfont=dict(size=15, family='Noto Sans', color='#4f4f4f'),  # X-axis tick label font size
-            tickangle=-75,
-            )
+            fig2.update_xaxes(
+                showgrid=True,
+                title_font=dict(size=18, family='Noto Sans', color='#691c32'),  # X-axis title font size
+                tickfont=dict(size=15, family='Noto Sans', color='#4f4f4f'),  # X-axis tick label font size
+                tickangle=-75,
+                )
 
-        fig2.update_yaxes(
-            tickprefix="$",
-            tickformat=',.0f',
-            showgrid=True,
-            title_font=dict(size=16, family='Noto Sans', color='#28282b'),
-            tickfont=dict(size=15, family='Noto Sans', color='#4f4f4f'),
-            tickangle=0,
+            fig2.update_yaxes(
+                tickprefix="$",
+                tickformat=',.0f',
+                showgrid=True,
+                title_font=dict(size=16, family='Noto Sans', color='#28282b'),
+                tickfont=dict(size=15, family='Noto Sans', color='#4f4f4f'),
+                tickangle=0,
+                )
+            fig2.show()
+            return fig2
+
+        with span('figura'):
+            fig2 = cached_figure(
+                reasignacion,
+                df_results,
+                [{'y': df_results['Asignacion_2025'].to_numpy()}, {'y': df_results['Asignacion_ajustada'].to_numpy()}],
+                key=tuple(df_results['Entidad_Federativa']),
             )
-        fig2.show()
         st.plotly_chart(fig2, use_container_width=True)
 
         
@@ -682,112 +734,116 @@ else:
         st.markdown('*© Dirección General de Planeación*')
 
 
-    with tab3:
-        st.header('3. Nota metodológica')
-        st.markdown("""
-        1. **Normalización:** Todos los indicadores se escalan al rango [0, 1].
-        2. **Agregación:** Se aplica la suma ponderada de las variables normalizadas.
-        3. **Corrimiento estadístico:** Se suma un valor epsilon para evitar coeficientes nulos.
-        4. **Repartición:** Se reparte el presupuesto entre las Entidades Federativas según el valor de las ponderaciones de los indicadores.
-        """)
-
-        st.subheader('3.1 Normalización')
-        st.latex(r'''
-        V_{i,j} = \frac{X_{i,j} - X_{i, \min}}{X_{i, \max} - X_{i, \min}}\\
-        \text{ }\\
-        \text{donde:}\\
-        \text{ }\\
-        V_{i,j} = \text{Valor normalizado del indicador i para la Entidad Federativa j}\\
-        X_{i,j} = \text{Indicador i de la Entidad Federativa j}\\
-        ''')
-        st.markdown('`Inversión: Las variables negativas se invierten para que una tasa baja resulte en un valor normalizado alto (cercano a 1).`')
+    if tab3.open:
+        with tab3:
+            st.header('3. Nota metodológica')
+            st.markdown("""
+            1. **Normalización:** Todos los indicadores se escalan al rango [0, 1].
+            2. **Agregación:** Se aplica la suma ponderada de las variables normalizadas.
+            3. **Corrimiento estadístico:** Se suma un valor epsilon para evitar coeficientes nulos.
+            4. **Repartición:** Se reparte el presupuesto entre las Entidades Federativas según el valor de las ponderaciones de los indicadores.
+            """)
+
+            st.subheader('3.1 Normalización')
+            st.latex(r'''
+            V_{i,j} = \frac{X_{i,j} - X_{i, \min}}{X_{i, \max} - X_{i, \min}}\\
+            \text{ }\\
+            \text{donde:}\\
+            \text{ }\\
+            V_{i,j} = \text{Valor normalizado del indicador i para la Entidad Federativa j}\\
+            X_{i,j} = \text{Indicador i de la Entidad Federativa j}\\
+            ''')
+            st.markdown('`Inversión: Las variables negativas se invierten para que una tasa baja resulte en un valor normalizado alto (cercano a 1).`')
         
-        st.subheader('3.2 Agregación del Índice')
-        st.latex(r'''
-        I_j = \sum_{i=1}^{n}( V_{i,j} \times W_i)\\
-        \text{ }\\
-        \text{donde:}\\
-        \text{ }\\
-        I_j = \text{Índice de asignación de fondos para la Entidad Federativa j}\\
-        V_{i,j} = \text{Valor normalizado del indicador i para la Entidad Federativa j}\\
-        W_i = \text{Ponderación del indicador i}\\
-        ''')
-        st.markdown('`Re-escalado: El índice final se re-escala [0, 1] para facilitar la interpretación del rendimiento relativo.`')
-
-        st.subheader('3.3 Corrimiento Estadístico')
-        st.markdown('''
-        La fórmula opera sobre el índice normalizado (con rango [0,1]) usando una constante pequeña y positiva, ϵ.
-
-        ##### 3.3.1  Compresión del Rango: (indice_normalizado * (1−ϵ))
-
-        **Objetivo: Comprimir el rango de los valores normalizados.**
-
-        - Multiplicar por un factor ligeramente menor que 1, como (1−0.0001)=0.9999.
-        - El rango original [0,1] se convierte en [0,1−ϵ].
-        - El valor mínimo (0) se mantiene en 0×(1−ϵ)=0.
-        - El valor máximo (1) se reduce a 1×(1−ϵ)=1−ϵ.
+            st.subheader('3.2 Agregación del Índice')
+            st.latex(r'''
+            I_j = \sum_{i=1}^{n}( V_{i,j} \times W_i)\\
+            \text{ }\\
+            \text{donde:}\\
+            \text{ }\\
+            I_j = \text{Índice de asignación de fondos para la Entidad Federativa j}\\
+            V_{i,j} = \text{Valor normalizado del indicador i para la Entidad Federativa j}\\
+            W_i = \text{Ponderación del indicador i}\\
+            ''')
+            st.markdown('`Re-escalado: El índice final se re-escala [0, 1] para facilitar la interpretación del rendimiento relativo.`')
+
+            st.subheader('3.3 Corrimiento Estadístico')
+            st.markdown('''
+            La fórmula opera sobre el índice normalizado (con rango [0,1]) usando una constante pequeña y positiva, ϵ.
+
+            ##### 3.3.1  Compresión del Rango: (indice_normalizado * (1−ϵ))
+
+            **Objetivo: Comprimir el rango de los valores normalizados.**
+
+            - Multiplicar por un factor ligeramente menor que 1, como (1−0.0001)=0.9999.
+            - El rango original [0,1] se convierte en [0,1−ϵ].
+            - El valor mínimo (0) se mantiene en 0×(1−ϵ)=0.
+            - El valor máximo (1) se reduce a 1×(1−ϵ)=1−ϵ.
         
-        ##### 3.3.2 Corrimiento hacia arriba (Shift): +ϵ
+            ##### 3.3.2 Corrimiento hacia arriba (Shift): +ϵ
 
-        **Objetivo: Desplazar todo el conjunto de datos hacia arriba por la cantidad ϵ.**
+            **Objetivo: Desplazar todo el conjunto de datos hacia arriba por la cantidad ϵ.**
 
-        Se suma ϵ al resultado del paso anterior.
+            Se suma ϵ al resultado del paso anterior.
 
-        - El mínimo, que era 0, ahora es 0+ϵ=ϵ.
-        - El máximo, que era 1−ϵ, ahora es (1−ϵ)+ϵ=1.
+            - El mínimo, que era 0, ahora es 0+ϵ=ϵ.
+            - El máximo, que era 1−ϵ, ahora es (1−ϵ)+ϵ=1.
         
         
-        |Indice normalizado|Transformación|Valor Final|
-        |:---:|:---:|:---:|
-        |0 (mínimo)|(0 * (1−ϵ)) + ϵ|ϵ|
-        |1 (máximo)|(1 * (1−ϵ)) + ϵ|1|
-
-        ''')
-
-        st.subheader('3.4 Repartición del Presupuesto')
-        st.markdown('''
-        Se calcula la participación porcentual de cada Entidad Federativa en el índice total
-        y se distribuye el fondo total entre cada una de acuerdo a su participación porcentual.
-        ''')
+            |Indice normalizado|Transformación|Valor Final|
+            |:---:|:---:|:---:|
+            |0 (mínimo)|(0 * (1−ϵ)) + ϵ|ϵ|
+            |1 (máximo)|(1 * (1−ϵ)) + ϵ|1|
+
+            ''')
+
+            st.subheader('3.4 Repartición del Presupuesto')
+            st.markdown('''
+            Se calcula la participación porcentual de cada Entidad Federativa en el índice total
+            y se distribuye el fondo total entre cada una de acuerdo a su participación porcentual.
+            ''')
         
-        st.subheader('3.5 Repartición del Remanente')
-        st.markdown('''
-        <div style="text-align: justify;">
-        Se aplican bandas del ±10% respecto al importe asignado del ejercicio anterior inmediato y se obtiene 
-        el total de importe sobrante y faltante aplicando estas bandas.
-        Posteriormente, se reparte este remanente entre las diversas Entidades Federativas para que ninguna rebase
-        las bandas del ±10%.
-        </div>''',
-        unsafe_allow_html=True)
-
-        st.markdown('---')
-        st.markdown('*© Dirección General de Planeación*')
-
-        # Inject custom CSS to left-align KaTeX elements
-        st.markdown(
-            """
-            <style>
-            .katex-html {
-                text-align: left;
-            }
-            </style>
-            """,
-            unsafe_allow_html=True
-        )
+            st.subheader('3.5 Repartición del Remanente')
+            st.markdown('''
+            <div style="text-align: justify;">
+            Se aplican bandas del ±10% respecto al importe asignado del ejercicio anterior inmediato y se obtiene 
+            el total de importe sobrante y faltante aplicando estas bandas.
+            Posteriormente, se reparte este remanente entre las diversas Entidades Federativas para que ninguna rebase
+            las bandas del ±10%.
+            </div>''',
+            unsafe_allow_html=True)
+
+            st.markdown('---')
+            st.markdown('*© Dirección General de Planeación*')
+
+            # Inject custom CSS to left-align KaTeX elements
+            st.markdown(
+                """
+                <style>
+                .katex-html {
+                    text-align: left;
+                }
+                </style>
+                """,
+                unsafe_allow_html=True
+            )
 
-    with tab4:
+    if tab4.open:
+        with tab4:
 
-        st.header('4. Nota técnica')
-        st.markdown("""
-        En este apartado, se muestra la sábana de datos con todos las fases del cálculo de asignación de fondos,
-        incluyendo las bandas y reasignación del remanente.
+            st.header('4. Nota técnica')
+            st.markdown("""
+            En este apartado, se muestra la sábana de datos con todos las fases del cálculo de asignación de fondos,
+            incluyendo las bandas y reasignación del remanente.
 
-        Por otra parte, se anexa hoja de cálculo en formato xlsx (Excel) con el desarrollo mencionado.
-        """)
+            Por otra parte, se anexa hoja de cálculo en formato xlsx (Excel) con el desarrollo mencionado.
+            """)
 
-        st.dataframe(df_results)
+            st.dataframe(df_results)
 
-        st.markdown("[Hoja de cálculo](https://sspcgob-my.sharepoint.com/:x:/g/personal/oscar_avila_sspc_gob_mx/ESy9dnRh6AdJgNEwSx5-udMBcKgLhTP29mnxWhgDvYF6WA?e=l1O8Xl)")
+            st.markdown("[Hoja de cálculo](https://sspcgob-my.sharepoint.com/:x:/g/personal/oscar_avila_sspc_gob_mx/ESy9dnRh6AdJgNEwSx5-udMBcKgLhTP29mnxWhgDvYF6WA?e=l1O8Xl)")
         
-        st.markdown('---')
-        st.markdown('*© Dirección General de Planeación*')
+            st.markdown('---')
+            st.markdown('*© Dirección General de Planeación*')
+
+medida.finish()
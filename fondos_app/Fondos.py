@@ -1,16 +1,14 @@
 import streamlit as st
-import numpy as np
-import pandas as pd
-import polars as pl
-import plotly.express as px
-import plotly.graph_objects as go
-from PIL import Image
-from great_tables import GT, md
 import os
-import io
-from dotenv import load_dotenv
-load_dotenv('.env')
-import time
+import sys
+from pathlib import Path
+
+# paquete compartido 'asignacion' en la raíz del repositorio; la portada no usa pandas,
+# plotly ni great_tables, sólo el logo y .env, leídos una vez por proceso
+# (ver asignacion.arranque)
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from asignacion.arranque import load_env, cached_logo
+load_env('.env')
 
 
 # blog home link
@@ -25,7 +23,7 @@ hide_default_format = """
     """
 
 # load icon image
-im = Image.open('images/logo.png')
+im = cached_logo('images/logo.png')
 
 # page layout config and add image
 st.set_page_config(layout="wide", page_title="Fondos App", page_icon=im)
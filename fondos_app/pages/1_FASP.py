@@ -2,15 +2,42 @@
 import streamlit as st
 import numpy as np
 import pandas as pd
-import polars as pl
-import plotly.express as px
-import plotly.graph_objects as go
-from PIL import Image
-from great_tables import GT, md
 import os
-import io
-from dotenv import load_dotenv
-load_dotenv('.env')
+import sys
+import sqlite3
+from pathlib import Path
+
+# paquete compartido 'asignacion' en la raíz del repositorio
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+# plotly express y great_tables se importan hasta que haga falta armar una gráfica o una
+# tabla que no está en caché; .env, logo e indicadores se leen una vez por proceso
+# (ver asignacion.arranque)
+from asignacion.arranque import lazy_import, load_env, cached_logo, cached_catalog
+px = lazy_import('plotly.express')
+GT, md = lazy_import('great_tables', 'GT', 'md')
+workbook_bytes = lazy_import('asignacion.sabana', 'workbook_bytes')
+reports_zip = lazy_import('asignacion.reportes', 'reports_zip')
+load_env('.env')
+from asignacion import calculate_index, allocation_engine, to_centavos, to_pesos
+from asignacion.grafo import Grafo, content_key
+from asignacion.disco import disk_cache
+from asignacion.tablas import gt_html, formatted_table
+from asignacion.graficas import cached_figure
+from asignacion.escenarios import weight_matrix, monte_carlo_chunks, monte_carlo_chunk, sensitivity_summary
+from asignacion.trabajos import LOTE, ColaLlena, Tarea, planificador, session_job, worker_pool
+from asignacion.biblioteca import biblioteca
+from asignacion.enlaces import restore_widgets, sync_url, shared_dataset
+from asignacion.medicion import medicion, span
+from asignacion.formatos import DatosInvalidos, UPLOAD_TYPES
+from asignacion.centavos import BandasInfactibles
+from asignacion.validacion import validate_dataset
+
+# normalización, índice y rebalanceo con pandas o con polars (ASIGNACION_MOTOR, ver
+# asignacion.columnar); los dos motores dan los mismos centavos
+motor = allocation_engine()
+
+# medición opcional de etapas y cachés (ASIGNACION_MEDICION=1, ver asignacion.medicion)
+medida = medicion('FASP')
 
 
 # --- app settings ---
@@ -26,7 +53,7 @@ hide_default_format = """
     """
 
 # load icon image
-im = Image.open('images/logo.png')
+im = cached_logo('images/logo.png')
 
 # page layout config and add image
 st.set_page_config(layout="wide", page_title="FASP App", page_icon=im)
@@ -83,6 +110,33 @@ st.markdown("""
     """, unsafe_allow_html=True)
 
 
+# --- enlaces ---
+# parámetros de la URL -> key del widget: la URL guarda el escenario y se puede compartir
+# (ver asignacion.enlaces)
+ENLACE = {
+    'presupuesto': 'Presupuesto estimado',
+    'bs': 'Limite superior',
+    'bi': 'Limite inferior',
+    'Pob': 'Población (Alto=Bueno)',
+    'Inc_del': 'Incidencia delictiva (Alto=Bueno)',
+    'base': 'Monto base',
+    'Tasa_policial': 'Tasa policial (Alto=Bueno)',
+    'Dig_salarial': 'Dig salarial (Alto=Bueno)',
+    'Profesionalizacion': 'Profesionalización (Alto=Bueno)',
+    'Ctrl_conf': 'Ctrl confianza (Alto=Bueno)',
+    'Disp_camaras': 'Disp cámaras (Alto=Bueno)',
+    'Disp_lectores_veh': 'Disp lectores veh. (Alto=Bueno)',
+    'Tasa_abandono_llamadas': 'Tasa abandono llamadas (Alto=Malo)',
+    'Cump_presup': 'Cump. presup. (Alto=Bueno)',
+    'Sobrepob_penitenciaria': 'Sobrepob. penitenciaria (Alto=Malo)',
+    'Proc_justicia': 'Proc justicia (Alto=Malo)',
+    'Servs_forenses': 'Servs forenses (Alto=Bueno)',
+    'Eficiencia_procesal': 'Eficiencia procesal (Alto=Bueno)',
+}
+# los ponderadores van de 0 a 1 (ver create_weight_input); el fondo y las bandas no tienen límites
+restore_widgets(ENLACE, 'fasp', {param: (0.0, 1.0) for param in ENLACE if param not in ('presupuesto', 'bs', 'bi')})
+
+
 # --- sidebar ---
 # sidebar image and text
 st.sidebar.image('images/sesnsp.png')
@@ -113,6 +167,17 @@ with st.sidebar.expander('Bandas'):
         value=0.0, key='Limite inferior',
     )
 
+with st.sidebar.expander('Simulación'):
+    # escenarios con ponderadores perturbados alrededor de los del panel
+    simulaciones = st.number_input(
+        'Escenarios',
+        min_value=1_000, max_value=100_000, value=10_000, step=1_000, key='Escenarios simulados',
+    )
+    dispersion = st.number_input(
+        'Variación de ponderadores',
+        min_value=0.0, max_value=1.0, value=0.2, step=0.05, key='Variacion ponderadores',
+    )
+
 
 
 # Sliders for weights
@@ -182,24 +247,27 @@ weights = {
 }
 
 
-# widget para subir archivos
-uploaded_file = st.file_uploader("", type=['csv'], )
+# --- grafo de cálculo ---
+# cada paso se recalcula sólo cuando cambian sus entradas: mover las bandas no vuelve a
+# leer el archivo ni a calcular el índice (ver asignacion.grafo); los nodos con
+# persist=True quedan además en disco y sobreviven a un reinicio (ver asignacion.disco)
+grafo = Grafo(disco=disk_cache)
 
-if uploaded_file is None:
-    st.text('Sube el archivo con las variables para la asignación del fondo en formato csv.')
-else:
-    data = pd.read_csv(io.BytesIO(uploaded_file.getvalue()))    
+@grafo.node('archivo', persist=True)
+def validacion(archivo):
+    # CSV, Parquet o Arrow: esquema, Entidades y rangos en una pasada (ver asignacion.validacion)
+    return validate_dataset(archivo, 'FASP')
 
-    # --- UPDATED INDICADORES ---
-    # Create a structure for the new 15 indicators (placeholders)
-    try:
-        indicadores_fasp = pd.read_csv('fasp_indicadores.csv')
-    except FileNotFoundError:
-        st.error("Archivo 'fasp_indicadores.csv' no encontrado.")
-        st.stop()
-    
-    # Format GT table (rest of the GT configuration is the same)
-    indicadores = (
+
+@grafo.node('validacion')
+def datos(validacion):
+    validacion.raise_for_errors()
+    return validacion.datos
+
+
+def formato_indicadores(indicadores_fasp):
+    # Format GT table
+    return (
         GT(indicadores_fasp)
         .tab_stub()
         .tab_header(
@@ -237,457 +305,607 @@ else:
             source_note=md("Fuente: *Secretariado Ejecutivo del Sistema Nacional de Seguridad Pública*")
         )
     )
-    
-
-    # tab layout
-    tab1, tab2, tab3 = st.tabs(['1.Indicadores','2.Asignación','3.Nota técnica',])
 
 
-    with tab1:
-
-        # header
-        st.subheader('Indicadores Utilizados para la Asignación')
-        st.markdown('''
-        <div style="text-align: justify;">
-        
-        El **Fondo de Aportaciones para la Seguridad Pública** (FASP) es un fondo presupuestal previsto en
-        la *Ley de Coordinación Fiscal* a través del cual se transfieren recursos a las entidades federativas
-        para dar cumplimiento a estrategias nacionales en materia de seguridad pública.
-        
-        En la siguiente tabla, se listan los indicadores utilizados para la asignación de este fondo.
-        
-        </div>''',
-         unsafe_allow_html=True)
-
-        st.html(indicadores)
-        st.caption('Tabla 1. Indicadores utilizados para la asignación de fondos y ponderaciones predeterminadas.')
-        st.markdown('Para mayor información sobre el fondo, vísite la página [Fondo de Aportaciones para la Seguridad Pública (FASP) 2025](https://www.gob.mx/sesnsp/acciones-y-programas/fondo-de-aportaciones-para-la-seguridad-publica-fasp)')
-        
-        st.markdown('''
-        ---
-        *© Dirección General de Planeación*   
-        *Elaborado por Jesús López Monroy*   
-        ''')
-
-
-    with tab2:
-        #st.header('2. Cálculo de Asignación')
-        st.markdown(f'''
-            ## Escenarios de Asignación
-            #### Fondo: *{presupuesto_formateado}*
-        ''')
-        st.subheader("Datos de Entrada")
-
-        # --- Funciones de Cálculo del Índice proporcion directa (aplicando shift=mean(x)+stdev(x) al invertir alto=malo) ---
-        def direct_proportion_normalize(series, direction='positive'):
-            """
-            Normaliza una serie de datos usando el método de Proporción Directa (Normalización a la Suma).
-            Implementa un 'shift' para asegurar que todos los valores sean no negativos.
-            
-            - Si la dirección es 'positive' (Alto=Bueno), usa Proporción Directa.
-            - Si la dirección es 'negative' (Alto=Malo), usa una Proporción Inversa Suavizada 
-            (penalizando valores altos) basada en la fórmula R/(R+X) donde R es la media + std.
-            """
-            
-            # Asegurar que el input es una Serie de Pandas
-            if not isinstance(series, pd.Series):
-                series = pd.Series(series)
+@grafo.node()
+def indicadores():
+    # HTML desde el caché de tablas del proceso (compartido entre sesiones)
+    return gt_html(cached_catalog('fasp_indicadores.csv'), formato_indicadores)
+
+
+@grafo.node('datos')
+def tabla_entrada(datos):
+    # Adjust data for display: sólo las columnas en porcentaje son nuevas, las demás se
+    # comparten con `datos` (copy-on-write)
+    data = datos.assign(**(datos[['Inc_del','Dig_salarial','Disp_camaras','Disp_lectores_veh','Tasa_abandono_llamadas',
+        'Cump_presup','Sobrepob_penitenciaria','Proc_justicia','Servs_forenses','Eficiencia_procesal',]]*100))
+    data.index = pd.RangeIndex(start=1, stop=len(data)+1, step=1)
+    return formatted_table(
+        data.rename(columns={'Entidad': 'Entidad_Federativa'}),
+        {
+            'Pob': '{:,.0f}',
+            'Inc_del':'{:.2f}%',
+            'Tasa_policial':'{:.2f}',
+            'Dig_salarial':'{:.2f}%',
+            'Profesionalizacion':'{:.0f}',
+            'Ctrl_conf':'{:.2f}',
+            'Disp_camaras':'{:.2f}%',
+            'Disp_lectores_veh':'{:.2f}%',
+            'Tasa_abandono_llamadas':'{:.2f}%',
+            'Cump_presup':'{:.2f}%',
+            'Sobrepob_penitenciaria':'{:.2f}%',
+            'Proc_justicia':'{:.2f}%',
+            'Servs_forenses':'{:.2f}%',
+            'Eficiencia_procesal':'{:.2f}%',
+            'Asignacion_2025': '${:,.2f}',
+        },
+    )
 
-            # 1. SHIFTING: Asegurar que el valor mínimo de la serie sea 0 o positivo.
-            R = series.mean() + series.std()*3
 
-            min_val = series.min()
-            
-            # Shift para que el mínimo sea exactamente 0 (si era negativo)
-            if min_val < 0:
-                # Corrimiento de prom + stdev.
-                shifted_series = series + R 
-            else:
-                # No se necesita shift si el mínimo es 0 o positivo.
-                shifted_series = series
-            
-            # --- Lógica de Normalización ---
-            if direction == 'positive':
-                # Alto=Bueno (Proporción Directa Estándar)
-                total_sum = shifted_series.sum()
-                
-                if total_sum == 0:
-                    # Caso extremo: si todos los valores son cero después del shift.
-                    return pd.Series(1.0 / len(shifted_series), index=shifted_series.index)
-                
-                return shifted_series / total_sum
-            
-            elif direction == 'negative':
-                
-                # Alto=Malo: Proporción Inversa Suavizada (penalizando valores altos)
-                # Un valor grande (Alto=Malo) dará un resultado penalizado (cercano a 0).
-                penalized_series = 1 / shifted_series
-                
-                # 3. Normalizar la serie penalizada a la suma (Proporción Directa)
-                total_sum_penalized = penalized_series.sum()
-                
-                if total_sum_penalized == 0:
-                    # Si, por alguna razón, la suma es 0 después de la penalización (muy improbable con R>0)
-                    return pd.Series(1.0 / len(shifted_series), index=shifted_series.index)
-                    
-                return penalized_series / total_sum_penalized
-                
-
-        def calculate_index(df, weights, presupuesto):
-            """
-            Calcula la Asignación de Fondo Ponderada (Reparto Directo) y la contribución monetaria por variable.
-            """
-            
-            # 1. Fondo restante a repartir por variables (94% del fondo)
-            #w_remaining_fund_percent = 1 - weights['Monto base']
-            #w_remaining_fund = presupuesto * w_remaining_fund_percent
-            
-            # Diccionario para almacenar las contribuciones monetarias de cada variable
-            contributions = {}
-
-            # --- Definiciones de Normalización y Cálculo de Monto (94% del fondo) ---    
-            # Mapping of variable names to their properties
-            variable_map = {
-                'Pob': 'positive', 'Tasa_policial': 'positive', 'Profesionalizacion': 'positive', 
-                'Ctrl_conf': 'positive', 'Disp_camaras': 'positive', 'Disp_lectores_veh': 'positive',
-                'Cump_presup': 'positive', 'Servs_forenses': 'positive', 'Eficiencia_procesal': 'positive',
-                'Inc_del': 'positive', 'Dig_salarial': 'positive', 
-                'Tasa_abandono_llamadas': 'negative', 'Sobrepob_penitenciaria': 'negative', 
-                'Proc_justicia': 'negative'
-            }
-
-            for var_name, direction in variable_map.items():
-                # 1. Normalización
-                df[f'{var_name}_prop'] = direct_proportion_normalize(df[var_name], direction=direction)
-                
-                # 2. Cálculo de la Contribución Monetaria Ponderada
-                # (Proporción * Peso de la variable * Fondo restante)
-                contribution_col_name = f'Monto_{var_name}'
-                contributions[contribution_col_name] = df[f'{var_name}_prop'] * weights[var_name] * presupuesto
-
-            # --- Cálculo del Monto Base (6% del fondo) ---
-            w_base_amount = presupuesto * weights['Monto base']
-            base_share = w_base_amount / len(df)
-            
-            # sumamos el monto base constante para cada fila
-            contributions['Monto_Base'] = pd.Series(base_share, index=df.index) 
+@grafo.node('datos', 'matriz', 'weights', 'presupuesto', persist=True)
+def indice(datos, matriz, weights, presupuesto):
+    # sólo las columnas que usan las tablas, la gráfica y el rebalanceo: la asignación sale
+    # de la matriz normalizada (un producto matriz-vector) sin agregar las 14 proporciones
+    # y los 14 montos por indicador a una copia de `datos`; ésos se arman sólo para la sábana
+    bruta, reparto = motor.index_allocation(matriz, weights, presupuesto)
+    df_results = datos[['Entidad_Federativa', 'Asignacion_2025']].assign(
+        Asignacion_Bruta_centavos=bruta,
+        Reparto=reparto,
+        Asignacion_2026=to_pesos(bruta),
+    )
+    # create diff amount and percentage
+    df_results['Var%'] = df_results['Asignacion_2026'] / df_results['Asignacion_2025'] -1
+    return df_results
 
-            # --- 3. Cálculo de la Asignación Bruta y Reparto Final ---
-            # Sumar todas las contribuciones. (Esto incluye las 14 Series de variables + la Serie de Monto Base)
-            # Al ser todas Series, la suma es vectorial (fila por fila).
-            df['Asignacion_Bruta'] = sum(contributions.values())
-            
-            # Combinar todas las contribuciones (Monto_X) con el DF principal
-            df = pd.concat([df, pd.DataFrame(contributions)], axis=1)
-            
-            # Para el resto del código (remanente) se necesita una columna que sume 1.00 y represente el reparto:
-            df['Reparto'] = df['Asignacion_Bruta'] / df['Asignacion_Bruta'].sum()
-            
-            return df            
-        
-        
-        # Adjust data for display
-        fasp_datos_entrada = data.copy()
-        data.index = pd.RangeIndex(start=1, stop=len(data)+1, step=1)
-        # Apply formatting to relevant columns
-        data[['Inc_del','Dig_salarial','Disp_camaras','Disp_lectores_veh','Tasa_abandono_llamadas',
-            'Cump_presup','Sobrepob_penitenciaria','Proc_justicia','Servs_forenses','Eficiencia_procesal',]] = (
-        data[['Inc_del','Dig_salarial','Disp_camaras','Disp_lectores_veh','Tasa_abandono_llamadas',
-            'Cump_presup','Sobrepob_penitenciaria','Proc_justicia','Servs_forenses','Eficiencia_procesal',]]*100
-        )
-        fasp_datos_entrada2 = (
-            data.rename(columns={'Entidad': 'Entidad_Federativa'})
-                .style.format({
-                    'Pob': '{:,.0f}',
-                    'Inc_del':'{:.2f}%',
-                    'Tasa_policial':'{:.2f}',
-                    'Dig_salarial':'{:.2f}%',
-                    'Profesionalizacion':'{:.0f}',
-                    'Ctrl_conf':'{:.2f}',
-                    'Disp_camaras':'{:.2f}%',
-                    'Disp_lectores_veh':'{:.2f}%',
-                    'Tasa_abandono_llamadas':'{:.2f}%',
-                    'Cump_presup':'{:.2f}%',
-                    'Sobrepob_penitenciaria':'{:.2f}%',
-                    'Proc_justicia':'{:.2f}%',
-                    'Servs_forenses':'{:.2f}%',
-                    'Eficiencia_procesal':'{:.2f}%',
-                    'Asignacion_2025': '${:,.2f}',
-                    })
-                )
 
-        st.dataframe(fasp_datos_entrada2, use_container_width=True)
-        st.caption('Tabla 2. Variables utilizadas en el modelo para la asignación del fondo.')
+@grafo.node('datos', persist=True)
+def matriz(datos):
+    # proporciones normalizadas; no dependen de los ponderadores (ver asignacion.escenarios)
+    return motor.normalized_matrix(datos)
 
 
-        # --- Cálculo y Visualización ---
-        # Calcular la asignación
-        df_results = calculate_index(fasp_datos_entrada, weights, presupuesto)
-        
+# escenarios de la vista previa que adelanta el precálculo; la simulación con los
+# escenarios del panel corre sólo cuando se pide
+SIMULACION_PREVIA = 1_000
 
-        # Mostrar la tabla final de resultados
-        st.subheader("Resultados Iniciales (sin bandas)")
-        
-        # El reparto ya está en la columna 'Asignacion_Bruta' (sin bandas)
-        df_results['Asignacion_2026'] = df_results['Asignacion_Bruta']
-        
-        # create diff amount and percentage
-        df_results['Var%'] = df_results['Asignacion_2026'] / df_results['Asignacion_2025'] -1
-
-        df_end = (
-            df_results[['Entidad_Federativa','Asignacion_2026','Asignacion_2025','Var%']]
-                .style
-                .format({
-                        'Asignacion_2026': '${:,.2f}',
-                        'Asignacion_2025': '${:,.2f}',
-                        'Var%': '{:.2%}',
-                        })
-        )
 
-        st.dataframe(df_end, width=600)
-        st.caption('Tabla 3. Resultados iniciales sin bandas.')
+def simulacion_fasp(datos, matriz, usuario, escenarios=None):
+    # simulación de sensibilidad en bloques de 1,000 escenarios (por omisión, los del panel);
+    # es trabajo por lotes, así que el planificador le da prioridad al trabajo interactivo
+    # (ver asignacion.trabajos)
+    chunks = monte_carlo_chunks(
+        matriz, weight_matrix(weights), presupuesto, datos['Asignacion_2025'],
+        lower_limit, upper_limit, escenarios or simulaciones, dispersion,
+    )
+    return planificador.submit(
+        monte_carlo_chunk, chunks, combine=np.vstack, user=usuario, priority=LOTE,
+        persist=True,
+    )
 
 
-        # --- Start of the iterative rebalance logic ---
-        st.subheader('Rebalanceo de remanente (*iteración*)')
-        st.markdown(f'''
-        Se estableció una banda de control de **{lower_limit:.0%}** (inferior) y **{upper_limit:.0%}** (superior) para el importe asignado 2026 en relación
-        al asignado 2025.
-        El proceso de rebalanceo es iterativo hasta que **todas** las Entidades Federativas se encuentren dentro de este rango.
-        ''')
+def simulacion_previa(memoria, clave, usuario):
+    # vista previa de la simulación (SIMULACION_PREVIA escenarios) con los parámetros `clave`
+    trabajo = simulacion_fasp(memoria['datos'][1], memoria['matriz'][1], usuario, SIMULACION_PREVIA)
+    memoria['simulacion_previa'] = (clave, trabajo)
+    return trabajo
+
+
+def precalculo_fasp(entradas, clave_previa, usuario):
+    # al subir el archivo se adelanta, en un hilo, lo que usa la pestaña de cálculo: lectura,
+    # matriz normalizada, índice, bandas, tablas, gráfica y una vista previa de la simulación
+    # con pocos escenarios; la simulación completa no se lanza en cada carga de archivo
+    return Tarea([
+        lambda memoria: grafo.run(memoria, ['resultados', 'matriz'], **entradas),
+        lambda memoria: grafo.run(memoria, ['tabla_entrada', 'tabla_inicial', 'tabla_final', 'figura'], **entradas),
+        lambda memoria: simulacion_previa(memoria, clave_previa, usuario),
+    ], name='precalculo_fasp')
+
+
+@grafo.node('indice')
+def tabla_inicial(indice):
+    return formatted_table(
+        indice[['Entidad_Federativa','Asignacion_2026','Asignacion_2025','Var%']],
+        {
+            'Asignacion_2026': '${:,.2f}',
+            'Asignacion_2025': '${:,.2f}',
+            'Var%': '{:.2%}',
+        },
+    )
 
-        # Initial setup before the loop
-        df_iterative = df_results.copy()
-        
-        # Start with the initial calculated allocation as the 'working' column
-        df_iterative['Asignacion_Iterativa'] = df_iterative['Asignacion_Bruta']
-        df_iterative['Asignacion_Final'] = df_iterative['Asignacion_Bruta'] # Final result column
 
-        # Calculate Band Limits (Min and Max)
-        df_iterative['Min'] = df_iterative['Asignacion_2025'] * (1 + lower_limit)
-        df_iterative['Max'] = df_iterative['Asignacion_2025'] * (1 + upper_limit)
+@grafo.node('indice', 'lower_limit', 'upper_limit', persist=True)
+def rebalanceo(indice, lower_limit, upper_limit):
+    # rebalanceo en centavos enteros: las cotas de la banda son enteras y el remanente
+    # se reparte por residuo mayor hasta llegar a cero exacto; si el fondo no cabe en las
+    # bandas, lanza BandasInfactibles antes de iterar
+    return motor.rebalance(indice, lower_limit, upper_limit)
+
+
+@grafo.node('indice', 'rebalanceo', persist=True)
+def resultados(indice, rebalanceo):
+    asignacion_ajustada, _ = rebalanceo
+    # las columnas de `indice` se comparten (copy-on-write); sólo las ajustadas son nuevas
+    ajustada = to_pesos(asignacion_ajustada)
+    return indice.assign(**{
+        'Asignacion_ajustada_centavos': asignacion_ajustada,
+        'Asignacion_ajustada': ajustada,
+        'Var%_ajustada': (ajustada - indice['Asignacion_2025']) / indice['Asignacion_2025'],
+    })
+
+
+@grafo.node('resultados')
+def tabla_final(resultados):
+    # create percentages (sólo esas dos columnas son nuevas)
+    df_reasignacion = resultados[['Entidad_Federativa','Asignacion_2025','Asignacion_2026','Var%','Asignacion_ajustada','Var%_ajustada']]
+    df_reasignacion = df_reasignacion.assign(**(df_reasignacion[['Var%', 'Var%_ajustada']]*100))
+
+    return formatted_table(
+        df_reasignacion,
+        {
+            'Asignacion_2025': '${:,.2f}',
+            'Asignacion_2026': '${:,.2f}',
+            'Var%':'{:.2f}%',
+            'Asignacion_ajustada': '${:,.2f}',
+            'Var%_ajustada':'{:.2f}%',
+        },
+    )
 
-        # Iteration Control
-        max_iterations = 20 # Safety limit
-        current_iteration = 0
-        remanente = 1.0 # Initialize to a non-zero value to start the loop
-        total_remanente_acumulado = 0.0 # To track pooled funds across iterations
 
-        # Use the original proportion for distribution base (it sums to 1.0)
-        df_iterative['Base_Reparto_Original'] = df_iterative['Reparto'] 
+# series de la gráfica comparativa, en el orden de sus trazas
+SERIES_COMPARATIVO = {
+    'Asignacion_2025': 'Asignación 2025 (Referencia)',
+    'Asignacion_2026': 'Asignación 2026 (Inicial)',
+    'Asignacion_ajustada': 'Asignación 2026 (Final Ajustada)',
+}
 
-        # --- ITERATIVE REALLOCATION LOOP ---
-        while abs(remanente) > 0.01 and current_iteration < max_iterations: # Check if the remanente is significant
-            
-            current_iteration += 1
-            
-            # 1. Calculate Superavit and Deficit from the current 'Asignacion_Iterativa'    
-            # Superavit: Funds exceeding the Max band (to be pooled)
-            df_iterative['Superavit'] = np.where(df_iterative['Asignacion_Iterativa'] > df_iterative['Max'],
-                                                df_iterative['Asignacion_Iterativa'] - df_iterative['Max'],
-                                                0)
-            # Deficit: Funds below the Min band (to be covered first)
-            df_iterative['Deficit'] = np.where(df_iterative['Asignacion_Iterativa'] < df_iterative['Min'],
-                                                df_iterative['Min'] - df_iterative['Asignacion_Iterativa'],
-                                                0)
-
-            # 2. Calculate the Net Remanente (Pooled Funds - Deficit Needed)
-            total_superavit = df_iterative['Superavit'].sum()
-            total_deficit = df_iterative['Deficit'].sum()
-            
-            # This is the net fund to be redistributed among "eligible" states
-            remanente = total_superavit - total_deficit 
-            
-            if abs(remanente) < 0.01: # Check again if the remanente is negligible
-                break
-                
-            total_remanente_acumulado += remanente
-
-            # 3. Apply Caps and Floors (Interim Allocation)
-            # The .clip() function sets the current working column to be within the bands
-            df_iterative['Reasignacion'] = df_iterative['Asignacion_Iterativa'].clip(lower=df_iterative['Min'], upper=df_iterative['Max'])
-
-            # 4. Identify Eligible States for Remanente Distribution
-            # Eligible states are those not capped by the Max limit in this iteration
-            # (i.e., their Reasignacion is < Max)
-            df_iterative['Elegibles'] = np.where(df_iterative['Reasignacion'] < df_iterative['Max'], 1, 0)
-            
-            # New sum of the base proportions, only for the eligible states
-            total_basis_share = df_iterative.loc[df_iterative['Elegibles'] == 1, 'Base_Reparto_Original'].sum()
-
-            # 5. Distribute the Net Remanente among Eligible States
-            if total_basis_share > 0:
-                # Repartir el remanente usando la base de reparto original, solo entre elegibles
-                df_iterative['Reparto_neto'] = np.where(df_iterative['Elegibles'] == 1, 
-                                                    (df_iterative['Base_Reparto_Original'] / total_basis_share) * remanente,
-                                                    0)
-            else:
-                # No eligible states, or division by zero. Should not happen if remanente is non-zero.
-                df_iterative['Reparto_neto'] = 0
-
-            # 6. Calculate the New Working Allocation for the next iteration
-            # Sum the capped/floored allocation + the new proportional share of the remanente
-            df_iterative['Asignacion_Iterativa'] = df_iterative['Reasignacion'] + df_iterative['Reparto_neto']
-            
-            # The final result is the working column after all iterations are done
-            df_iterative['Asignacion_Final'] = df_iterative['Asignacion_Iterativa']
-
-        # --- END OF ITERATIVE REALLOCATION LOOP ---
-        st.success(f'Proceso de rebalanceo completado (*{current_iteration} iteraciones*).')
-
-        # Final Calculation and Display
-        # Replace the old final columns with the new iterative result
-        df_results['Asignacion_ajustada'] = df_iterative['Asignacion_Final']
-        df_results['Var%_ajustada'] = (df_results['Asignacion_ajustada'] - df_results['Asignacion_2025']) / df_results['Asignacion_2025']
-
-
-        # Display Final Adjusted Allocation Table (Table 5)
-        df_reasignacion = df_results.copy()
-        # create percentages
-        df_reasignacion['Var%'] = df_reasignacion['Var%']*100
-        df_reasignacion['Var%_ajustada'] = df_reasignacion['Var%_ajustada']*100
-
-        df_reasignacion2 = (
-            df_reasignacion[['Entidad_Federativa','Asignacion_2025','Asignacion_2026','Var%','Asignacion_ajustada','Var%_ajustada']]
-            .style.format({
-                'Asignacion_2025': '${:,.2f}',
-                'Asignacion_2026': '${:,.2f}',
-                'Var%':'{:.2f}%',
-                'Asignacion_ajustada': '${:,.2f}',
-                'Var%_ajustada':'{:.2f}%',
-                })
-        )
 
-        st.markdown('#### Asignación Ajustada Final')
-        st.dataframe(df_reasignacion2, hide_index=True, width=750)
-        st.caption('Tabla 4. asignación ajustada final dentro de la banda especificada.')
+def comparativo(resultados):
+    # figura completa con plotly express; se arma una vez por proceso y después
+    # `figura` sólo reemplaza los montos (ver asignacion.graficas)
+    # 1. Preparar los datos para el gráfico agrupado (Unpivot/Melt)
+    df_chart = resultados[['Entidad_Federativa', *SERIES_COMPARATIVO]]
 
+    df_melted = pd.melt(
+        df_chart,
+        id_vars='Entidad_Federativa',
+        value_vars=list(SERIES_COMPARATIVO),
+        var_name='Tipo_Asignacion',
+        value_name='Monto'
+    )
 
-        # --- 2.5 Visualización de Asignación Ajustada Final ---
-        st.subheader('Comparativo de Asignaciones')
-        st.markdown('''
-        En la siguiente gráfica se observa la diferencia entre el monto de referencia (2025), el monto inicial calculado por el modelo (2026 Inicial) y el monto final ajustado por las bandas de control (2026 Final Ajustada).
-        ''')
+    # 2. Renombrar las categorías para una mejor leyenda y display
+    df_melted['Tipo_Asignacion'] = df_melted['Tipo_Asignacion'].map(SERIES_COMPARATIVO)
+
+    # 3. Definir el mapa de colores para la gráfica
+    color_map = {
+        'Asignación 2025 (Referencia)': '#ddc9a3',    # Neutral/Referencia
+        'Asignación 2026 (Inicial)': '#9f2241',       # Inicial (puede estar fuera de bandas)
+        'Asignación 2026 (Final Ajustada)': '#235b4e' # Final (dentro de bandas)
+    }
+
+    # 4. Crear el gráfico de barras agrupado con Plotly Express
+    fig_final = px.bar(
+        df_melted,
+        x='Entidad_Federativa',
+        y='Monto',
+        color='Tipo_Asignacion',
+        barmode='group',
+        title="Comparativo de Asignaciones de Fondos",
+        template='ggplot2',
+        color_discrete_map=color_map,
+        labels={
+            'Entidad_Federativa': 'Entidad Federativa',
+            'Monto': 'Monto Asignado',
+            'Tipo_Asignacion': 'Tipo de Asignación'
+        },
+        hover_data={
+            'Monto':':,.2f',
+            },
+    )
 
-        # 1. Preparar los datos para el gráfico agrupado (Unpivot/Melt)
-        df_chart = df_results[['Entidad_Federativa', 'Asignacion_2025', 'Asignacion_2026', 'Asignacion_ajustada']].copy()
+    # 5. Configuración de Trazas y Layout
+    fig_final.update_traces(
+        textposition='outside',
+        texttemplate='$%{y:,.0f}', # Muestra valores sin decimales, en millones
+        textfont_size=12,
+        opacity=0.9,
+        marker_line_color='black',
+        marker_line_width=0.5,
+    )
 
-        df_melted = pd.melt(
-            df_chart,
-            id_vars='Entidad_Federativa',
-            value_vars=['Asignacion_2025', 'Asignacion_2026', 'Asignacion_ajustada'],
-            var_name='Tipo_Asignacion',
-            value_name='Monto'
+    fig_final.update_layout(
+        uniformtext_minsize=8, 
+        uniformtext_mode='hide',
+        hovermode="x unified",
+        autosize=True,
+        height=700,
+        xaxis_title='',
+        yaxis_title='Monto asignado',
+        legend_title='Tipo de Monto',
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=.99,
+            xanchor="right",
+            x=1
         )
+    )
 
-        # 2. Renombrar las categorías para una mejor leyenda y display
-        df_melted['Tipo_Asignacion'] = df_melted['Tipo_Asignacion'].map({
-            'Asignacion_2025': 'Asignación 2025 (Referencia)',
-            'Asignacion_2026': 'Asignación 2026 (Inicial)',
-            'Asignacion_ajustada': 'Asignación 2026 (Final Ajustada)'
-        })
-
-        # 3. Definir el mapa de colores para la gráfica
-        color_map = {
-            'Asignación 2025 (Referencia)': '#ddc9a3',    # Neutral/Referencia
-            'Asignación 2026 (Inicial)': '#9f2241',       # Inicial (puede estar fuera de bandas)
-            'Asignación 2026 (Final Ajustada)': '#235b4e' # Final (dentro de bandas)
-        }
+    fig_final.update_xaxes(
+        showgrid=True,
+        tickangle=-60,
+        title_font=dict(size=16, family='Noto Sans', color='#28282b'),
+        tickfont=dict(size=14, family='Noto Sans', color='#4f4f4f'),
+    )
 
-        # 4. Crear el gráfico de barras agrupado con Plotly Express
-        fig_final = px.bar(
-            df_melted,
-            x='Entidad_Federativa',
-            y='Monto',
-            color='Tipo_Asignacion',
-            barmode='group',
-            text='Monto',
-            title=f"Comparativo de Asignaciones de Fondos (Bandas [{lower_limit:.0%}, +{upper_limit:.0%}])",
-            template='ggplot2',
-            color_discrete_map=color_map,
-            labels={
-                'Entidad_Federativa': 'Entidad Federativa',
-                'Monto': 'Monto Asignado',
-                'Tipo_Asignacion': 'Tipo de Asignación'
-            },
-            hover_data={
-                'Monto':':,.2f',
-                },
-        )
+    fig_final.update_yaxes(
+        tickprefix="$",
+        tickformat=',.0f',
+        showgrid=True,
+        title_font=dict(size=16, family='Noto Sans', color='#28282b'),
+        tickfont=dict(size=14, family='Noto Sans', color='#4f4f4f'),
+        tickangle=0,
+    )
 
-        # 5. Configuración de Trazas y Layout
-        fig_final.update_traces(
-            textposition='outside',
-            texttemplate='$%{text:,.0f}', # Muestra valores sin decimales, en millones
-            textfont_size=12,
-            opacity=0.9,
-            marker_line_color='black',
-            marker_line_width=0.5,
-        )
+    return fig_final
 
-        fig_final.update_layout(
-            uniformtext_minsize=8, 
-            uniformtext_mode='hide',
-            hovermode="x unified",
-            autosize=True,
-            height=700,
-            xaxis_title='',
-            yaxis_title='Monto asignado',
-            legend_title='Tipo de Monto',
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=.99,
-                xanchor="right",
-                x=1
-            )
-        )
 
-        fig_final.update_xaxes(
-            showgrid=True,
-            tickangle=-60,
-            title_font=dict(size=16, family='Noto Sans', color='#28282b'),
-            tickfont=dict(size=14, family='Noto Sans', color='#4f4f4f'),
-        )
+@grafo.node('resultados', 'lower_limit', 'upper_limit')
+def figura(resultados, lower_limit, upper_limit):
+    # sólo cambian los montos y el título; el estilo viene del esqueleto en caché
+    return cached_figure(
+        comparativo,
+        resultados,
+        [{'y': resultados[col].to_numpy()} for col in SERIES_COMPARATIVO],
+        layout={'title': {'text': f"Comparativo de Asignaciones de Fondos (Bandas [{lower_limit:.0%}, +{upper_limit:.0%}])"}},
+        key=tuple(resultados['Entidad_Federativa']),
+    )
 
-        fig_final.update_yaxes(
-            tickprefix="$",
-            tickformat=',.0f',
-            showgrid=True,
-            title_font=dict(size=16, family='Noto Sans', color='#28282b'),
-            tickfont=dict(size=14, family='Noto Sans', color='#4f4f4f'),
-            tickangle=0,
-        )
 
-        st.plotly_chart(fig_final, use_container_width=True)
+# widget para subir archivos
+uploaded_file = st.file_uploader("", type=UPLOAD_TYPES, )
+# sin archivo subido, el de un enlace ('datos' en la URL)
+archivo, datos_id = shared_dataset(uploaded_file)
+sync_url(ENLACE, datos_id)
+st.sidebar.caption('La URL de esta página guarda el escenario actual; compártala para que otros lo vean.')
+
+if archivo is None:
+    # sin archivo no hay simulación ni precálculo vigentes
+    session_job(st.session_state, 'simulacion_fasp', None)
+    session_job(st.session_state, 'precalculo_fasp', None)
+    st.text('Sube el archivo con las variables para la asignación del fondo en formato csv, parquet o arrow.')
+else:
+    # el archivo se valida antes de cualquier cálculo; uno inválido no arranca el precálculo
+    memoria = st.session_state.setdefault('grafo_fasp', {})
+    reporte = grafo.run(memoria, ['validacion'], archivo=archivo)[0]['validacion']
+    if not reporte.ok:
+        session_job(st.session_state, 'simulacion_fasp', None)
+        session_job(st.session_state, 'precalculo_fasp', None)
+        st.error(reporte.message())
+        st.stop()
+    if reporte.avisos:
+        st.warning(reporte.message(avisos=True))
+
+    # tab layout: sólo se ejecuta la pestaña abierta
+    tab1, tab2, tab3 = st.tabs(['1.Indicadores','2.Asignación','3.Nota técnica',], key='tabs_fasp', on_change='rerun')
+
+    # nodos que necesita la pestaña abierta; los demás se calculan hasta que se abra su pestaña
+    targets = []
+    if tab1.open:
+        targets += ['indicadores']
+    if tab2.open:
+        targets += ['tabla_entrada', 'tabla_inicial', 'resultados', 'tabla_final', 'figura', 'matriz']
+    if tab3.open:
+        targets += ['resultados']
+
+    # precálculo en segundo plano, uno por archivo: otro archivo cancela el anterior
+    entradas = dict(
+        archivo=archivo, weights=weights, presupuesto=presupuesto,
+        lower_limit=lower_limit, upper_limit=upper_limit,
+    )
+    clave_previa = content_key((
+        datos_id, weights, presupuesto, lower_limit, upper_limit, SIMULACION_PREVIA, dispersion,
+    ))
+    precalculo = session_job(
+        st.session_state, 'precalculo_fasp', datos_id,
+        start=lambda: precalculo_fasp(entradas, clave_previa, st.context.ip_address or 'local'),
+    )
+    previa = None
+    if precalculo.done():
+        # lo que el precálculo ya tiene pasa a la memoria de la sesión; si los parámetros
+        # cambiaron desde entonces, las llaves no coinciden y el grafo lo recalcula
+        for nodo, valor in precalculo.valores.items():
+            if nodo in grafo.nodes:
+                memoria.setdefault(nodo, valor)
+        # la vista previa de la simulación sólo vale con los parámetros con que se lanzó
+        clave, trabajo = precalculo.valores.get('simulacion_previa', (None, None))
+        if clave == clave_previa and trabajo.done() and not trabajo.cancelled:
+            previa = trabajo
+
+    try:
+        calculo, bitacora = grafo.run(memoria, targets, **entradas)
+    except FileNotFoundError:
+        st.error("Archivo 'fasp_indicadores.csv' no encontrado.")
+        st.stop()
+    except DatosInvalidos as error:
+        st.error(f'El archivo no tiene las columnas o los tipos esperados: {error}')
+        st.stop()
+    except BandasInfactibles as error:
+        # el fondo no cabe en las bandas del panel: no hay asignación que las cumpla
+        st.error(f'{error} Ajuste las bandas de control en el panel lateral.')
+        st.stop()
 
-        st.caption('''Figura 1. Comparativo de la Asignación 2025 (referencia), la Asignación 2026 Inicial (sin bandas) y
-        la Asignación 2026 Final Ajustada.''')
+    # la simulación corre fuera de la sesión, en un pool que se arranca (una vez por proceso)
+    # al subir el archivo; si cambió algún parámetro desde que se lanzó, se cancela en este
+    # rerun (ver asignacion.trabajos)
+    worker_pool()
+    clave_simulacion = content_key((
+        datos_id, weights, presupuesto, lower_limit, upper_limit, simulaciones, dispersion,
+    ))
+    simulacion = session_job(st.session_state, 'simulacion_fasp', clave_simulacion)
 
-        st.markdown('''
-        ---
-        *© Dirección General de Planeación*   
-        *Elaborado por Jesús López Monroy*   
-        ''')
 
+    if tab1.open:
+        with tab1:
 
-    with tab3:
+            # header
+            st.subheader('Indicadores Utilizados para la Asignación')
+            st.markdown('''
+            <div style="text-align: justify;">
+        
+            El **Fondo de Aportaciones para la Seguridad Pública** (FASP) es un fondo presupuestal previsto en
+            la *Ley de Coordinación Fiscal* a través del cual se transfieren recursos a las entidades federativas
+            para dar cumplimiento a estrategias nacionales en materia de seguridad pública.
+        
+            En la siguiente tabla, se listan los indicadores utilizados para la asignación de este fondo.
+        
+            </div>''',
+             unsafe_allow_html=True)
 
-        st.header('Sábana de Datos')
-        st.markdown("""
-        En este apartado, se muestra la sábana de datos con todos las fases del cálculo de asignación de fondos,
-        incluyendo las bandas y reasignación del remanente.
-        """)
+            st.html(calculo['indicadores'])
+            st.caption('Tabla 1. Indicadores utilizados para la asignación de fondos y ponderaciones predeterminadas.')
+            st.markdown('Para mayor información sobre el fondo, vísite la página [Fondo de Aportaciones para la Seguridad Pública (FASP) 2025](https://www.gob.mx/sesnsp/acciones-y-programas/fondo-de-aportaciones-para-la-seguridad-publica-fasp)')
+        
+            st.markdown('''
+            ---
+            *© Dirección General de Planeación*   
+            *Elaborado por Jesús López Monroy*   
+            ''')
+
+
+    if tab2.open:
+        with tab2:
+            #st.header('2. Cálculo de Asignación')
+            st.markdown(f'''
+                ## Escenarios de Asignación
+                #### Fondo: *{presupuesto_formateado}*
+            ''')
+            st.subheader("Datos de Entrada")
+
+            st.dataframe(**calculo['tabla_entrada'], use_container_width=True)
+            st.caption('Tabla 2. Variables utilizadas en el modelo para la asignación del fondo.')
+
+
+            st.subheader("Resultados Iniciales (sin bandas)")
+
+            st.dataframe(**calculo['tabla_inicial'], width=600)
+            st.caption('Tabla 3. Resultados iniciales sin bandas.')
+
+
+            # --- Start of the iterative rebalance logic ---
+            st.subheader('Rebalanceo de remanente (*iteración*)')
+            st.markdown(f'''
+            Se estableció una banda de control de **{lower_limit:.0%}** (inferior) y **{upper_limit:.0%}** (superior) para el importe asignado 2026 en relación
+            al asignado 2025.
+            El proceso de rebalanceo es iterativo hasta que **todas** las Entidades Federativas se encuentren dentro de este rango.
+            ''')
+
+            st.success(f"Proceso de rebalanceo completado (*{calculo['rebalanceo'][1]} iteraciones*).")
+
+            # Display Final Adjusted Allocation Table (Table 5)
+            st.markdown('#### Asignación Ajustada Final')
+            st.dataframe(**calculo['tabla_final'], hide_index=True, width=750)
+            st.caption('Tabla 4. asignación ajustada final dentro de la banda especificada.')
+
+
+            # --- 2.5 Visualización de Asignación Ajustada Final ---
+            st.subheader('Comparativo de Asignaciones')
+            st.markdown('''
+            En la siguiente gráfica se observa la diferencia entre el monto de referencia (2025), el monto inicial calculado por el modelo (2026 Inicial) y el monto final ajustado por las bandas de control (2026 Final Ajustada).
+            ''')
+
+            st.plotly_chart(calculo['figura'], use_container_width=True)
+
+            st.caption('''Figura 1. Comparativo de la Asignación 2025 (referencia), la Asignación 2026 Inicial (sin bandas) y
+            la Asignación 2026 Final Ajustada.''')
+
+            # --- 2.6 Sensibilidad a los ponderadores ---
+            st.subheader('Sensibilidad a los Ponderadores')
+            st.markdown(f'''
+            Se simulan **{simulaciones:,}** escenarios en los que cada ponderador varía alrededor del valor del panel
+            (variación de **{dispersion:.0%}**, conservando la suma) y se aplica el mismo rebalanceo por bandas.
+            ''')
+
+            if simulacion is None and st.button('Ejecutar simulación', key='simular_fasp'):
+                try:
+                    simulacion = session_job(
+                        st.session_state, 'simulacion_fasp', clave_simulacion,
+                        start=lambda: simulacion_fasp(calculo['datos'], calculo['matriz'], st.context.ip_address or 'local'),
+                    )
+                except ColaLlena as aviso:
+                    st.warning(str(aviso))
+
+            if simulacion is not None and not simulacion.done():
+                # sólo este fragmento vuelve a correr mientras avanza la simulación
+                @st.fragment(run_every=0.5)
+                def avance_simulacion():
+                    if simulacion.done():
+                        st.rerun()
+                    if simulacion.started:
+                        st.progress(simulacion.progress, text=f'Simulando: {simulacion.completed} de {len(simulacion)} bloques')
+                    else:
+                        st.progress(0.0, text=f'En cola: {planificador.ahead(simulacion)} bloques de otros trabajos antes que éste')
+                    if st.button('Cancelar', key='cancelar_simulacion_fasp'):
+                        session_job(st.session_state, 'simulacion_fasp', None)
+                        st.rerun()
+
+                avance_simulacion()
+
+            elif simulacion is not None or previa is not None:
+                # sin simulación pedida, la vista previa del precálculo
+                resumen = sensitivity_summary(
+                    (simulacion if simulacion is not None else previa).result(),
+                    calculo['datos']['Asignacion_2025'], lower_limit, upper_limit,
+                    calculo['datos']['Entidad_Federativa'],
+                )
+                st.dataframe(
+                    **formatted_table(
+                        resumen,
+                        {
+                            'Media': '${:,.2f}',
+                            'P05': '${:,.2f}',
+                            'P95': '${:,.2f}',
+                            'Topado_inferior': '{:.2%}',
+                            'Topado_superior': '{:.2%}',
+                        },
+                        index=False,
+                    ),
+                    hide_index=True,
+                )
+                st.caption('''Tabla 5. Asignación ajustada simulada por Entidad Federativa: media, percentiles 5 y 95 y
+                fracción de escenarios topados en la banda inferior y superior.''')
+                if simulacion is None:
+                    st.caption(f'''Vista previa con {SIMULACION_PREVIA:,} escenarios; **Ejecutar simulación** corre los
+                    {simulaciones:,} del panel.''')
+
+            st.markdown('''
+            ---
+            *© Dirección General de Planeación*   
+            *Elaborado por Jesús López Monroy*   
+            ''')
+
+
+    if tab3.open:
+        with tab3:
+
+            st.header('Sábana de Datos')
+            st.markdown("""
+            En este apartado, se muestra la sábana de datos con todos las fases del cálculo de asignación de fondos,
+            incluyendo las bandas y reasignación del remanente.
+            """)
+
+            # la sábana (proporción y monto de cada indicador) se arma sólo con la pestaña
+            # abierta y no queda en la memoria de la sesión
+            st.dataframe(
+                pd.concat([
+                    calculate_index(calculo['datos'], weights, presupuesto),
+                    calculo['resultados'][['Asignacion_2026', 'Var%', 'Asignacion_ajustada_centavos',
+                                           'Asignacion_ajustada', 'Var%_ajustada']],
+                ], axis=1),
+                use_container_width=True,
+            )
 
-        st.dataframe(df_results, use_container_width=True)
+            # nodos del grafo de cálculo que corrieron en este rerun
+            with st.expander('Grafo de cálculo'):
+                st.dataframe(
+                    pd.DataFrame(bitacora), hide_index=True, use_container_width=True,
+                    column_config={'Tiempo (ms)': st.column_config.NumberColumn(format='%.1f')},
+                )
+                st.caption("'calculado': el nodo corrió en este rerun; 'memoria': sus entradas no cambiaron y se reutilizó el resultado anterior; 'disco': se leyó del caché persistente (p. ej. después de un reinicio).")
+                disco = disk_cache.stats()
+                st.caption(
+                    f"Caché en disco: {disco['aciertos']:,} aciertos, {disco['fallos']:,} fallos, "
+                    f"{disco['entradas']:,} entradas ({disco['bytes'] / 2**20:,.1f} MB)"
+                    + ('' if disco['activo'] else ' — desactivado')
+                )
 
-        st.markdown('Por otra parte, se anexa hoja de cálculo (Excel) con el procedimiento aplicado para la asignación final.')
+            # --- biblioteca de escenarios (ver asignacion.biblioteca) ---
+            st.header('Biblioteca de Escenarios')
+            st.markdown('''
+            <div style="text-align: justify;">
+            Guarde el escenario actual (ponderadores, bandas, presupuesto y resultados) para consultarlo después
+            y compárelo con otros escenarios guardados sin volver a calcularlos.
+            </div>
+            ''', unsafe_allow_html=True)
+            try:
+                with st.form('guardar_escenario_fasp', clear_on_submit=True):
+                    nombre = st.text_input('Nombre del escenario')
+                    etiquetas = st.text_input('Etiquetas (separadas por comas)', placeholder='oficial, propuesta')
+                    if st.form_submit_button('Guardar escenario actual') and nombre.strip():
+                        resultados = calculo['resultados']
+                        escenario_id = biblioteca.save(
+                            nombre.strip(), 'FASP', datos_id,
+                            resultados['Entidad_Federativa'], weights, presupuesto, lower_limit, upper_limit,
+                            to_centavos(resultados['Asignacion_2025']), resultados['Asignacion_Bruta_centavos'],
+                            resultados['Asignacion_ajustada_centavos'], etiquetas.split(','),
+                        )
+                        st.success(f'Escenario {escenario_id} guardado.')
+
+                col_etiquetas, col_fechas = st.columns(2)
+                filtro = col_etiquetas.multiselect('Etiquetas', biblioteca.tags('FASP'), key='etiquetas_biblioteca_fasp')
+                fechas = col_fechas.date_input('Guardados entre', value=[], key='fechas_biblioteca_fasp')
+                desde, hasta = (fechas[0], fechas[1] + pd.Timedelta(days=1)) if len(fechas) == 2 else (None, None)
+                catalogo = biblioteca.search('FASP', filtro, desde, hasta)
+
+                seleccion = st.dataframe(
+                    catalogo, hide_index=True, on_select='rerun', selection_mode='multi-row', key='catalogo_fasp',
+                    column_config={'Presupuesto': st.column_config.NumberColumn(format='dollar')},
+                )
+                elegidos = catalogo['id'].iloc[seleccion.selection.rows].tolist()
+                if len(elegidos) >= 2:
+                    # la base es el primer escenario elegido; todo se calcula con los resultados guardados
+                    comparacion = biblioteca.compare(elegidos)
+                    st.dataframe(
+                        **formatted_table(
+                            comparacion['resumen'],
+                            {
+                                'Total': '${:,.2f}',
+                                'Diferencia_absoluta_total': '${:,.2f}',
+                                'Diferencia_maxima': '${:,.2f}',
+                                'Presupuesto': '${:,.2f}',
+                                'Banda_inferior': '{:.2%}',
+                                'Banda_superior': '{:.2%}',
+                            },
+                            index=False,
+                        ),
+                        hide_index=True,
+                    )
+                    diferencias = comparacion['diferencias']
+                    st.dataframe(**formatted_table(diferencias, {c: '${:,.2f}' for c in diferencias.columns}))
+                    st.caption('Diferencia de la asignación ajustada de cada escenario contra el primero elegido.')
+                    st.dataframe(comparacion['cambio_lugar'])
+                    st.caption('Cambio de lugar de cada Entidad Federativa (positivo: sube respecto al primero elegido).')
+                elif len(catalogo):
+                    st.caption('Seleccione dos o más escenarios para compararlos.')
+            except sqlite3.Error as error:
+                st.warning(f'La biblioteca de escenarios no está disponible: {error}')
+
+            st.markdown('Por otra parte, se anexa hoja de cálculo (Excel) con el procedimiento aplicado para la asignación final: una hoja por etapa del cálculo, incluidas las iteraciones de las bandas.')
         
-        st.markdown("[Hoja de cálculo](https://sspcgob-my.sharepoint.com/:x:/g/personal/jesus_lopez_sspc_gob_mx/EVMYdkSmoR5FqM3VSG85RBEBCE3Lk4JFgfWOXZG2EuwS6Q?e=AOY1iJ)")
+            # el libro se escribe hasta que se da clic (ver asignacion.sabana)
+            st.download_button(
+                label='Hoja de cálculo (xlsx)',
+                data=lambda: workbook_bytes('FASP', calculo['datos'], weights, presupuesto, lower_limit, upper_limit),
+                file_name='fasp_sabana_de_datos.xlsx',
+                mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                on_click='ignore',
+            )
+
+            # una ficha HTML por Entidad Federativa, también hasta que se da clic (ver asignacion.reportes)
+            st.download_button(
+                label='Fichas por Entidad Federativa (zip)',
+                data=lambda: reports_zip('FASP', calculo['datos'], weights, presupuesto, lower_limit, upper_limit),
+                file_name='fasp_fichas_por_entidad.zip',
+                mime='application/zip',
+                on_click='ignore',
+            )
         
-        st.markdown('''
-        ---
-        *© Dirección General de Planeación*   
-        *Elaborado por Jesús López Monroy*   
-        ''')
-    
\ No newline at end of file
+            st.markdown('''
+            ---
+            *© Dirección General de Planeación*   
+            *Elaborado por Jesús López Monroy*   
+            ''')
+
+
+# panel y registro de la medición (sólo con ASIGNACION_MEDICION=1)
+medida.finish(sesion=st.session_state.get('grafo_fasp'))
@@ -2,15 +2,38 @@
 import streamlit as st
 import numpy as np
 import pandas as pd
-import polars as pl
-import plotly.express as px
-import plotly.graph_objects as go
-from PIL import Image
-from great_tables import GT, md
 import os
-import io
-from dotenv import load_dotenv
-load_dotenv('.env')
+import sys
+from pathlib import Path
+
+# paquete compartido 'asignacion' en la raíz del repositorio
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+# plotly express y great_tables se importan hasta que haga falta armar una gráfica o una
+# tabla que no está en caché; .env, logo e indicadores se leen una vez por proceso
+# (ver asignacion.arranque)
+from asignacion.arranque import lazy_import, load_env, cached_logo, cached_catalog
+px = lazy_import('plotly.express')
+GT, md = lazy_import('great_tables', 'GT', 'md')
+workbook_bytes = lazy_import('asignacion.sabana', 'workbook_bytes')
+reports_zip = lazy_import('asignacion.reportes', 'reports_zip')
+load_env('.env')
+from asignacion import FOFISP_VARIABLES, shifted_proportion_normalize, calculate_index, allocation_engine, to_pesos
+from asignacion.tablas import gt_html, formatted_table
+from asignacion.graficas import cached_figure
+from asignacion.grafo import code_key
+from asignacion.disco import disk_cache
+from asignacion.centavos import BandasInfactibles
+from asignacion.enlaces import restore_widgets, sync_url, shared_dataset
+from asignacion.medicion import medicion, span
+from asignacion.formatos import UPLOAD_TYPES
+from asignacion.validacion import validate_dataset
+
+# normalización, índice y rebalanceo con pandas o con polars (ASIGNACION_MOTOR, ver
+# asignacion.columnar); los dos motores dan los mismos centavos
+motor = allocation_engine()
+
+# medición opcional de etapas y cachés (ASIGNACION_MEDICION=1, ver asignacion.medicion)
+medida = medicion('FOFISP')
 
 
 # --- app settings ---
@@ -26,7 +49,7 @@ hide_default_format = """
     """
 
 # load icon image
-im = Image.open('images/logo.png')
+im = cached_logo('images/logo.png')
 
 # page layout config and add image
 st.set_page_config(layout="wide", page_title="FOFISP App", page_icon=im)
@@ -84,6 +107,22 @@ st.markdown("""
     """, unsafe_allow_html=True)
 
 
+# --- enlaces ---
+# parámetros de la URL -> key del widget: la URL guarda el escenario y se puede compartir
+# (ver asignacion.enlaces)
+ENLACE = {
+    'presupuesto': 'Presupuesto estimado',
+    'bs': 'Limite superior',
+    'bi': 'Limite inferior',
+    'Poblacion': 'Población',
+    'Tasa_policial': 'Tasa policial',
+    'Var_incidencia_del': 'Variación incidencia delictiva',
+    'Academias': 'Academias',
+}
+# los ponderadores van de 0 a 1 (ver create_weight_input); el fondo y las bandas no tienen límites
+restore_widgets(ENLACE, 'fofisp', {param: (0.0, 1.0) for param in ENLACE if param not in ('presupuesto', 'bs', 'bi')})
+
+
 # --- sidebar ---
 # sidebar image and text
 st.sidebar.image('images/sesnsp.png')
@@ -157,417 +196,383 @@ st.sidebar.markdown(f'**Suma de ponderadores:** {formatted_sum}')
 
 # upload final variables dataset
 # widget para subir archivos
-uploaded_file = st.file_uploader("", type=['csv'], )
-
-if uploaded_file is None:
-    st.text('Sube el archivo con las variables para la asignación del fondo en formato csv.')
+uploaded_file = st.file_uploader("", type=UPLOAD_TYPES, )
+# sin archivo subido, el de un enlace ('datos' en la URL)
+archivo, datos_id = shared_dataset(uploaded_file)
+sync_url(ENLACE, datos_id)
+st.sidebar.caption('La URL de esta página guarda el escenario actual; compártala para que otros lo vean.')
+
+if archivo is None:
+    st.text('Sube el archivo con las variables para la asignación del fondo en formato csv, parquet o arrow.')
     st.stop()
 else:
-    data = pd.read_csv(io.BytesIO(uploaded_file.getvalue()))    
+    # el archivo se valida antes de cualquier cálculo: esquema, Entidades y rangos en una
+    # pasada (ver asignacion.validacion); el reporte queda en el caché en disco por archivo
+    with span('datos'):
+        reporte = disk_cache.get_or_compute(
+            ('FOFISP', 'validacion', code_key(validate_dataset), datos_id),
+            lambda: validate_dataset(archivo, 'FOFISP'),
+        )
+    if not reporte.ok:
+        st.error(reporte.message())
+        st.stop()
+    if reporte.avisos:
+        st.warning(reporte.message(avisos=True))
 
     # --- LOAD INDICADORES TABLE (Placeholder) ---
     try:
-        indicadores_fofisp = pd.read_csv('fofisp_indicadores.csv')
+        indicadores_fofisp = cached_catalog('fofisp_indicadores.csv')
     except FileNotFoundError:
         st.error("Archivo 'fofisp_indicadores.csv' no encontrado.")
         st.stop()
 
     # tabla de indicadores
-    indicadores_fofisp = pd.read_csv('fofisp_indicadores.csv')
     indicadores_fofisp['Categoría'] = indicadores_fofisp['Categoría'].fillna('')
     indicadores_fofisp['Ponderación_categoría'] = indicadores_fofisp['Ponderación_categoría'].fillna(0)
 
     # Format GT table (rest of the GT configuration is the same)
-    indicadores = (
-        GT(indicadores_fofisp)
-        .tab_stub()
-        .tab_header(
-            title=md('Fondo para el Fortalecimiento de las Instituciones de Seguridad Pública (FOFISP)'),
-            subtitle=md('## Indicadores de Distribución')
+    def formato_indicadores(indicadores_fofisp):
+        return (
+            GT(indicadores_fofisp)
+            .tab_stub()
+            .tab_header(
+                title=md('Fondo para el Fortalecimiento de las Instituciones de Seguridad Pública (FOFISP)'),
+                subtitle=md('## Indicadores de Distribución')
+                )
+            .fmt_percent(columns=['Ponderación_categoría','Ponderación_subcategoría','Ponderación_indicador'], decimals=1).sub_zero(zero_text=md(''))
+            .cols_width(cases={
+                    "Categoría": "20%",
+                    "Ponderación_categoría": "20%",
+                    "Indicador": "60%",
+                    "Ponderación_indicador": "20%",
+                    })
+            .cols_label(
+                Categoría = md('**Categoría**'),
+                Ponderación_categoría = md('**Ponderación categoría**'),
+                Indicador = md('**Indicador**'),
+                Ponderación_indicador = md('**Ponderación indicador**'),
+            )
+            .cols_align(align='center', columns=['Ponderación_categoría','Ponderación_indicador'])
+            .tab_options(
+                container_width="100%",
+                container_height="100%",
+                heading_background_color="#691c32",
+                column_labels_background_color="#ddc9a3",
+                source_notes_background_color="#ddc9a3",
+                row_striping_include_table_body=True,
+                row_striping_background_color='#f8f8f8',
+            )
+            .tab_source_note(
+                source_note=md("Fuente: *Secretariado Ejecutivo del Sistema Nacional de Seguridad Pública*")
             )
-        .fmt_percent(columns=['Ponderación_categoría','Ponderación_subcategoría','Ponderación_indicador'], decimals=1).sub_zero(zero_text=md(''))
-        .cols_width(cases={
-                "Categoría": "20%",
-                "Ponderación_categoría": "20%",
-                "Indicador": "60%",
-                "Ponderación_indicador": "20%",
-                })
-        .cols_label(
-            Categoría = md('**Categoría**'),
-            Ponderación_categoría = md('**Ponderación categoría**'),
-            Indicador = md('**Indicador**'),
-            Ponderación_indicador = md('**Ponderación indicador**'),
-        )
-        .cols_align(align='center', columns=['Ponderación_categoría','Ponderación_indicador'])
-        .tab_options(
-            container_width="100%",
-            container_height="100%",
-            heading_background_color="#691c32",
-            column_labels_background_color="#ddc9a3",
-            source_notes_background_color="#ddc9a3",
-            row_striping_include_table_body=True,
-            row_striping_background_color='#f8f8f8',
-        )
-        .tab_source_note(
-            source_note=md("Fuente: *Secretariado Ejecutivo del Sistema Nacional de Seguridad Pública*")
         )
-    )
 
+    # HTML desde el caché de tablas del proceso (compartido entre sesiones)
+    with span('indicadores'):
+        indicadores = gt_html(indicadores_fofisp, formato_indicadores)
 
-# tab layout
-tab1, tab2, tab3 = st.tabs(['1.Indicadores', '2.Asignación', '3.Nota técnica'])
 
-# --- TAB 1: INDICADORES ---
-with tab1:
-    st.subheader('Indicadores Utilizados para la Asignación')
-    st.markdown('''
-    <div style="text-align: justify;">
-    El <b>Fondo para el Fortalecimiento de las Instituciones de Seguridad Pública</b> (FOFISP) transfiere recursos a las entidades federativas 
-    para atender las políticas de seguridad pública.
-    En la siguiente tabla, se listan los indicadores utilizados.
-    </div>''', unsafe_allow_html=True)
-
-    st.html(indicadores)    
-    st.caption('Tabla 1. Indicadores utilizados para la asignación de fondos y ponderaciones predeterminadas.')
-    st.markdown('Para mayor información sobre el fondo, vísite la página [Fondo para el Fortalecimiento de las Instituciones de Seguridad Pública (FOFISP) 2025](https://www.gob.mx/sesnsp/acciones-y-programas/fondo-de-aportaciones-para-la-seguridad-publica-fasp)')
-    st.markdown('''
-        ---
-        *© Dirección General de Planeación*   
-        *Elaborado por Jesús López Monroy*   
-    ''')
-
-
-# --- TAB 2: ASIGNACIÓN ---
-with tab2:
-    st.markdown(f'''
-        ## Escenarios de Asignación
-        #### Fondo: *{presupuesto_formateado}*
-    ''')
-    st.subheader("Datos de Entrada")
-
-    # --- Funciones de Cálculo del Índice (Direct Proportion Normalization) ---
-    def direct_proportion_normalize(series, direction='positive'):
-        """
-        Normaliza una serie de datos.
-        - 'positive' (Alto=Bueno): Proporción directa.
-        - 'negative' (Alto=Malo): Proporción inversa (1/X) suavizada.
-        """
-        if not isinstance(series, pd.Series):
-            series = pd.Series(series)
-            
-        # Corrimiento (Shift) para manejar valores no positivos en la proporción inversa
-        # R = shift factor to avoid division by zero or negative values
-        R = series.abs().max() * 0.01 + 1e-6 # Simple shift factor
-        
-        # 1. Base Series (Always positive for calculation)
-        shifted_series = series + R
-        
-        # 2. Inversion for negative direction
-        if direction == 'negative':
-            normalized_base = 1 / shifted_series
-        else:
-            normalized_base = shifted_series
-
-        # 3. Normalization to sum
-        total_sum = normalized_base.sum()
-        
-        if total_sum == 0:
-            return pd.Series(1.0 / len(normalized_base), index=normalized_base.index)
-        
-        return normalized_base / total_sum
-        
-
-    def calculate_index(df, weights, presupuesto):
-        """
-        Calcula la Asignación de Fondo Ponderado
-        """
-        contributions = {}
-        df['Entidad_Federativa'] = df['Entidad_Federativa'].astype(str) # Ensure string for merge/display
-
-        # Map the 4 variables to their calculation direction
-        variable_map = {
-            'Población': 'positive', 
-            'Var_incidencia_del': 'negative', 
-            'Tasa_policial': 'positive', 
-            'Academias': 'positive',
-        }
-        
-        # --- Normalization and Weighted Monetary Contribution (for 85% of the fund) ---
-        for var_name, direction in variable_map.items():
-            # 1. Normalization
-            df[f'{var_name}_prop'] = direct_proportion_normalize(df[var_name], direction=direction)
-            
-            # 2. Calculate the Weighted Monetary Contribution
-            contribution_col_name = f'Monto_{var_name}'
-            contributions[contribution_col_name] = df[f'{var_name}_prop'] * weights[var_name] * presupuesto
-
-        
-        # --- 3. Calculation of the Gross Allocation (Asignacion_Bruta) ---
-        # Sum all contributions (4 variables + Base)
-        df['Asignacion_Bruta'] = sum(contributions.values())
-        
-        # Combine all contributions (Monto_X) with the main DF
-        df = pd.concat([df, pd.DataFrame(contributions)], axis=1)
-        
-        # Calculate the proportional share (sums to 1.0)
-        df['Reparto'] = df['Asignacion_Bruta'] / df['Asignacion_Bruta'].sum()
-        
-        return df
-
-    # --- DATA DISPLAY (INPUT) ---
-    fofisp_datos_entrada = data.copy()
+# --- CÁLCULO ---
+# se calcula antes de las pestañas: la sábana de datos no depende de que se abra la de asignación
+def calculo_fofisp(datos, weights, presupuesto, lower_limit, upper_limit):
+    # los datos ya validados; la copia deja intacto el reporte del caché
+    fofisp_datos_entrada = datos.copy()
     fofisp_datos_entrada.rename(columns={'Entidad': 'Entidad_Federativa'}, inplace=True)
     fofisp_datos_entrada.index = pd.RangeIndex(start=1, stop=len(fofisp_datos_entrada)+1, step=1)
-    
-    # Apply formatting for display purposes (assuming Var_incidencia_del, Tasa_policial, Academias are ratios/percentages or simple numbers)
-    fofisp_datos_entrada_display = (
-        fofisp_datos_entrada[['Entidad_Federativa', 'Población', 'Var_incidencia_del', 'Tasa_policial', 'Academias', 'Asignacion_2025']]
-        .style.format({
-            'Población': '{:,.0f}',
-            'Var_incidencia_del':'{:.2f}', # Assumed a number/ratio
-            'Tasa_policial':'{:.2f}',
-            'Academias':'{:.0f}', # Assumed a count/integer
-            'Asignacion_2025': '${:,.2f}',
-            })
-        )
-
-    st.dataframe(fofisp_datos_entrada_display, use_container_width=True)
-    st.caption('Tabla 2. Variables utilizadas en el modelo para la asignación del fondo.')
-
-
-    # --- Calculation and Visualization ---
-    df_results = calculate_index(fofisp_datos_entrada, weights, presupuesto)
-    
-    # --- RESULTS (WITHOUT BANDS) ---
-    st.subheader("Resultados Iniciales (sin bandas)")
-    df_results['Asignacion_2026'] = df_results['Asignacion_Bruta']
-    df_results['Var%'] = df_results['Asignacion_2026'] / df_results['Asignacion_2025'] - 1
 
-    df_end = (
-        df_results[['Entidad_Federativa','Asignacion_2026','Asignacion_2025','Var%']]
-        .style
-        .format({
-            'Asignacion_2026': '${:,.2f}',
-            'Asignacion_2025': '${:,.2f}',
-            'Var%': '{:.2%}',
-            })
+    fofisp_datos_entrada['Entidad_Federativa'] = fofisp_datos_entrada['Entidad_Federativa'].astype(str) # Ensure string for merge/display
+    # sólo las columnas que usan las tablas, la gráfica y el rebalanceo; la sábana con la
+    # proporción y el monto de cada indicador se arma en su pestaña (ver `calculate_index`)
+    with span('indice'):
+        props = motor.normalized_matrix(fofisp_datos_entrada, FOFISP_VARIABLES, shifted_proportion_normalize)
+        bruta, reparto = motor.index_allocation(props, weights, presupuesto, variable_map=FOFISP_VARIABLES)
+    df_results = fofisp_datos_entrada[['Entidad_Federativa', 'Asignacion_2025']].assign(
+        Asignacion_Bruta_centavos=bruta,
+        Reparto=reparto,
+        Asignacion_2026=to_pesos(bruta),
     )
+    df_results['Var%'] = df_results['Asignacion_2026'] / df_results['Asignacion_2025'] - 1
 
-    st.dataframe(df_end, width=600)
-    st.caption('Tabla 3. Resultados iniciales sin bandas.')
-
+    # rebalanceo en centavos enteros: las cotas de la banda son enteras y el remanente
+    # se reparte por residuo mayor hasta llegar a cero exacto; si el fondo no cabe en las
+    # bandas, lanza BandasInfactibles antes de iterar
+    with span('rebalanceo'):
+        asignacion_ajustada, current_iteration = motor.rebalance(df_results, lower_limit, upper_limit)
 
-    # --- ITERATIVE REBALANCE LOGIC (Bands) ---
-    st.subheader('Rebalanceo de remanente (*iteración*)')
-    st.markdown(f'''
-    Se estableció una banda de control de **{lower_limit:.0%}** (inferior) y **+{upper_limit:.0%}** (superior) para el importe asignado 2026 en relación 
-    al asignado 2025.
-    El proceso de rebalanceo es iterativo hasta que **todas** las Entidades Federativas se encuentren dentro de este rango.
-    ''')
+    df_results['Asignacion_ajustada_centavos'] = asignacion_ajustada
+    df_results['Asignacion_ajustada'] = to_pesos(asignacion_ajustada)
+    df_results['Var%_ajustada'] = (df_results['Asignacion_ajustada'] - df_results['Asignacion_2025']) / df_results['Asignacion_2025']
+    return fofisp_datos_entrada, df_results, current_iteration
+
+# un escenario que alguien ya abrió (p. ej. desde un enlace) sale del caché en disco
+# compartido; si varias sesiones lo piden a la vez, se calcula una sola vez
+try:
+    fofisp_datos_entrada, df_results, current_iteration = disk_cache.get_or_compute(
+        ('FOFISP', code_key(calculo_fofisp), datos_id, weights, presupuesto, lower_limit, upper_limit),
+        lambda: calculo_fofisp(reporte.datos, weights, presupuesto, lower_limit, upper_limit),
+    )
+except BandasInfactibles as error:
+    # el fondo no cabe en las bandas del panel: no hay asignación que las cumpla
+    st.error(f'{error} Ajuste las bandas de control en el panel lateral.')
+    st.stop()
 
-    # Initial setup before the loop
-    df_iterative = df_results.copy()
-    
-    df_iterative['Asignacion_Iterativa'] = df_iterative['Asignacion_Bruta']
-    df_iterative['Asignacion_Final'] = df_iterative['Asignacion_Bruta']
 
-    # Calculate Band Limits (Min and Max)
-    df_iterative['Min'] = df_iterative['Asignacion_2025'] * (1 + lower_limit)
-    df_iterative['Max'] = df_iterative['Asignacion_2025'] * (1 + upper_limit)
+# tab layout: sólo se ejecuta la pestaña abierta
+tab1, tab2, tab3 = st.tabs(['1.Indicadores', '2.Asignación', '3.Nota técnica'], key='tabs_fofisp', on_change='rerun')
 
-    # Iteration Control
-    max_iterations = 20
-    current_iteration = 0
-    remanente = 1.0
-    total_remanente_acumulado = 0.0
+# --- TAB 1: INDICADORES ---
+if tab1.open:
+    with tab1:
+        st.subheader('Indicadores Utilizados para la Asignación')
+        st.markdown('''
+        <div style="text-align: justify;">
+        El <b>Fondo para el Fortalecimiento de las Instituciones de Seguridad Pública</b> (FOFISP) transfiere recursos a las entidades federativas 
+        para atender las políticas de seguridad pública.
+        En la siguiente tabla, se listan los indicadores utilizados.
+        </div>''', unsafe_allow_html=True)
+
+        st.html(indicadores)    
+        st.caption('Tabla 1. Indicadores utilizados para la asignación de fondos y ponderaciones predeterminadas.')
+        st.markdown('Para mayor información sobre el fondo, vísite la página [Fondo para el Fortalecimiento de las Instituciones de Seguridad Pública (FOFISP) 2025](https://www.gob.mx/sesnsp/acciones-y-programas/fondo-de-aportaciones-para-la-seguridad-publica-fasp)')
+        st.markdown('''
+            ---
+            *© Dirección General de Planeación*   
+            *Elaborado por Jesús López Monroy*   
+        ''')
 
-    df_iterative['Base_Reparto_Original'] = df_iterative['Reparto']
 
-    # --- ITERATIVE REALLOCATION LOOP ---
-    while abs(remanente) > 0.01 and current_iteration < max_iterations:
-        
-        current_iteration += 1
-        
-        # 1. Calculate Superavit and Deficit from the current 'Asignacion_Iterativa'   
-        df_iterative['Superavit'] = np.where(df_iterative['Asignacion_Iterativa'] > df_iterative['Max'],
-                                             df_iterative['Asignacion_Iterativa'] - df_iterative['Max'],
-                                             0)
-        df_iterative['Deficit'] = np.where(df_iterative['Asignacion_Iterativa'] < df_iterative['Min'],
-                                             df_iterative['Min'] - df_iterative['Asignacion_Iterativa'],
-                                             0)
-
-        # 2. Calculate the Net Remanente (Pooled Funds - Deficit Needed)
-        total_superavit = df_iterative['Superavit'].sum()
-        total_deficit = df_iterative['Deficit'].sum()
-        remanente = total_superavit - total_deficit
-        
-        if abs(remanente) < 0.01:
-            break
-            
-        total_remanente_acumulado += remanente
+# --- TAB 2: ASIGNACIÓN ---
+if tab2.open:
+    with tab2:
+        st.markdown(f'''
+            ## Escenarios de Asignación
+            #### Fondo: *{presupuesto_formateado}*
+        ''')
+        st.subheader("Datos de Entrada")
+
+        # Apply formatting for display purposes (assuming Var_incidencia_del, Tasa_policial, Academias are ratios/percentages or simple numbers)
+        with span('tabla_entrada'):
+            fofisp_datos_entrada_display = formatted_table(
+                fofisp_datos_entrada[['Entidad_Federativa', 'Población', 'Var_incidencia_del', 'Tasa_policial', 'Academias', 'Asignacion_2025']],
+                {
+                    'Población': '{:,.0f}',
+                    'Var_incidencia_del':'{:.2f}', # Assumed a number/ratio
+                    'Tasa_policial':'{:.2f}',
+                    'Academias':'{:.0f}', # Assumed a count/integer
+                    'Asignacion_2025': '${:,.2f}',
+                },
+            )
 
-        # 3. Apply Caps and Floors (Interim Allocation)
-        df_iterative['Reasignacion'] = df_iterative['Asignacion_Iterativa'].clip(lower=df_iterative['Min'], upper=df_iterative['Max'])
+        st.dataframe(**fofisp_datos_entrada_display, use_container_width=True)
+        st.caption('Tabla 2. Variables utilizadas en el modelo para la asignación del fondo.')
 
-        # 4. Identify Eligible States for Remanente Distribution
-        df_iterative['Elegibles'] = np.where(df_iterative['Reasignacion'] < df_iterative['Max'], 1, 0)
-        
-        # New sum of the base proportions, only for the eligible states
-        total_basis_share = df_iterative.loc[df_iterative['Elegibles'] == 1, 'Base_Reparto_Original'].sum()
-
-        # 5. Distribute the Net Remanente among Eligible States
-        if total_basis_share > 0:
-            df_iterative['Reparto_neto'] = np.where(df_iterative['Elegibles'] == 1, 
-                                                    (df_iterative['Base_Reparto_Original'] / total_basis_share) * remanente,
-                                                    0)
-        else:
-            df_iterative['Reparto_neto'] = 0
 
-        # 6. Calculate the New Working Allocation for the next iteration
-        df_iterative['Asignacion_Iterativa'] = df_iterative['Reasignacion'] + df_iterative['Reparto_neto']
-        
-        df_iterative['Asignacion_Final'] = df_iterative['Asignacion_Iterativa']
+        # --- RESULTS (WITHOUT BANDS) ---
+        st.subheader("Resultados Iniciales (sin bandas)")
 
-    # --- END OF ITERATIVE REALLOCATION LOOP ---
-    st.success(f'Proceso de rebalanceo completado (*{current_iteration} iteraciones*).')
+        with span('tabla_inicial'):
+            df_end = formatted_table(
+                df_results[['Entidad_Federativa','Asignacion_2026','Asignacion_2025','Var%']],
+                {
+                    'Asignacion_2026': '${:,.2f}',
+                    'Asignacion_2025': '${:,.2f}',
+                    'Var%': '{:.2%}',
+                },
+            )
 
-    # Final Calculation and Display
-    df_results['Asignacion_ajustada'] = df_iterative['Asignacion_Final']
-    df_results['Var%_ajustada'] = (df_results['Asignacion_ajustada'] - df_results['Asignacion_2025']) / df_results['Asignacion_2025']
+        st.dataframe(**df_end, width=600)
+        st.caption('Tabla 3. Resultados iniciales sin bandas.')
 
-    # Display Final Adjusted Allocation Table (Table 4)
-    df_reasignacion = df_results.copy()
-    df_reasignacion['Var%'] = df_reasignacion['Var%'] * 100
-    df_reasignacion['Var%_ajustada'] = df_reasignacion['Var%_ajustada'] * 100
-
-    df_reasignacion2 = (
-        df_reasignacion[['Entidad_Federativa','Asignacion_2025','Asignacion_2026','Var%','Asignacion_ajustada','Var%_ajustada']]
-        .style.format({
-            'Asignacion_2025': '${:,.2f}',
-            'Asignacion_2026': '${:,.2f}',
-            'Var%':'{:.2f}%',
-            'Asignacion_ajustada': '${:,.2f}',
-            'Var%_ajustada':'{:.2f}%',
-            })
-    )
 
-    st.markdown('#### Asignación Ajustada Final')
-    st.dataframe(df_reasignacion2, hide_index=True, width=750)
-    st.caption('Tabla 4. asignación ajustada final dentro de la banda especificada.')
+        # --- ITERATIVE REBALANCE LOGIC (Bands) ---
+        st.subheader('Rebalanceo de remanente (*iteración*)')
+        st.markdown(f'''
+        Se estableció una banda de control de **{lower_limit:.0%}** (inferior) y **+{upper_limit:.0%}** (superior) para el importe asignado 2026 en relación 
+        al asignado 2025.
+        El proceso de rebalanceo es iterativo hasta que **todas** las Entidades Federativas se encuentren dentro de este rango.
+        ''')
 
+        st.success(f'Proceso de rebalanceo completado (*{current_iteration} iteraciones*).')
+
+        # Display Final Adjusted Allocation Table (Table 4)
+        df_reasignacion = df_results[['Entidad_Federativa','Asignacion_2025','Asignacion_2026','Var%','Asignacion_ajustada','Var%_ajustada']]
+        df_reasignacion = df_reasignacion.assign(**(df_reasignacion[['Var%', 'Var%_ajustada']] * 100))
+
+        with span('tabla_final'):
+            df_reasignacion2 = formatted_table(
+                df_reasignacion,
+                {
+                    'Asignacion_2025': '${:,.2f}',
+                    'Asignacion_2026': '${:,.2f}',
+                    'Var%':'{:.2f}%',
+                    'Asignacion_ajustada': '${:,.2f}',
+                    'Var%_ajustada':'{:.2f}%',
+                },
+            )
 
-    # --- VISUALIZATION ---
-    st.subheader('Comparativo de Asignaciones')
+        st.markdown('#### Asignación Ajustada Final')
+        st.dataframe(**df_reasignacion2, hide_index=True, width=750)
+        st.caption('Tabla 4. asignación ajustada final dentro de la banda especificada.')
 
-    # 1. Prepare data for the grouped chart (Unpivot/Melt)
-    df_chart = df_results[['Entidad_Federativa', 'Asignacion_2025', 'Asignacion_2026', 'Asignacion_ajustada']].copy()
 
-    df_melted = pd.melt(
-        df_chart,
-        id_vars='Entidad_Federativa',
-        value_vars=['Asignacion_2025', 'Asignacion_2026', 'Asignacion_ajustada'],
-        var_name='Tipo_Asignacion',
-        value_name='Monto'
-    )
+        # --- VISUALIZATION ---
+        st.subheader('Comparativo de Asignaciones')
 
-    # 2. Rename categories
-    df_melted['Tipo_Asignacion'] = df_melted['Tipo_Asignacion'].map({
-        'Asignacion_2025': 'Asignación 2025 (Referencia)',
-        'Asignacion_2026': 'Asignación 2026 (Inicial)',
-        'Asignacion_ajustada': 'Asignación 2026 (Final Ajustada)'
-    })
-
-    # 3. Define color map
-    color_map = {
-        'Asignación 2025 (Referencia)': '#ddc9a3',
-        'Asignación 2026 (Inicial)': '#9f2241',
-        'Asignación 2026 (Final Ajustada)': '#235b4e'
-    }
-
-    # 4. Create the grouped bar chart with Plotly Express
-    fig_final = px.bar(
-        df_melted,
-        x='Entidad_Federativa',
-        y='Monto',
-        color='Tipo_Asignacion',
-        barmode='group',
-        text='Monto',
-        title=f"Comparativo de Asignaciones de Fondos (Bandas [{lower_limit:.0%}, +{upper_limit:.0%}])",
-        template='ggplot2',
-        color_discrete_map=color_map,
-        labels={
-            'Entidad_Federativa': 'Entidad Federativa',
-            'Monto': 'Monto Asignado',
-            'Tipo_Asignacion': 'Tipo de Asignación'
-        },
-        hover_data={'Monto':':,.2f'},
-    )
+        # series de la gráfica, en el orden de sus trazas
+        series = {
+            'Asignacion_2025': 'Asignación 2025 (Referencia)',
+            'Asignacion_2026': 'Asignación 2026 (Inicial)',
+            'Asignacion_ajustada': 'Asignación 2026 (Final Ajustada)',
+        }
 
-    # 5. Configure Traces and Layout (Same as original)
-    fig_final.update_traces(
-        textposition='outside',
-        texttemplate='$%{text:,.0f}',
-        textfont_size=12,
-        opacity=0.9,
-        marker_line_color='black',
-        marker_line_width=0.5,
-    )
+        # figura completa; se arma una vez por proceso y después sólo se reemplazan los
+        # montos y el título (ver asignacion.graficas)
+        def comparativo(df_results):
+            # 1. Prepare data for the grouped chart (Unpivot/Melt)
+            df_chart = df_results[['Entidad_Federativa', *series]]
+
+            df_melted = pd.melt(
+                df_chart,
+                id_vars='Entidad_Federativa',
+                value_vars=list(series),
+                var_name='Tipo_Asignacion',
+                value_name='Monto'
+            )
 
-    fig_final.update_layout(
-        uniformtext_minsize=8,
-        uniformtext_mode='hide',
-        hovermode="x unified",
-        autosize=True,
-        height=700,
-        xaxis_title='',
-        yaxis_title='Monto asignado',
-        legend_title='Tipo de Monto',
-        legend=dict(
-            orientation="h", yanchor="bottom", y=.99, xanchor="right", x=1
-        )
-    )
+            # 2. Rename categories
+            df_melted['Tipo_Asignacion'] = df_melted['Tipo_Asignacion'].map(series)
+
+            # 3. Define color map
+            color_map = {
+                'Asignación 2025 (Referencia)': '#ddc9a3',
+                'Asignación 2026 (Inicial)': '#9f2241',
+                'Asignación 2026 (Final Ajustada)': '#235b4e'
+            }
+
+            # 4. Create the grouped bar chart with Plotly Express
+            fig_final = px.bar(
+                df_melted,
+                x='Entidad_Federativa',
+                y='Monto',
+                color='Tipo_Asignacion',
+                barmode='group',
+                title="Comparativo de Asignaciones de Fondos",
+                template='ggplot2',
+                color_discrete_map=color_map,
+                labels={
+                    'Entidad_Federativa': 'Entidad Federativa',
+                    'Monto': 'Monto Asignado',
+                    'Tipo_Asignacion': 'Tipo de Asignación'
+                },
+                hover_data={'Monto':':,.2f'},
+            )
 
-    fig_final.update_xaxes(
-        showgrid=True, tickangle=-60,
-        title_font=dict(size=16, family='Noto Sans', color='#28282b'),
-        tickfont=dict(size=14, family='Noto Sans', color='#4f4f4f'),
-    )
+            # 5. Configure Traces and Layout (Same as original)
+            fig_final.update_traces(
+                textposition='outside',
+                texttemplate='$%{y:,.0f}',
+                textfont_size=12,
+                opacity=0.9,
+                marker_line_color='black',
+                marker_line_width=0.5,
+            )
 
-    fig_final.update_yaxes(
-        tickprefix="$", tickformat=',.0f', showgrid=True,
-        title_font=dict(size=16, family='Noto Sans', color='#28282b'),
-        tickfont=dict(size=14, family='Noto Sans', color='#4f4f4f'),
-        tickangle=0,
-    )
+            fig_final.update_layout(
+                uniformtext_minsize=8,
+                uniformtext_mode='hide',
+                hovermode="x unified",
+                autosize=True,
+                height=700,
+                xaxis_title='',
+                yaxis_title='Monto asignado',
+                legend_title='Tipo de Monto',
+                legend=dict(
+                    orientation="h", yanchor="bottom", y=.99, xanchor="right", x=1
+                )
+            )
 
-    st.plotly_chart(fig_final, use_container_width=True)
+            fig_final.update_xaxes(
+                showgrid=True, tickangle=-60,
+                title_font=dict(size=16, family='Noto Sans', color='#28282b'),
+                tickfont=dict(size=14, family='Noto Sans', color='#4f4f4f'),
+            )
 
-    st.caption('''Figura 1. Comparativo de la Asignación 2025 (referencia), la Asignación 2026 Inicial (sin bandas) y
-    la Asignación 2026 Final Ajustada.''')
+            fig_final.update_yaxes(
+                tickprefix="$", tickformat=',.0f', showgrid=True,
+                title_font=dict(size=16, family='Noto Sans', color='#28282b'),
+                tickfont=dict(size=14, family='Noto Sans', color='#4f4f4f'),
+                tickangle=0,
+            )
 
-    st.markdown('''
-    ---
-    *© Dirección General de Planeación*   
-    *Elaborado por Jesús López Monroy*   
-    ''')
-    
+            return fig_final
 
-with tab3:
+        with span('figura'):
+            fig_final = cached_figure(
+                comparativo,
+                df_results,
+                [{'y': df_results[col].to_numpy()} for col in series],
+                layout={'title': {'text': f"Comparativo de Asignaciones de Fondos (Bandas [{lower_limit:.0%}, +{upper_limit:.0%}])"}},
+                key=tuple(df_results['Entidad_Federativa']),
+            )
 
-        st.header('Sábana de Datos')
-        st.markdown("""
-        En este apartado, se muestra la sábana de datos con todos las fases del cálculo de asignación de fondos,
-        incluyendo las bandas y reasignación del remanente.
-        """)
+        st.plotly_chart(fig_final, use_container_width=True)
 
-        st.dataframe(df_results, use_container_width=True)
+        st.caption('''Figura 1. Comparativo de la Asignación 2025 (referencia), la Asignación 2026 Inicial (sin bandas) y
+        la Asignación 2026 Final Ajustada.''')
 
-        st.markdown('Por otra parte, se anexa hoja de cálculo (Excel) con el procedimiento aplicado para la asignación final.')
-        
-        st.markdown("[Hoja de cálculo](https://sspcgob-my.sharepoint.com/:x:/g/personal/jesus_lopez_sspc_gob_mx/EVMYdkSmoR5FqM3VSG85RBEBCE3Lk4JFgfWOXZG2EuwS6Q?e=AOY1iJ)")
-        
         st.markdown('''
         ---
         *© Dirección General de Planeación*   
         *Elaborado por Jesús López Monroy*   
         ''')
+    
+
+if tab3.open:
+    with tab3:
+
+            st.header('Sábana de Datos')
+            st.markdown("""
+            En este apartado, se muestra la sábana de datos con todos las fases del cálculo de asignación de fondos,
+            incluyendo las bandas y reasignación del remanente.
+            """)
+
+            # la sábana (proporción y monto de cada indicador) se arma sólo con la pestaña abierta
+            st.dataframe(
+                pd.concat([
+                    calculate_index(fofisp_datos_entrada, weights, presupuesto,
+                                    variable_map=FOFISP_VARIABLES, normalize=shifted_proportion_normalize),
+                    df_results[['Asignacion_2026', 'Var%', 'Asignacion_ajustada_centavos',
+                                'Asignacion_ajustada', 'Var%_ajustada']],
+                ], axis=1),
+                use_container_width=True,
+            )
+
+            st.markdown('Por otra parte, se anexa hoja de cálculo (Excel) con el procedimiento aplicado para la asignación final: una hoja por etapa del cálculo, incluidas las iteraciones de las bandas.')
+        
+            # el libro se escribe hasta que se da clic (ver asignacion.sabana)
+            st.download_button(
+                label='Hoja de cálculo (xlsx)',
+                data=lambda: workbook_bytes('FOFISP', fofisp_datos_entrada, weights, presupuesto, lower_limit, upper_limit),
+                file_name='fofisp_sabana_de_datos.xlsx',
+                mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                on_click='ignore',
+            )
+
+            # una ficha HTML por Entidad Federativa, también hasta que se da clic (ver asignacion.reportes)
+            st.download_button(
+                label='Fichas por Entidad Federativa (zip)',
+                data=lambda: reports_zip('FOFISP', fofisp_datos_entrada, weights, presupuesto, lower_limit, upper_limit),
+                file_name='fofisp_fichas_por_entidad.zip',
+                mime='application/zip',
+                on_click='ignore',
+            )
+        
+            st.markdown('''
+            ---
+            *© Dirección General de Planeación*   
+            *Elaborado por Jesús López Monroy*   
+            ''')
+
+
+# panel y registro de la medición (sólo con ASIGNACION_MEDICION=1)
+medida.finish()
@@ -1,15 +1,26 @@
 # libraries
 import streamlit as st
-import numpy as np
-import pandas as pd
-import polars as pl
-import io
-import zipfile
-from PIL import Image
 import os
-from dotenv import load_dotenv
-load_dotenv('.env')
+import sys
+from pathlib import Path
 
+# paquete compartido 'asignacion' en la raíz del repositorio
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+# polars y el motor municipal se importan hasta que se sube el archivo; .env y logo se
+# leen una vez por proceso (ver asignacion.arranque)
+from asignacion.arranque import lazy_import, load_env, cached_logo
+pl = lazy_import('polars')
+hierarchical_allocation = lazy_import('asignacion.municipal', 'hierarchical_allocation')
+ingest_upload = lazy_import('asignacion.ingesta', 'ingest_upload')
+validacion = lazy_import('asignacion.validacion')
+centavos = lazy_import('asignacion.centavos')
+zip_download = lazy_import('asignacion.exportar', 'zip_download')
+load_env('.env')
+from asignacion.medicion import medicion, span
+
+
+# medición opcional de etapas y cachés (ASIGNACION_MEDICION=1, ver asignacion.medicion)
+medida = medicion('FORTAMUN')
 
 # --- app settings ---
 # blog home link
@@ -24,7 +35,7 @@ hide_default_format = """
     """
 
 # load icon image
-im = Image.open('images/logo.png')
+im = cached_logo('images/logo.png')
 
 # page layout config and add image
 st.set_page_config(layout="wide", page_title="FORTAMUN App", page_icon=im)
@@ -97,13 +108,30 @@ st.sidebar.markdown('''
     
 
 # widget para subir archivos
-uploaded_file = st.file_uploader("", type='xlsx')
+uploaded_file = st.file_uploader("", type=['xlsx', 'csv', 'parquet'])
 
 if uploaded_file is None:
-    st.text('Sube el archivo con las variables para la asignación del fondo en formato csv.')
+    st.text('Sube el archivo con las variables para la asignación del fondo en formato xlsx, csv o parquet.')
 else: 
     st.text('Sube el archivo con las variables para la asignación del fondo en formato xlsx.')
-    data = pl.read_excel(io.BytesIO(uploaded_file.getvalue()))
+    with span('datos'):
+        # el archivo pasa a Parquet hoja por hoja, sin copiarlo completo en memoria, y de ahí
+        # se leen sólo las columnas que usa la app (ver asignacion.ingesta)
+        barra = st.empty()
+        try:
+            ruta = ingest_upload(uploaded_file, progreso=lambda fraccion, mensaje: barra.progress(fraccion, text=mensaje))
+        except validacion.DatosInvalidos as error:
+            st.error(f'No se pudo leer el archivo: {error}')
+            st.stop()
+        barra.empty()
+        columnas = [c for c in pl.read_parquet_schema(ruta) if c in validacion.FORTAMUN_COLUMNAS]
+        data = pl.read_parquet(ruta, columns=columnas)
+    reporte = validacion.validate_fortamun(data)
+    if not reporte.ok:
+        st.error(reporte.message())
+        st.stop()
+    if reporte.avisos:
+        st.warning(reporte.message(avisos=True))
     st.success("Archivo cargado!")
     
     # data transformation
@@ -187,87 +215,148 @@ else:
         return df
 
             
-    # paso 2
-    # info widget
-    st.markdown("<h3><span style='color: #bc955c;'>Cálcula la muestra</span></h3>",
-        unsafe_allow_html=True)
-    #st.write("Selecciona un número para ajustar el `parametro` y obtener los 247 municipios requeridos.")
-    # Create a slider for the 'parameter'
-    # Adjust min_value, max_value, and value based on your data's 'dif_prom_nacl_inc_del' range
-    parameter_value = st.number_input(
-        min_value=0,
-        max_value=2_000,
-        value=int(-data2['dif_prom_nacl_inc_del'].mean()), # Default value
-        label="Selecciona un valor",
-        width=200,)
+    # pasos 2 y 3 como fragmento: mover el parámetro no vuelve a leer el Excel
+    @st.fragment
+    def muestra(data, data2):
+        # paso 2
+        # info widget
+        st.markdown("<h3><span style='color: #bc955c;'>Cálcula la muestra</span></h3>",
+            unsafe_allow_html=True)
+        #st.write("Selecciona un número para ajustar el `parametro` y obtener los 247 municipios requeridos.")
+        # Create a slider for the 'parameter'
+        # Adjust min_value, max_value, and value based on your data's 'dif_prom_nacl_inc_del' range
+        parameter_value = st.number_input(
+            min_value=0,
+            max_value=2_000,
+            value=int(-data2['dif_prom_nacl_inc_del'].mean()), # Default value
+            label="Selecciona un valor",
+            width=200,)
             
 
-    # Run the filtering function with the slider's value
-    municipios = df_247(parameter_value, data2)
-    num_municipios = municipios.shape[0]
-
-    # Display feedback based on the number of municipalities
-    if num_municipios == 247:
-        st.success(f'🎉 ¡Felicidades! La muestra contiene **{num_municipios}** municipios')
-    elif num_municipios <= 246:
-        st.info(f'El resultado contiene **{num_municipios}** municipios. Captura un número mayor en el slider para aumentar la muestra.')
-    elif num_municipios >= 248:
-        st.warning(f'El resultado contiene **{num_municipios}** municipios. Captura un número menor en el slider para reducir la muestra.')
-
-    # paso 3
-    # descargar archivo municipios
-    st.markdown("<h3><span style='color: #bc955c;'>Descarga los resultados</span></h3>",
-        unsafe_allow_html=True)
-            
-    # new dataframe results
-    # resultados listado 247 municipios
-    resultados = (
-        municipios.select(['Clave','Estado','Clave_mun','Mun','Pob'])
-        .rename({
-            'Estado':'Entidad Federativa',
-            'Mun':'Municipio',
-            'Pob':'Población',
-        })
-    )
-    # resumen
-    estados = (
-        municipios.select('Estado','Mun','Asignacion_estatal')
-            .group_by('Estado', maintain_order=True)
-                .agg(pl.col('Mun').count(),
-                    pl.col('Asignacion_estatal').first())
-    )
+        # Run the filtering function with the slider's value
+        municipios = df_247(parameter_value, data2)
+        num_municipios = municipios.shape[0]
 
-    municipios_por_estado = (
-        data.select({'Estado','Mun'})
-            .group_by('Estado', maintain_order=True).agg(pl.col('Mun').count())
-    )
+        # Display feedback based on the number of municipalities
+        if num_municipios == 247:
+            st.success(f'🎉 ¡Felicidades! La muestra contiene **{num_municipios}** municipios')
+        elif num_municipios <= 246:
+            st.info(f'El resultado contiene **{num_municipios}** municipios. Captura un número mayor en el slider para aumentar la muestra.')
+        elif num_municipios >= 248:
+            st.warning(f'El resultado contiene **{num_municipios}** municipios. Captura un número menor en el slider para reducir la muestra.')
 
-    resumen = (
-        estados.join(municipios_por_estado, on='Estado')
+        # paso 3
+        # descargar archivo municipios
+        st.markdown("<h3><span style='color: #bc955c;'>Descarga los resultados</span></h3>",
+            unsafe_allow_html=True)
+            
+        # new dataframe results
+        # resultados listado 247 municipios
+        resultados = (
+            municipios.select(['Clave','Estado','Clave_mun','Mun','Pob'])
             .rename({
                 'Estado':'Entidad Federativa',
-                'Mun':'Municipios seleccionados',
-                'Asignacion_estatal':'FORTAMUN',
-                'Mun_right':'Total de Municipios',
+                'Mun':'Municipio',
+                'Pob':'Población',
             })
-            .select(['Entidad Federativa','Total de Municipios','FORTAMUN','Municipios seleccionados'])
-    )
+        )
+        # resumen
+        estados = (
+            municipios.select('Estado','Mun','Asignacion_estatal')
+                .group_by('Estado', maintain_order=True)
+                    .agg(pl.col('Mun').count(),
+                        pl.col('Asignacion_estatal').first())
+        )
+
+        municipios_por_estado = (
+            data.select({'Estado','Mun'})
+                .group_by('Estado', maintain_order=True).agg(pl.col('Mun').count())
+        )
+
+        resumen = (
+            estados.join(municipios_por_estado, on='Estado')
+                .rename({
+                    'Estado':'Entidad Federativa',
+                    'Mun':'Municipios seleccionados',
+                    'Asignacion_estatal':'FORTAMUN',
+                    'Mun_right':'Total de Municipios',
+                })
+                .select(['Entidad Federativa','Total de Municipios','FORTAMUN','Municipios seleccionados'])
+        )
             
 
-    buf = io.BytesIO()
-    with zipfile.ZipFile(buf, "x") as csv_zip:
-        resultados_csv_string = resultados.write_csv(file=None)
-        resumen_csv_string = resumen.write_csv(file=None)
-        csv_zip.writestr("resultados.csv", resultados_csv_string.encode('latin1'))
-        csv_zip.writestr("resumen.csv", resumen_csv_string.encode('latin1'))
-
-    # download button
-    st.download_button(
-        label="Resultados.zip",
-        data=buf.getvalue(),
-        file_name="fortamun_muestra_resultados.zip",
-        mime="application/zip",
-    )
+        # el ZIP se arma hasta que alguien lo descarga; el mismo resultado sale del caché
+        # (ver asignacion.exportar)
+        formatos = st.multiselect('Formatos', ['csv', 'parquet', 'xlsx'], default=['csv'], key='formatos_fortamun', width=300)
+
+        # download button
+        st.download_button(
+            label="Resultados.zip",
+            data=zip_download({'resultados': resultados, 'resumen': resumen}, formatos),
+            file_name="fortamun_muestra_resultados.zip",
+            mime="application/zip",
+            on_click='ignore',
+        )
+
+    muestra(data, data2)
+
+    # paso 4 como fragmento: mover los pesos o las bandas sólo vuelve a correr esta sección
+    @st.fragment
+    def distribucion_municipal(data):
+        # paso 4
+        # distribución municipal: el monto de cada estado se reparte entre sus municipios
+        st.markdown("<h3><span style='color: #bc955c;'>Distribución municipal</span></h3>",
+            unsafe_allow_html=True)
+        st.write('Reparte la asignación estatal entre sus municipios con la fórmula de indicadores seleccionada.')
+
+        col_pob, col_viv, col_inc = st.columns(3)
+        w_mun_pob = col_pob.number_input('Población (Alto=Bueno)', min_value=0.0, max_value=1.0, value=1.0, step=0.01, key='w_mun_pob')
+        w_mun_viv = col_viv.number_input('Viviendas (Alto=Bueno)', min_value=0.0, max_value=1.0, value=0.0, step=0.01, key='w_mun_viv')
+        w_mun_inc = col_inc.number_input('Incidencia delictiva (Alto=Bueno)', min_value=0.0, max_value=1.0, value=0.0, step=0.01, key='w_mun_inc')
+
+        # bandas opcionales respecto a la asignación municipal publicada en gacetas
+        aplicar_bandas = st.checkbox('Aplicar bandas respecto a la asignación municipal (Gacetas estatales)')
+        col_inf, col_sup = st.columns(2)
+        banda_inferior = col_inf.number_input('Banda inferior', value=-0.1, key='Banda inferior municipal', disabled=not aplicar_bandas)
+        banda_superior = col_sup.number_input('Banda superior', value=0.1, key='Banda superior municipal', disabled=not aplicar_bandas)
+
+        municipal_weights = {
+            col: w for col, w in {'Pob': w_mun_pob, 'Viviendas': w_mun_viv, 'Incidencia_delictiva': w_mun_inc}.items() if w > 0
+        }
+
+        if not municipal_weights:
+            st.info('Asigna un peso mayor a cero a por lo menos un indicador.')
+        else:
+            try:
+                with span('distribucion'):
+                    distribucion, resumen_estatal = hierarchical_allocation(
+                        data, municipal_weights,
+                        municipal_bands=(banda_inferior, banda_superior) if aplicar_bandas else None,
+                    )
+            except centavos.BandasInfactibles as error:
+                # el monto de algún estado no cabe en las bandas de sus municipios
+                st.error(f'{error} Ajuste las bandas municipales.')
+                return
+            st.dataframe(
+                distribucion.select(['Estado','Mun','Asignacion_municipal','Asignacion_ajustada','Var%_ajustada'])
+                    .rename({
+                        'Estado':'Entidad Federativa',
+                        'Mun':'Municipio',
+                        'Asignacion_municipal':'Asignación gacetas',
+                        'Asignacion_ajustada':'Asignación calculada',
+                    }),
+                use_container_width=True,
+                column_config={
+                    'Asignación gacetas': st.column_config.NumberColumn(format='dollar'),
+                    'Asignación calculada': st.column_config.NumberColumn(format='dollar'),
+                    'Var%_ajustada': st.column_config.NumberColumn('Variación', format='percent'),
+                },
+            )
+            if aplicar_bandas:
+                st.caption(f"Rebalanceo completado en máximo {resumen_estatal['Iteraciones_municipales'].max()} iteraciones por estado.")
+
+    distribucion_municipal(data)
+
     
         
     st.markdown('''
@@ -275,3 +364,5 @@ else:
         *© Dirección General de Planeación*   
         *Elaborado por Jesús López Monroy*   
     ''')
+
+medida.finish()